@@ -0,0 +1,126 @@
+"""
+Benchmark of the Landsat QA masking and LST scaling on synthetic blocks.
+
+Compares a per-pixel loop that decodes each QA value with the vectorized
+``src.services.landsat_qa.mask_landsat_block``. Run from the repository root:
+
+	python -m benchmarks.landsat_qa --size 512
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from src.services.landsat_qa import (
+	KELVIN,
+	LST_NODATA,
+	LST_OFFSET,
+	LST_RADSAT_MASK,
+	LST_SCALE,
+	NDVI_RADSAT_MASK,
+	QA_CLEAR,
+	QA_CLOUD,
+	QA_CLOUD_SHADOW,
+	QA_FILL,
+	QA_MASK,
+	mask_landsat_block,
+)
+
+
+def synthetic_block(size: int, seed: int = 0) -> dict[str, np.ndarray]:
+	"""
+	Generates a square block of Landsat bands with clouds and saturation.
+
+	:param size: Block side in pixels
+	:type size: int
+	:param seed: Random seed
+	:type seed: int
+	:return: qa_pixel, qa_radsat, lwir and ndvi arrays
+	:rtype: dict[str, np.ndarray]
+	"""
+	rng = np.random.default_rng(seed)
+	shape = (size, size)
+
+	qa_pixel = np.full(shape, QA_CLEAR, dtype=np.uint16)
+	draw = rng.random(shape)
+	qa_pixel[draw < 0.15] = QA_CLOUD | (3 << 8)
+	qa_pixel[(draw >= 0.15) & (draw < 0.2)] = QA_CLOUD_SHADOW | (3 << 10)
+	qa_pixel[draw >= 0.99] = QA_FILL
+
+	qa_radsat = np.where(
+		rng.random(shape) < 0.01, rng.integers(1, 1 << 12, shape), 0
+	).astype(np.uint16)
+	lwir = rng.integers(40000, 50000, shape, dtype=np.uint16)
+	lwir[qa_pixel == QA_FILL] = LST_NODATA
+	ndvi = rng.uniform(-1, 1, shape).astype(np.float32)
+
+	return {"qa_pixel": qa_pixel, "qa_radsat": qa_radsat, "lwir": lwir, "ndvi": ndvi}
+
+
+def loop_mask_block(qa_pixel, qa_radsat, lwir, ndvi) -> dict[str, np.ndarray]:
+	"""
+	Reference implementation decoding one pixel at a time.
+
+	:return: Masked ``lst`` (Celsius) and ``ndvi``
+	:rtype: dict[str, np.ndarray]
+	"""
+	lst = np.full(lwir.shape, np.nan, dtype=np.float32)
+	masked_ndvi = np.full(ndvi.shape, np.nan, dtype=np.float32)
+
+	for row in range(qa_pixel.shape[0]):
+		for col in range(qa_pixel.shape[1]):
+			qa = int(qa_pixel[row, col])
+			radsat = int(qa_radsat[row, col])
+			if qa & QA_MASK:
+				continue
+			dn = int(lwir[row, col])
+			if not radsat & LST_RADSAT_MASK and dn != LST_NODATA:
+				lst[row, col] = dn * LST_SCALE + LST_OFFSET - KELVIN
+			if not radsat & NDVI_RADSAT_MASK:
+				masked_ndvi[row, col] = ndvi[row, col]
+
+	return {"lst": lst, "ndvi": masked_ndvi}
+
+
+def _best_of(fn, repeat: int) -> float:
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		timings.append(time.perf_counter() - start)
+	return min(timings)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+	parser.add_argument("--size", type=int, default=512)
+	parser.add_argument("--repeat", type=int, default=3)
+	args = parser.parse_args()
+
+	block = synthetic_block(args.size)
+	pixels = args.size**2
+	print(f"Synthetic block: {args.size}x{args.size} ({pixels} pixels)")
+
+	looped = loop_mask_block(**block)
+	vectorized = mask_landsat_block(**block)
+	for key in ("lst", "ndvi"):
+		np.testing.assert_allclose(
+			vectorized[key], looped[key], rtol=1e-5, err_msg=f"'{key}' disagrees"
+		)
+
+	loop_time = _best_of(lambda: loop_mask_block(**block), 1)
+	vector_time = _best_of(lambda: mask_landsat_block(**block), args.repeat)
+
+	def rate(seconds: float) -> str:
+		return f"{pixels / seconds / 1e6:.1f} Mpx/s" if seconds else "inf"
+
+	print(f"clear fraction:   {vectorized['clear_fraction']:.3f}")
+	print(f"per-pixel loop:   {loop_time:.3f}s ({rate(loop_time)})")
+	print(f"vectorized:       {vector_time:.4f}s ({rate(vector_time)})")
+	print(f"speedup:          {loop_time / max(vector_time, math.ulp(1)):.0f}x")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,134 @@
+"""
+Benchmark of the 'cafe' document builders on synthetic WTSS frames.
+
+Compares the previous pivot_table + groupby + to_dict path with the columnar
+builder in ``src.services.wtss_docs``. Run from the repository root:
+
+	python -m benchmarks.wtss_docs --pixels 5000 --dates 23
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.services.wtss_docs import ATTRIBUTE_FIELDS, build_point_docs
+
+
+def synthetic_frame(n_pixels: int, n_dates: int, seed: int = 0) -> pd.DataFrame:
+	"""
+	Generates a long-format frame shaped like ``coverage.ts(...).df()``.
+
+	:param n_pixels: Number of pixels
+	:type n_pixels: int
+	:param n_dates: Number of 16-day composites per pixel
+	:type n_dates: int
+	:param seed: Random seed
+	:type seed: int
+	:return: Frame with geometry, datetime, attribute and value columns
+	:rtype: pd.DataFrame
+	"""
+	rng = np.random.default_rng(seed)
+	attributes = list(ATTRIBUTE_FIELDS)
+	side = math.ceil(math.sqrt(n_pixels))
+
+	idx = np.arange(n_pixels)
+	points = shapely.points(-44.5 + (idx % side) * 1e-4, -21.0 + (idx // side) * 1e-4)
+	dates = pd.date_range("2024-01-01", periods=n_dates, freq="16D")
+
+	n = n_pixels * n_dates * len(attributes)
+	frame = pd.DataFrame(
+		{
+			"geometry": np.repeat(points, n_dates * len(attributes)),
+			"datetime": np.tile(np.repeat(dates, len(attributes)), n_pixels),
+			"attribute": np.tile(attributes, n_pixels * n_dates),
+			"value": rng.random(n),
+		}
+	)
+	# WTSS não garante ordem das linhas
+	return frame.sample(frac=1, random_state=seed, ignore_index=True)
+
+
+def legacy_point_docs(df: pd.DataFrame, geocodigo: str) -> list[dict]:
+	"""
+	Previous run_wtss path (with the ``rename(inplace=True)`` bug fixed).
+
+	``sort=False`` is needed because shapely geometries are not orderable.
+
+	:param df: Time series in long format
+	:type df: pd.DataFrame
+	:param geocodigo: Municipality code
+	:type geocodigo: str
+	:return: Documents with 'geocodigo', 'metadata' and 'timeseries'
+	:rtype: list[dict]
+	"""
+	pivoted = (
+		df.pivot_table(
+			index=["geometry", "datetime"],
+			columns="attribute",
+			values="value",
+			aggfunc="first",
+			sort=False,
+		)
+		.reset_index()
+		.rename(columns={**ATTRIBUTE_FIELDS, "datetime": "timestamp"})
+	)
+
+	return [
+		{
+			"geocodigo": geocodigo,
+			"metadata": {"type": "Point", "coordinates": list(pixel.coords[0])},
+			"timeseries": group.drop(columns=["geometry"]).to_dict(orient="records"),
+		}
+		for pixel, group in pivoted.groupby("geometry", sort=False)
+	]
+
+
+def _normalize(docs: list[dict]) -> dict:
+	return {
+		tuple(doc["metadata"]["coordinates"]): sorted(
+			(row["timestamp"], tuple(sorted(row.items(), key=str)))
+			for row in doc["timeseries"]
+		)
+		for doc in docs
+	}
+
+
+def _best_of(fn, repeat: int) -> float:
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		timings.append(time.perf_counter() - start)
+	return min(timings)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+	parser.add_argument("--pixels", type=int, default=2000)
+	parser.add_argument("--dates", type=int, default=23)
+	parser.add_argument("--repeat", type=int, default=3)
+	args = parser.parse_args()
+
+	df = synthetic_frame(args.pixels, args.dates)
+	print(
+		f"Synthetic frame: {len(df)} rows ({args.pixels} pixels x {args.dates} dates)"
+	)
+
+	legacy = legacy_point_docs(df, "0000000")
+	columnar = build_point_docs(df, "0000000")
+	assert _normalize(legacy) == _normalize(columnar), "Builders disagree"
+
+	legacy_time = _best_of(lambda: legacy_point_docs(df, "0000000"), args.repeat)
+	columnar_time = _best_of(lambda: build_point_docs(df, "0000000"), args.repeat)
+
+	print(f"pivot_table + groupby: {legacy_time:.3f}s")
+	print(f"columnar builder:      {columnar_time:.3f}s")
+	print(f"speedup:               {legacy_time / columnar_time:.1f}x")
+
+
+if __name__ == "__main__":
+	main()
@@ -46,13 +46,17 @@ class WTSSReport(MongoBaseModel):
 	status: Literal["success", "partial", "failed"]
 	summary: Dict[str, int]
 	errors: list[WTSSPolygonError]
+	chunks: Dict[str, Dict[str, Any]] = Field(
+		default_factory=dict,
+		description="Checkpoint and status by chunk of a sharded job",
+	)
 
 
 class WTSSReportOut(WTSSReport):
 	id: str = Field(..., alias="_id")
 
 
-WTSSPayload = Union[WTSSCronPayload, WTSSApiPayload]
+WTSSPayload = Union[WTSSCronPayload, WTSSApiPayload, WTSSAdminPayload]
 
 wtss_adapter = TypeAdapter(WTSSPayload)
 
@@ -1,6 +1,8 @@
-from typing import Any, List
+from datetime import date, datetime
+from os import getenv as env
+from typing import Any, Dict, List, Literal
 
-from pydantic import ConfigDict, Field
+from pydantic import ConfigDict, Field, model_validator
 
 from src.models.base_model import CustomBaseModel
 
@@ -31,12 +33,69 @@ class PointTimeSeries(CustomBaseModel):
 	timeseries: List[dict[str, Any]]
 
 
-class PointTimeSeriesFetch(CustomBaseModel):
+TimeSeriesAttribute = Literal["ndvi", "evi", "green", "red", "nir"]
+MAX_BATCH_POINTS = int(env("COFFEE_MAX_BATCH_POINTS", "100"))
+
+
+class DateRange(CustomBaseModel):
+	"""Optional composite date range of a time series query."""
+
+	start: date | None = Field(None, description="First composite date (inclusive)")
+	end: date | None = Field(None, description="Last composite date (inclusive)")
+
+	@model_validator(mode="after")
+	def check_range(self):
+		"""Rejects a date range that ends before it starts."""
+		if self.start and self.end and self.start > self.end:
+			raise ValueError("start must not be after end")
+		return self
+
+
+class TimeSeriesOptions(DateRange):
+	"""Geo query distance and time series slicing shared by point queries."""
+
+	max_distance: int = 10
+	attributes: List[TimeSeriesAttribute] | None = Field(
+		None, description="Attributes to return (default: all)"
+	)
+
+
+class PointTimeSeriesFetch(TimeSeriesOptions):
 	"""Point time series input data model."""
 
 	lat: float
 	lng: float
-	max_distance: int = 10
+
+
+class PointCoordinate(CustomBaseModel):
+	"""A point of a batch query."""
+
+	lat: float
+	lng: float
+	id: str | None = Field(None, description="Result key (default: list index)")
+
+
+class PointsTimeSeriesFetch(TimeSeriesOptions):
+	"""Batch point time series input data model."""
+
+	points: List[PointCoordinate] = Field(
+		..., min_length=1, max_length=MAX_BATCH_POINTS
+	)
+
+	@model_validator(mode="after")
+	def check_keys(self):
+		"""Rejects repeated result keys."""
+		keys = self.keys()
+		if len(set(keys)) != len(keys):
+			raise ValueError("point ids must be unique")
+		return self
+
+	def keys(self) -> List[str]:
+		"""Result key of each point: its id, or its index in the list."""
+		return [
+			point.id if point.id is not None else str(i)
+			for i, point in enumerate(self.points)
+		]
 
 
 class PointTimeSeriesOut(PointTimeSeries):
@@ -47,3 +106,111 @@ class PointTimeSeriesOut(PointTimeSeries):
 	model_config = ConfigDict(
 		arbitrary_types_allowed=True,
 	)
+
+
+class PointsTimeSeriesOut(CustomBaseModel):
+	"""Batch point time series output data model."""
+
+	results: Dict[str, PointTimeSeriesOut]
+	missing: List[str]
+
+
+class AreaStatsFetch(DateRange):
+	"""Area aggregate input data model: a GeoJSON polygon or a bbox."""
+
+	geometry: Dict[str, Any] | None = Field(
+		None, description="GeoJSON Polygon or MultiPolygon"
+	)
+	bbox: List[float] | None = Field(
+		None,
+		min_length=4,
+		max_length=4,
+		description="[min lng, min lat, max lng, max lat]",
+	)
+	attribute: TimeSeriesAttribute = "ndvi"
+	background: bool = Field(False, description="Run as a background task")
+
+	@model_validator(mode="after")
+	def check_area(self):
+		"""Requires exactly one valid area: a polygon geometry or a bbox."""
+		if (self.geometry is None) == (self.bbox is None):
+			raise ValueError("exactly one of geometry or bbox is required")
+		if self.geometry is not None and self.geometry.get("type") not in (
+			"Polygon",
+			"MultiPolygon",
+		):
+			raise ValueError("geometry must be a GeoJSON Polygon or MultiPolygon")
+		if self.bbox is not None:
+			min_lng, min_lat, max_lng, max_lat = self.bbox
+			if min_lng >= max_lng or min_lat >= max_lat:
+				raise ValueError("bbox must be [min lng, min lat, max lng, max lat]")
+		return self
+
+	def area(self) -> dict[str, Any]:
+		"""GeoJSON geometry of the area (the bbox as a Polygon)."""
+		if self.geometry is not None:
+			return self.geometry
+
+		min_lng, min_lat, max_lng, max_lat = self.bbox
+		return {
+			"type": "Polygon",
+			"coordinates": [
+				[
+					[min_lng, min_lat],
+					[max_lng, min_lat],
+					[max_lng, max_lat],
+					[min_lng, max_lat],
+					[min_lng, min_lat],
+				]
+			],
+		}
+
+
+class AreaTimestampStats(CustomBaseModel):
+	"""Statistics of an attribute over the pixels of an area at one timestamp."""
+
+	timestamp: datetime
+	count: int
+	mean: float
+	median: float
+	p10: float
+	p90: float
+
+
+class AreaStatsOut(CustomBaseModel):
+	"""Area aggregate output data model."""
+
+	attribute: str
+	pixels: int
+	stats: List[AreaTimestampStats]
+
+
+class AreaStatsTaskOut(CustomBaseModel):
+	"""State of a background area aggregate."""
+
+	task_id: str
+	status: str
+	result: AreaStatsOut | None = None
+	error: str | None = None
+
+
+class AttributeStats(CustomBaseModel):
+	"""Statistics of an attribute over the pixels of a municipality."""
+
+	count: int
+	mean: float | None = None
+	min: float | None = None
+	max: float | None = None
+	p10: float | None = None
+	median: float | None = None
+	p90: float | None = None
+
+
+class MunicipalityRollupOut(CustomBaseModel):
+	"""Rollup of a municipality at one composite date, from 'cafe_rollups'."""
+
+	geocodigo: str
+	timestamp: datetime
+	pixels: int
+	ndvi: AttributeStats
+	evi: AttributeStats
@@ -1,14 +1,376 @@
-from typing import Any, List
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from os import getenv as env
+from typing import Any, Iterable, List, Literal
 
 from pymongo import UpdateOne
 from pymongo.asynchronous.database import AsyncDatabase
 from pymongo.database import Database
 
 from src.utils.app_error import AppError
+from src.utils.date_now import get_utc_now
 
 COFFEE = "cafe"
+COFFEE_BUCKETS = "cafe_buckets"
 COFFEE_YIELD = "producao"
 REPORTS = "pipeline_reports"
+WATERMARKS = "wtss_watermarks"
+ROLLUPS = "cafe_rollups"
+
+# Atributos agregados por município e data nos rollups
+ROLLUP_ATTRIBUTES = ("ndvi", "evi")
+
+# "document": um documento por pixel em 'cafe'
+# "bucket": um documento por pixel e ano em 'cafe_buckets'
+STORAGE: Literal["document", "bucket"] = env("COFFEE_STORAGE", "document")
+# Primeiro ano das séries (S2-16D-2), para consultas sem data inicial
+FIRST_YEAR = int(env("COFFEE_FIRST_YEAR", "2017"))
+
+
+def near_query(lng: float, lat: float, max_distance: int) -> dict[str, Any]:
+	"""
+	Builds a $near query on the 'metadata' point of a time series collection.
+
+	:param lng: Longitude for the geo query.
+	:param lat: Latitude for the geo query.
+	:param max_distance: Maximum distance for the geo query.
+	:return: The query document.
+	:rtype: dict[str, Any]
+	"""
+	# This query assumes a 2dsphere index on the 'metadata' field
+	return {
+		"metadata": {
+			"$near": {
+				"$geometry": {
+					"type": "Point",
+					"coordinates": [lng, lat],
+				},
+				"$maxDistance": max_distance,
+			},
+		},
+	}
+
+
+def pixel_key(coordinates: List[float]) -> dict[str, float]:
+	"""
+	Builds the scalar key of a pixel in 'cafe_buckets'.
+
+	The coordinates array would make any index on it multikey, enforcing
+	uniqueness per longitude and per latitude instead of per pixel, so buckets
+	are keyed by an embedded document, indexed as a single value.
+
+	:param coordinates: The pixel coordinates ([lng, lat]).
+	:return: The pixel key.
+	:rtype: dict[str, float]
+	"""
+	lng, lat = coordinates
+	return {"lng": lng, "lat": lat}
+
+
+# Mesma chave de pixel_key, calculada no servidor a partir de 'metadata'
+PIXEL_KEY = {
+	"lng": {"$arrayElemAt": ["$metadata.coordinates", 0]},
+	"lat": {"$arrayElemAt": ["$metadata.coordinates", 1]},
+}
+
+
+def bucket_query(
+	coordinates: List[float],
+	start_year: int | None = None,
+	end_year: int | None = None,
+) -> dict[str, Any]:
+	"""
+	Builds the query that selects the yearly buckets of a pixel.
+
+	:param coordinates: The pixel coordinates.
+	:param start_year: First year needed, if bounded.
+	:param end_year: Last year needed, if bounded.
+	:return: The query document.
+	:rtype: dict[str, Any]
+	"""
+	query: dict[str, Any] = {"pixel": pixel_key(coordinates)}
+	years = {}
+	if start_year is not None:
+		years["$gte"] = start_year
+	if end_year is not None:
+		years["$lte"] = end_year
+	if years:
+		query["year"] = years
+	return query
+
+
+def timeseries_projection(
+	start: date | None = None,
+	end: date | None = None,
+	attributes: List[str] | None = None,
+) -> dict[str, Any] | None:
+	"""
+	Builds a projection that slices 'timeseries' on the server.
+
+	Points outside [start, end] are removed with $filter and, with an attribute
+	subset, each point keeps only its timestamp and those attributes.
+
+	:param start: First composite date (inclusive), if bounded.
+	:param end: Last composite date (inclusive), if bounded.
+	:param attributes: Attributes to keep, or None for all.
+	:return: The projection document, or None when nothing is sliced.
+	:rtype: dict[str, Any] | None
+	"""
+	if start is None and end is None and not attributes:
+		return None
+
+	series: Any = {"$ifNull": ["$timeseries", []]}
+
+	conditions = []
+	if start is not None:
+		since = datetime.combine(start, datetime.min.time())
+		conditions.append({"$gte": ["$$point.timestamp", since]})
+	if end is not None:
+		until = datetime.combine(end + timedelta(days=1), datetime.min.time())
+		conditions.append({"$lt": ["$$point.timestamp", until]})
+	if conditions:
+		series = {
+			"$filter": {
+				"input": series,
+				"as": "point",
+				"cond": {"$and": conditions},
+			}
+		}
+
+	if attributes:
+		fields = ["timestamp", *attributes]
+		series = {
+			"$map": {
+				"input": series,
+				"as": "point",
+				"in": {field: f"$$point.{field}" for field in fields},
+			}
+		}
+
+	return {"geocodigo": 1, "metadata": 1, "timeseries": series}
+
+
+def assemble_buckets(buckets: List[dict[str, Any]]) -> dict[str, Any] | None:
+	"""
+	Reassembles yearly buckets (sorted by year) into a single pixel document.
+
+	:param buckets: The buckets of a single pixel, sorted by year.
+	:return: A document shaped like the 'cafe' documents, or None.
+	:rtype: dict[str, Any] | None
+	"""
+	if not buckets:
+		return None
+
+	first = buckets[0]
+	return {
+		"_id": first["_id"],
+		"geocodigo": first.get("geocodigo"),
+		"metadata": first["metadata"],
+		"timeseries": [point for bucket in buckets for point in bucket["timeseries"]],
+	}
+
+
+def area_stats_pipeline(
+	geometry: dict[str, Any],
+	attribute: str,
+	max_pixels: int,
+	start: date | None = None,
+	end: date | None = None,
+) -> tuple[str, List[dict[str, Any]]]:
+	"""
+	Builds the aggregation of an attribute per timestamp inside an area.
+
+	The pipeline returns one document with the number of distinct pixels
+	scanned ('pixels'), whether the scan hit its document limit ('truncated')
+	and the statistics of each timestamp ('stats'), so callers can tell when
+	the cap was exceeded. With the document storage at most ``max_pixels + 1``
+	documents are scanned. With the bucket storage documents are pixel-years,
+	so the limit is scaled by the number of years of the date range (from
+	``COFFEE_FIRST_YEAR`` to the current year when unbounded) and pixels are
+	counted by coordinates. Percentiles use ``$percentile`` (MongoDB 7.0+).
+
+	:param geometry: The GeoJSON Polygon or MultiPolygon of the area.
+	:param attribute: The time series attribute (e.g. "ndvi").
+	:param max_pixels: The maximum number of pixels to aggregate.
+	:param start: First composite date (inclusive), if bounded.
+	:param end: Last composite date (inclusive), if bounded.
+	:return: The collection name and the pipeline.
+	:rtype: tuple[str, List[dict[str, Any]]]
+	"""
+	match: dict[str, Any] = {"metadata": {"$geoWithin": {"$geometry": geometry}}}
+	collection = COFFEE
+	limit = max_pixels + 1
+	pixels: List[dict[str, Any]] = [{"$count": "count"}]
+
+	if STORAGE == "bucket":
+		collection = COFFEE_BUCKETS
+		years = {}
+		if start is not None:
+			years["$gte"] = start.year
+		if end is not None:
+			years["$lte"] = end.year
+		if years:
+			match["year"] = years
+
+		# Um documento por pixel e ano: o limite cobre todos os anos do intervalo
+		first_year = start.year if start is not None else FIRST_YEAR
+		last_year = end.year if end is not None else date.today().year
+		limit *= max(1, last_year - first_year + 1)
+		pixels = [{"$group": {"_id": "$pixel"}}, {"$count": "count"}]
+
+	series = timeseries_projection(start, end, [attribute])["timeseries"]
+	value = f"$timeseries.{attribute}"
+
+	pipeline = [
+		{"$match": match},
+		{"$limit": limit},
+		{
+			"$project": {
+				"_id": 0,
+				"pixel": 1,
+				"timeseries": series,
+			}
+		},
+		{
+			"$facet": {
+				"documents": [{"$count": "count"}],
+				"pixels": pixels,
+				"stats": [
+					{"$unwind": "$timeseries"},
+					{"$match": {f"timeseries.{attribute}": {"$type": "number"}}},
+					{
+						"$group": {
+							"_id": "$timeseries.timestamp",
+							"count": {"$sum": 1},
+							"mean": {"$avg": value},
+							"percentiles": {
+								"$percentile": {
+									"input": value,
+									"p": [0.1, 0.5, 0.9],
+									"method": "approximate",
+								}
+							},
+						}
+					},
+					{"$sort": {"_id": 1}},
+					{
+						"$project": {
+							"_id": 0,
+							"timestamp": "$_id",
+							"count": 1,
+							"mean": 1,
+							"p10": {"$arrayElemAt": ["$percentiles", 0]},
+							"median": {"$arrayElemAt": ["$percentiles", 1]},
+							"p90": {"$arrayElemAt": ["$percentiles", 2]},
+						}
+					},
+				],
+			}
+		},
+		{
+			"$project": {
+				"pixels": {"$ifNull": [{"$first": "$pixels.count"}, 0]},
+				"truncated": {
+					"$gte": [{"$ifNull": [{"$first": "$documents.count"}, 0]}, limit]
+				},
+				"stats": 1,
+			}
+		},
+	]
+	return collection, pipeline
+
+
+def rollup_pipeline(
+	geocodigos: List[str],
+	timestamps: Iterable[datetime] | None = None,
+) -> tuple[str, List[dict[str, Any]]]:
+	"""
+	Builds the aggregation that recomputes municipality rollups into 'cafe_rollups'.
+
+	Every pixel of the given municipalities is aggregated per timestamp and the
+	results are merged on (geocodigo, timestamp), so recomputing a rollup is
+	idempotent. With ``timestamps`` only those composites are recomputed.
+
+	:param geocodigos: The municipalities to recompute.
+	:param timestamps: The composites to recompute, or None for all.
+	:return: The source collection name and the pipeline.
+	:rtype: tuple[str, List[dict[str, Any]]]
+	"""
+	match: dict[str, Any] = {"geocodigo": {"$in": geocodigos}}
+	series: Any = {"$ifNull": ["$timeseries", []]}
+	collection = COFFEE
+
+	if timestamps is not None:
+		timestamps = sorted(set(timestamps))
+		series = {
+			"$filter": {
+				"input": series,
+				"as": "point",
+				"cond": {"$in": ["$$point.timestamp", timestamps]},
+			}
+		}
+		if STORAGE == "bucket":
+			match["year"] = {"$in": sorted({t.year for t in timestamps})}
+
+	if STORAGE == "bucket":
+		collection = COFFEE_BUCKETS
+
+	group: dict[str, Any] = {
+		"_id": {"geocodigo": "$geocodigo", "timestamp": "$timeseries.timestamp"},
+		"pixels": {"$sum": 1},
+	}
+	stats = {}
+	for attribute in ROLLUP_ATTRIBUTES:
+		value = f"$timeseries.{attribute}"
+		group |= {
+			f"{attribute}_count": {"$sum": {"$cond": [{"$isNumber": value}, 1, 0]}},
+			f"{attribute}_mean": {"$avg": value},
+			f"{attribute}_min": {"$min": value},
+			f"{attribute}_max": {"$max": value},
+			f"{attribute}_percentiles": {
+				"$percentile": {
+					"input": value,
+					"p": [0.1, 0.5, 0.9],
+					"method": "approximate",
+				}
+			},
+		}
+		percentiles = f"${attribute}_percentiles"
+		stats[attribute] = {
+			"count": f"${attribute}_count",
+			"mean": f"${attribute}_mean",
+			"min": f"${attribute}_min",
+			"max": f"${attribute}_max",
+			"p10": {"$arrayElemAt": [percentiles, 0]},
+			"median": {"$arrayElemAt": [percentiles, 1]},
+			"p90": {"$arrayElemAt": [percentiles, 2]},
+		}
+
+	pipeline = [
+		{"$match": match},
+		{"$project": {"_id": 0, "geocodigo": 1, "timeseries": series}},
+		{"$unwind": "$timeseries"},
+		{"$group": group},
+		{
+			"$project": {
+				"_id": 0,
+				"geocodigo": "$_id.geocodigo",
+				"timestamp": "$_id.timestamp",
+				"pixels": 1,
+				**stats,
+				"updated_at": "$$NOW",
+			}
+		},
+		{
+			"$merge": {
+				"into": ROLLUPS,
+				"on": ["geocodigo", "timestamp"],
+				"whenMatched": "merge",
+				"whenNotMatched": "insert",
+			}
+		},
+	]
+	return collection, pipeline
 
 
 # ===== Asynchronous Functions  =====
@@ -25,44 +387,135 @@ async def get_all_coffee_yield(db: AsyncDatabase) -> List[dict[str, Any]]:
 
 
 async def get_point_time_series(
-	db: AsyncDatabase, lng: float, lat: float, max_distance: int
+	db: AsyncDatabase,
+	lng: float,
+	lat: float,
+	max_distance: int,
+	start: date | None = None,
+	end: date | None = None,
+	attributes: List[str] | None = None,
 ) -> dict[str, Any]:
 	"""
-	Fetches a single document from the 'cafe' collection based on a geo query.
+	Fetches the time series of the nearest pixel based on a geo query.
+
+	With the bucket storage only the yearly buckets of that pixel are read and
+	reassembled into a single document. A date range or attribute subset is
+	applied by the server (see ``timeseries_projection``), so only the requested
+	points and fields are transferred.
 
 	:param db: The database connection.
 	:param lng: Longitude for the geo query.
 	:param lat: Latitude for the geo query.
 	:param max_distance: Maximum distance for the geo query.
+	:param start: First composite date (inclusive), if bounded.
+	:param end: Last composite date (inclusive), if bounded.
+	:param attributes: Attributes to return, or None for all.
 	:return: A document if found.
 	:rtype: dict[str, Any]
 	:raises AppError: If no document is found.
 	"""
-	# This query assumes a 2dsphere index on the 'metadata' field
-	query = {
-		"metadata": {
-			"$near": {
-				"$geometry": {
-					"type": "Point",
-					"coordinates": [lng, lat],
-				},
-				"$maxDistance": max_distance,
-			},
-		},
-	}
-	doc = await db.get_collection(COFFEE).find_one(query)
+	query = near_query(lng, lat, max_distance)
+	projection = timeseries_projection(start, end, attributes)
+
+	if STORAGE == "bucket":
+		collection = db.get_collection(COFFEE_BUCKETS)
+		nearest = await collection.find_one(query, {"geocodigo": 1, "metadata": 1})
+		buckets = (
+			await collection.find(
+				bucket_query(
+					nearest["metadata"]["coordinates"],
+					start.year if start else None,
+					end.year if end else None,
+				),
+				projection,
+			)
+			.sort("year", 1)
+			.to_list()
+			if nearest
+			else []
+		)
+		# Pixel sem anos no intervalo: série vazia, como no armazenamento por documento
+		doc = assemble_buckets(buckets) or (
+			{**nearest, "timeseries": []} if nearest else None
+		)
+	else:
+		doc = await db.get_collection(COFFEE).find_one(query, projection)
 
 	if not doc:
-		raise AppError(status_code=404, detail="No data found for the given location")
+		raise AppError(status_code=404, message="No data found for the given location")
 	return doc
 
 
+async def get_area_stats(
+	db: AsyncDatabase,
+	geometry: dict[str, Any],
+	attribute: str,
+	max_pixels: int,
+	start: date | None = None,
+	end: date | None = None,
+) -> dict[str, Any]:
+	"""
+	Aggregates an attribute per timestamp over the pixels inside an area.
+
+	:param db: The database connection.
+	:param geometry: The GeoJSON Polygon or MultiPolygon of the area.
+	:param attribute: The time series attribute (e.g. "ndvi").
+	:param max_pixels: The maximum number of pixels to aggregate.
+	:param start: First composite date (inclusive), if bounded.
+	:param end: Last composite date (inclusive), if bounded.
+	:return: The pixels scanned, whether the scan was truncated and the
+			 statistics per timestamp.
+	:rtype: dict[str, Any]
+	"""
+	collection, pipeline = area_stats_pipeline(
+		geometry, attribute, max_pixels, start, end
+	)
+	cursor = await db.get_collection(collection).aggregate(pipeline)
+	docs = await cursor.to_list()
+	return docs[0] if docs else {"pixels": 0, "truncated": False, "stats": []}
+
+
+async def get_rollups(
+	db: AsyncDatabase,
+	geocodigo: str,
+	start: date | None = None,
+	end: date | None = None,
+) -> List[dict[str, Any]]:
+	"""
+	Fetches the rollups of a municipality from 'cafe_rollups', by timestamp.
+
+	:param db: The database connection.
+	:param geocodigo: The municipality code.
+	:param start: First composite date (inclusive), if bounded.
+	:param end: Last composite date (inclusive), if bounded.
+	:return: The rollup documents sorted by timestamp.
+	:rtype: List[dict[str, Any]]
+	"""
+	query: dict[str, Any] = {"geocodigo": geocodigo}
+	timestamps = {}
+	if start is not None:
+		timestamps["$gte"] = datetime.combine(start, datetime.min.time())
+	if end is not None:
+		timestamps["$lt"] = datetime.combine(
+			end + timedelta(days=1), datetime.min.time()
+		)
+	if timestamps:
+		query["timestamp"] = timestamps
+
+	return (
+		await db.get_collection(ROLLUPS)
+		.find(query, {"_id": 0})
+		.sort("timestamp", 1)
+		.to_list()
+	)
+
+
 # ===== Synchronous Functions  =====
 def get_point(
 	db: Database, lng: float, lat: float, max_distance: int
 ) -> dict[str, Any]:
 	"""
-	Fetches a single document from the 'cafe' collection based on a geo query.
+	Fetches the time series of the nearest pixel based on a geo query.
 
 	:param db: The database connection.
 	:param lng: Longitude for the geo query.
@@ -72,22 +525,26 @@ def get_point(
 	:rtype: dict[str, Any]
 	:raises AppError: If no document is found.
 	"""
-	# This query assumes a 2dsphere index on the 'metadata' field
-	query = {
-		"metadata": {
-			"$near": {
-				"$geometry": {
-					"type": "Point",
-					"coordinates": [lng, lat],
-				},
-				"$maxDistance": max_distance,
-			},
-		},
-	}
-	doc = db.get_collection(COFFEE).find_one(query)
+	query = near_query(lng, lat, max_distance)
+
+	if STORAGE == "bucket":
+		collection = db.get_collection(COFFEE_BUCKETS)
+		nearest = collection.find_one(query, {"metadata": 1})
+		buckets = (
+			list(
+				collection.find(bucket_query(nearest["metadata"]["coordinates"])).sort(
+					"year", 1
+				)
+			)
+			if nearest
+			else []
+		)
+		doc = assemble_buckets(buckets)
+	else:
+		doc = db.get_collection(COFFEE).find_one(query)
 
 	if not doc:
-		raise AppError(status_code=404, detail="No data found for the given location")
+		raise AppError(status_code=404, message="No data found for the given location")
 
 	return doc
 
@@ -95,34 +552,219 @@ def get_point(
 def update_points_time_series(
 	db: Database,
 	docs: List[dict[str, Any]],
+	strategy: Literal["merge", "push"] = "merge",
+	ordered: bool = True,
 ):
 	"""
-	Updates documents in the 'cafe' collection by adding new time series data.
+	Updates the stored time series of each pixel with new time series data.
+
+	With the document storage, pixels missing from 'cafe' are skipped. With the
+	bucket storage, points are split by year and the buckets are upserted.
 
-	If a document does not exist, it will be skipped.
+	With the default "merge" strategy the update is idempotent: existing points
+	with the same timestamp are replaced and the series is kept sorted, so
+	retries and overlapping windows do not duplicate data. "push" appends the
+	points as they are.
 
 	:param db: The database connection.
 	:param docs: A list of documents. Each document must contain
 				 'metadata.coordinates' for identification and a 'timeseries'
 				 list to be appended.
+	:param strategy: "merge" (keyed on timestamp) or "push".
+	:param ordered: Whether the bulk write stops at the first error.
 	:return: The result of the bulk write operation.
 	:rtype: BulkWriteResult | None
 	"""
 	if not docs:
 		return
 
+	if STORAGE == "bucket":
+		operations = list(bucket_operations(docs, strategy))
+		return db.get_collection(COFFEE_BUCKETS).bulk_write(operations, ordered=ordered)
+
 	operations = [
 		UpdateOne(
 			{"metadata.coordinates": doc["metadata"]["coordinates"]},
-			{"$push": {"timeseries": {"$each": doc["timeseries"]}}},
+			timeseries_update(doc["timeseries"], strategy),
 		)
 		for doc in docs
 	]
 
-	result = db.get_collection(COFFEE).bulk_write(operations)
+	result = db.get_collection(COFFEE).bulk_write(operations, ordered=ordered)
 	return result
 
 
+def bucket_operations(
+	docs: Iterable[dict[str, Any]],
+	strategy: Literal["merge", "push"] = "merge",
+) -> Iterable[UpdateOne]:
+	"""
+	Splits pixel documents into upserts of their yearly buckets.
+
+	:param docs: Pixel documents with 'geocodigo', 'metadata' and 'timeseries'.
+	:param strategy: "merge" (keyed on timestamp) or "push".
+	:return: The bucket update operations.
+	:rtype: Iterable[UpdateOne]
+	"""
+	for doc in docs:
+		by_year = defaultdict(list)
+		for point in doc["timeseries"]:
+			by_year[point["timestamp"].year].append(point)
+
+		pixel = {"geocodigo": doc.get("geocodigo"), "metadata": doc["metadata"]}
+		for year, points in sorted(by_year.items()):
+			yield UpdateOne(
+				bucket_query(doc["metadata"]["coordinates"]) | {"year": year},
+				timeseries_update(points, strategy, pixel),
+				upsert=True,
+			)
+
+
+def timeseries_update(
+	points: List[dict[str, Any]],
+	strategy: Literal["merge", "push"] = "merge",
+	on_insert: dict[str, Any] | None = None,
+) -> dict[str, Any] | List[dict[str, Any]]:
+	"""
+	Builds the update that adds points to the 'timeseries' of a document.
+
+	:param points: New time series points.
+	:param strategy: "merge" (keyed on timestamp) or "push".
+	:param on_insert: Fields written when the update creates the document
+					  (or when they are missing from it).
+	:return: An update document or pipeline.
+	:rtype: dict[str, Any] | List[dict[str, Any]]
+	"""
+	if strategy == "push":
+		update = {"$push": {"timeseries": {"$each": points}}}
+		if on_insert:
+			update["$setOnInsert"] = on_insert
+		return update
+
+	pipeline = merge_timeseries_pipeline(points)
+	if on_insert:
+		# Pipelines não aceitam $setOnInsert: só preenche campos ainda ausentes
+		fields = {
+			key: {"$ifNull": [f"${key}", {"$literal": value}]}
+			for key, value in on_insert.items()
+		}
+		pipeline.insert(0, {"$set": fields})
+	return pipeline
+
+
+def merge_timeseries_pipeline(points: List[dict[str, Any]]) -> List[dict[str, Any]]:
+	"""
+	Builds an update pipeline that merges points into 'timeseries' by timestamp.
+
+	Stored points whose timestamp is present in ``points`` are dropped, the new
+	points are appended and the result is sorted by timestamp. Repeated
+	timestamps in ``points`` keep only their last point, so the series stays
+	unique in both storages (documents and buckets).
+
+	:param points: New time series points.
+	:return: An aggregation pipeline usable as an update.
+	:rtype: List[dict[str, Any]]
+	"""
+	points = list({point["timestamp"]: point for point in points}.values())
+	timestamps = [point["timestamp"] for point in points]
+	kept = {
+		"$filter": {
+			"input": {"$ifNull": ["$timeseries", []]},
+			"as": "point",
+			"cond": {"$not": [{"$in": ["$$point.timestamp", timestamps]}]},
+		}
+	}
+
+	return [
+		{
+			"$set": {
+				"timeseries": {
+					"$sortArray": {
+						"input": {"$concatArrays": [kept, {"$literal": points}]},
+						"sortBy": {"timestamp": 1},
+					}
+				}
+			}
+		}
+	]
+
+
+# Mantém um ponto por timestamp, com a série ordenada
+DEDUPED_TIMESERIES = {
+	"$reduce": {
+		"input": {
+			"$sortArray": {
+				"input": {"$ifNull": ["$timeseries", []]},
+				"sortBy": {"timestamp": 1},
+			}
+		},
+		"initialValue": [],
+		"in": {
+			"$cond": [
+				{
+					"$eq": [
+						{
+							"$getField": {
+								"field": "timestamp",
+								"input": {"$last": "$$value"},
+							}
+						},
+						"$$this.timestamp",
+					]
+				},
+				"$$value",
+				{"$concatArrays": ["$$value", ["$$this"]]},
+			]
+		},
+	}
+}
+
+HAS_DUPLICATED_TIMESTAMPS = {
+	"$expr": {
+		"$ne": [
+			{"$size": {"$ifNull": ["$timeseries", []]}},
+			{"$size": {"$setUnion": [{"$ifNull": ["$timeseries.timestamp", []]}]}},
+		]
+	}
+}
+
+
+def compact_points_time_series_batch(
+	db: Database,
+	after_id: Any | None,
+	batch_size: int,
+	collection_name: str = COFFEE,
+) -> tuple[Any | None, int, int]:
+	"""
+	Deduplicates the time series of the next batch of 'cafe' (or bucket) documents.
+
+	Batches are read in '_id' order and only documents with repeated timestamps
+	are rewritten, so each call is a short write that does not block readers.
+
+	:param db: The database connection.
+	:param after_id: The last '_id' of the previous batch, or None to start.
+	:param batch_size: The number of documents scanned per batch.
+	:param collection_name: 'cafe' or 'cafe_buckets'.
+	:return: The last '_id' scanned (None when done), scanned and modified counts.
+	:rtype: tuple[Any | None, int, int]
+	"""
+	collection = db.get_collection(collection_name)
+	query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+	ids = [
+		doc["_id"]
+		for doc in collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)
+	]
+
+	if not ids:
+		return None, 0, 0
+
+	result = collection.update_many(
+		{"_id": {"$in": ids}, **HAS_DUPLICATED_TIMESTAMPS},
+		[{"$set": {"timeseries": DEDUPED_TIMESERIES}}],
+	)
+	return ids[-1], len(ids), result.modified_count
+
+
 def get_wtss_report(
 	db: Database,
 	job: str,
@@ -185,3 +827,183 @@ def update_wtss_report(
 		job_key,
 		update_fields,
 	)
+
+
+def get_wtss_watermarks(db: Database, coverage: str) -> dict[str, datetime]:
+	"""
+	Retrieves the latest stored composite date of every polygon of a coverage.
+
+	:param db: The database connection.
+	:param coverage: The coverage name.
+	:return: A mapping of polygon key to the latest stored composite datetime.
+	:rtype: dict[str, datetime]
+	"""
+	cursor = db.get_collection(WATERMARKS).find(
+		{"coverage": coverage},
+		{"_id": 0, "polygon_key": 1, "last_timestamp": 1},
+	)
+	return {doc["polygon_key"]: doc["last_timestamp"] for doc in cursor}
+
+
+def update_wtss_watermarks(
+	db: Database,
+	coverage: str,
+	watermarks: List[tuple[str, str, datetime]],
+):
+	"""
+	Advances the high-water marks of polygons in the 'wtss_watermarks' collection.
+
+	Watermarks never move backwards, so re-running older windows is safe.
+
+	:param db: The database connection.
+	:param coverage: The coverage name.
+	:param watermarks: (polygon key, geocodigo, latest stored composite datetime)
+					   of each polygon.
+	"""
+	if not watermarks:
+		return
+
+	operations = [
+		UpdateOne(
+			{"coverage": coverage, "polygon_key": polygon_key},
+			{
+				"$max": {"last_timestamp": last_timestamp},
+				"$set": {"geocodigo": geocodigo, "updated_at": get_utc_now()},
+			},
+			upsert=True,
+		)
+		for polygon_key, geocodigo, last_timestamp in watermarks
+	]
+	db.get_collection(WATERMARKS).bulk_write(operations, ordered=False)
+
+
+def ensure_bucket_indexes(db: Database):
+	"""
+	Creates the indexes used by the bucket storage in 'cafe_buckets'.
+
+	Buckets written before the scalar pixel key get it first, and the former
+	multikey unique index on the coordinates is dropped.
+
+	:param db: The database connection.
+	"""
+	collection = db.get_collection(COFFEE_BUCKETS)
+	collection.update_many(
+		{"pixel": {"$exists": False}}, [{"$set": {"pixel": PIXEL_KEY}}]
+	)
+	if "metadata.coordinates_1_year_1" in collection.index_information():
+		collection.drop_index("metadata.coordinates_1_year_1")
+
+	collection.create_index([("metadata", "2dsphere")])
+	collection.create_index([("pixel", 1), ("year", 1)], unique=True)
+
+
+def get_points_time_series_batch(
+	db: Database,
+	after_id: Any | None,
+	batch_size: int,
+) -> List[dict[str, Any]]:
+	"""
+	Reads the next batch of 'cafe' documents in '_id' order.
+
+	:param db: The database connection.
+	:param after_id: The last '_id' of the previous batch, or None to start.
+	:param batch_size: The number of documents per batch.
+	:return: The documents of the batch.
+	:rtype: List[dict[str, Any]]
+	"""
+	query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+	return list(db.get_collection(COFFEE).find(query).sort("_id", 1).limit(batch_size))
+
+
+def save_buckets(db: Database, docs: List[dict[str, Any]]):
+	"""
+	Merges pixel documents into their yearly buckets in 'cafe_buckets'.
+
+	:param db: The database connection.
+	:param docs: Pixel documents with 'geocodigo', 'metadata' and 'timeseries'.
+	:return: The result of the bulk write operation.
+	:rtype: BulkWriteResult | None
+	"""
+	operations = list(bucket_operations(docs))
+	if not operations:
+		return
+	return db.get_collection(COFFEE_BUCKETS).bulk_write(operations, ordered=False)
+
+
+def get_area(
+	db: Database,
+	geometry: dict[str, Any],
+	attribute: str,
+	max_pixels: int,
+	start: date | None = None,
+	end: date | None = None,
+) -> dict[str, Any]:
+	"""
+	Aggregates an attribute per timestamp over the pixels inside an area.
+
+	:param db: The database connection.
+	:param geometry: The GeoJSON Polygon or MultiPolygon of the area.
+	:param attribute: The time series attribute (e.g. "ndvi").
+	:param max_pixels: The maximum number of pixels to aggregate.
+	:param start: First composite date (inclusive), if bounded.
+	:param end: Last composite date (inclusive), if bounded.
+	:return: The pixels scanned, whether the scan was truncated and the
+			 statistics per timestamp.
+	:rtype: dict[str, Any]
+	"""
+	collection, pipeline = area_stats_pipeline(
+		geometry, attribute, max_pixels, start, end
+	)
+	docs = list(db.get_collection(collection).aggregate(pipeline))
+	return docs[0] if docs else {"pixels": 0, "truncated": False, "stats": []}
+
+
+def ensure_rollup_indexes(db: Database):
+	"""
+	Creates the indexes used to compute and read the municipality rollups.
+
+	:param db: The database connection.
+	"""
+	db.get_collection(ROLLUPS).create_index(
+		[("geocodigo", 1), ("timestamp", 1)],
+		unique=True,
+	)
+	source = COFFEE_BUCKETS if STORAGE == "bucket" else COFFEE
+	db.get_collection(source).create_index([("geocodigo", 1)])
+
+
+def get_rollup_geocodigos(db: Database) -> List[str]:
+	"""
+	Lists the municipalities with stored time series.
+
+	:param db: The database connection.
+	:return: The municipality codes.
+	:rtype: List[str]
+	"""
+	source = COFFEE_BUCKETS if STORAGE == "bucket" else COFFEE
+	return sorted(
+		geocodigo
+		for geocodigo in db.get_collection(source).distinct("geocodigo")
+		if geocodigo is not None
+	)
+
+
+def refresh_rollups(
+	db: Database,
+	geocodigos: Iterable[str],
+	timestamps: Iterable[datetime] | None = None,
+):
+	"""
+	Recomputes the rollups of some municipalities into 'cafe_rollups'.
+
+	:param db: The database connection.
+	:param geocodigos: The municipalities to recompute.
+	:param timestamps: The composites to recompute, or None for all.
+	"""
+	geocodigos = sorted(set(geocodigos))
+	if not geocodigos:
+		return
+
+	ensure_rollup_indexes(db)
+	collection, pipeline = rollup_pipeline(geocodigos, timestamps)
+	db.get_collection(collection).aggregate(pipeline)
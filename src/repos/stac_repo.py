@@ -0,0 +1,191 @@
+from datetime import datetime
+from typing import Any, Iterator, List
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.database import Database
+
+from src.repos.coffee_repo import REPORTS
+from src.utils.date_now import get_utc_now
+
+STAC_ITEMS = "stac_items"
+ZONAL_STATS = "stac_zonal_stats"
+
+
+def ensure_stac_indexes(db: Database):
+	"""
+	Creates the indexes of the local STAC catalog and of the zonal statistics.
+
+	:param db: The database connection.
+	"""
+	collection = db.get_collection(STAC_ITEMS)
+	collection.create_index(
+		[("collection", ASCENDING), ("item_id", ASCENDING)],
+		unique=True,
+	)
+	collection.create_index([("collection", ASCENDING), ("datetime", ASCENDING)])
+
+	db.get_collection(ZONAL_STATS).create_index(
+		[
+			("collection", ASCENDING),
+			("item_id", ASCENDING),
+			("band", ASCENDING),
+			("geocodigo", ASCENDING),
+		],
+		unique=True,
+	)
+	db.get_collection(ZONAL_STATS).create_index(
+		[("geocodigo", ASCENDING), ("datetime", ASCENDING)]
+	)
+
+
+def get_latest_item_datetime(db: Database, collection: str) -> datetime | None:
+	"""
+	Retrieves the datetime of the newest catalogued item of a collection.
+
+	:param db: The database connection.
+	:param collection: The STAC collection id.
+	:return: The newest item datetime, or None if the collection is empty.
+	:rtype: datetime | None
+	"""
+	doc = db.get_collection(STAC_ITEMS).find_one(
+		{"collection": collection},
+		{"_id": 0, "datetime": 1},
+		sort=[("datetime", DESCENDING)],
+	)
+	return doc["datetime"] if doc else None
+
+
+def upsert_stac_items(db: Database, items: List[dict[str, Any]]):
+	"""
+	Inserts or refreshes catalogued items in 'stac_items'.
+
+	:param db: The database connection.
+	:param items: Item documents with 'collection' and 'item_id'.
+	:return: The result of the bulk write operation.
+	:rtype: BulkWriteResult | None
+	"""
+	if not items:
+		return
+
+	now = get_utc_now()
+	operations = [
+		UpdateOne(
+			{"collection": item["collection"], "item_id": item["item_id"]},
+			{
+				"$set": {**item, "updated_at": now},
+				"$setOnInsert": {"created_at": now},
+			},
+			upsert=True,
+		)
+		for item in items
+	]
+	return db.get_collection(STAC_ITEMS).bulk_write(operations, ordered=False)
+
+
+def find_stac_items(
+	db: Database,
+	collections: List[str],
+	start: datetime,
+	end: datetime,
+) -> Iterator[dict[str, Any]]:
+	"""
+	Streams catalogued items of some collections in datetime order.
+
+	:param db: The database connection.
+	:param collections: The STAC collection ids.
+	:param start: Start of the datetime range (inclusive).
+	:param end: End of the datetime range (inclusive).
+	:return: A cursor over the item documents.
+	:rtype: Iterator[dict[str, Any]]
+	"""
+	return (
+		db.get_collection(STAC_ITEMS)
+		.find(
+			{
+				"collection": {"$in": collections},
+				"datetime": {"$gte": start, "$lte": end},
+			},
+			{"_id": 0},
+		)
+		.sort("datetime", ASCENDING)
+	)
+
+
+def get_processed_items(db: Database, collection: str, band: str) -> set[str]:
+	"""
+	Retrieves the ids of the items whose zonal statistics are already stored.
+
+	:param db: The database connection.
+	:param collection: The STAC collection id.
+	:param band: The band (asset key) of the statistics.
+	:return: The item ids.
+	:rtype: set[str]
+	"""
+	return set(
+		db.get_collection(ZONAL_STATS).distinct(
+			"item_id", {"collection": collection, "band": band}
+		)
+	)
+
+
+def save_zonal_stats(db: Database, docs: List[dict[str, Any]]):
+	"""
+	Inserts or replaces zonal statistics in 'stac_zonal_stats'.
+
+	:param db: The database connection.
+	:param docs: Statistics documents with 'item_id', 'band' and 'geocodigo'.
+	:return: The result of the bulk write operation.
+	:rtype: BulkWriteResult | None
+	"""
+	if not docs:
+		return
+
+	now = get_utc_now()
+	operations = [
+		UpdateOne(
+			{
+				"collection": doc["collection"],
+				"item_id": doc["item_id"],
+				"band": doc["band"],
+				"geocodigo": doc["geocodigo"],
+			},
+			{"$set": {**doc, "updated_at": now}},
+			upsert=True,
+		)
+		for doc in docs
+	]
+	return db.get_collection(ZONAL_STATS).bulk_write(operations, ordered=False)
+
+
+def update_stac_report(
+	db: Database,
+	job_key: dict[str, Any],
+	status: str,
+	summary: dict[str, int],
+	items: List[dict[str, Any]],
+	errors: List[dict[str, Any]],
+):
+	"""
+	Records a STAC run in the 'pipeline_reports' collection.
+
+	Runs of the same job accumulate: counters are incremented and the item
+	timings and errors are appended.
+
+	:param db: The database connection.
+	:param job_key: The identifiers of the job report.
+	:param status: The status of the run.
+	:param summary: The counters of the run.
+	:param items: The wall and CPU time of each processed item.
+	:param errors: The errors of the run.
+	"""
+	now = get_utc_now()
+	db.get_collection(REPORTS).update_one(
+		job_key,
+		{
+			"$set": {"status": status, "updated_at": now},
+			"$setOnInsert": {"created_at": now},
+			"$inc": {f"summary.{key}": value for key, value in summary.items()},
+			"$push": {"items": {"$each": items}, "errors": {"$each": errors}},
+		},
+		upsert=True,
+	)
@@ -1,7 +1,18 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
 from pymongo.asynchronous.database import AsyncDatabase
 
-from src.models.coffee import CoffeeYieldOut, PointTimeSeriesFetch, PointTimeSeriesOut
+from src.models.coffee import (
+	AreaStatsFetch,
+	AreaStatsOut,
+	AreaStatsTaskOut,
+	CoffeeYieldOut,
+	DateRange,
+	MunicipalityRollupOut,
+	PointsTimeSeriesFetch,
+	PointsTimeSeriesOut,
+	PointTimeSeriesFetch,
+	PointTimeSeriesOut,
+)
 from src.services import coffee_service
 from src.utils.db import get_conn
 
@@ -25,3 +36,49 @@ async def get_point_time_series(
 	Endpoint to retrieve time series data for a specific point.
 	"""
 	return await coffee_service.get_point_time_series(db, point_time_series_fetch)
+
+
+@router.post("/points/", response_model=PointsTimeSeriesOut)
+async def get_points_time_series(
+	points_time_series_fetch: PointsTimeSeriesFetch,
+	db: AsyncDatabase = Depends(get_conn),
+):
+	"""
+	Endpoint to retrieve time series data for several points at once.
+	"""
+	return await coffee_service.get_points_time_series(db, points_time_series_fetch)
+
+
+@router.post("/area/", response_model=AreaStatsOut | AreaStatsTaskOut)
+async def get_area_stats(
+	area_stats_fetch: AreaStatsFetch,
+	response: Response,
+	db: AsyncDatabase = Depends(get_conn),
+):
+	"""
+	Endpoint to aggregate an attribute per composite date inside a polygon or bbox.
+	"""
+	result = await coffee_service.get_area_stats(db, area_stats_fetch)
+	if area_stats_fetch.background:
+		response.status_code = 202
+	return result
+
+
+@router.get("/area/{task_id}", response_model=AreaStatsTaskOut)
+async def get_area_stats_task(task_id: str):
+	"""
+	Endpoint to retrieve the state of a background area aggregate.
+	"""
+	return await coffee_service.get_area_stats_task(task_id)
+
+
+@router.get("/rollups/{geocodigo}", response_model=list[MunicipalityRollupOut])
+async def get_municipality_rollups(
+	geocodigo: str,
+	date_range: DateRange = Query(...),
+	db: AsyncDatabase = Depends(get_conn),
+):
+	"""
+	Endpoint to retrieve the NDVI/EVI rollups of a municipality by composite date.
+	"""
+	return await coffee_service.get_municipality_rollups(db, geocodigo, date_range)
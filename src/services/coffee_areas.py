@@ -0,0 +1,117 @@
+"""Spatial index of the mapped coffee areas, used to clip ad-hoc geometries."""
+
+import logging
+import threading
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import MultiPolygon, Polygon
+
+from src.services.geometry_store import geometry_store, source_stat
+from src.services.wtss_tiling import polygonal_part
+
+logger = logging.getLogger(__name__)
+
+# GeoJSON (RFC 7946) é sempre WGS 84
+GEOJSON_CRS = "EPSG:4326"
+
+
+class CoffeeAreaIndex:
+	"""
+	STRtree over the coffee polygons, tagged with their municipality codes.
+
+	Geometries sent by the API or the admin are intersected with the index so
+	that only the overlapping coffee areas are requested from WTSS, each one
+	carrying the ``CD_MUN`` of the coffee polygon it came from.
+	"""
+
+	def __init__(self, gdf: gpd.GeoDataFrame):
+		"""
+		Builds the index in the CRS of the coffee polygons.
+
+		The polygons are not reprojected, so the ones returned untouched by
+		``clip`` are exactly the geometries of the source.
+
+		:param gdf: Coffee polygons with a ``CD_MUN`` column (assumed WGS 84
+					when no CRS is set)
+		:type gdf: gpd.GeoDataFrame
+		"""
+		polygons = gdf[
+			gdf.geometry.apply(lambda g: isinstance(g, (Polygon, MultiPolygon)))
+		]
+
+		self.crs = polygons.crs or GEOJSON_CRS
+		self.geocodigos = np.asarray(polygons["CD_MUN"].astype(str))
+		self.geometries = np.asarray(polygons.geometry)
+		self.tree = STRtree(self.geometries)
+
+	def clip(self, gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+		"""
+		Intersects geometries with the coffee areas.
+
+		Coffee polygons fully covered by a geometry are kept untouched, in the
+		source CRS, so their ``polygon_key`` (hash of the geometry) is the same as
+		in the scheduled runs over the whole shapefile and they share watermarks.
+
+		:param gdf: Requested geometries (assumed WGS 84 when no CRS is set)
+		:type gdf: gpd.GeoDataFrame
+		:return: One row per overlapping (geometry, coffee polygon) pair, with
+				 ``CD_MUN`` and the clipped geometry, in the CRS of the index
+		:rtype: gpd.GeoDataFrame
+		"""
+		if gdf.crs is None:
+			gdf = gdf.set_crs(GEOJSON_CRS)
+
+		geoms = shapely.make_valid(np.asarray(gdf.to_crs(self.crs).geometry))
+		geom_idx, tree_idx = self.tree.query(geoms, predicate="intersects")
+
+		requested, coffee = geoms[geom_idx], self.geometries[tree_idx]
+		clipped = np.where(
+			shapely.covers(requested, coffee),
+			coffee,
+			shapely.intersection(requested, coffee),
+		)
+
+		parts = [polygonal_part(geom) for geom in clipped]
+		keep = np.array([part is not None for part in parts], dtype=bool)
+
+		logger.info(
+			f"Clipped {len(gdf)} geometries to {keep.sum()} coffee areas "
+			f"({len(set(self.geocodigos[tree_idx][keep]))} municipalities)"
+		)
+
+		return gpd.GeoDataFrame(
+			{"CD_MUN": self.geocodigos[tree_idx][keep]},
+			geometry=[part for part in parts if part is not None],
+			crs=self.crs,
+		)
+
+
+_indexes: dict[Path, tuple[list[list], CoffeeAreaIndex]] = {}
+_lock = threading.Lock()
+
+
+def get_coffee_index(path: str | Path) -> CoffeeAreaIndex:
+	"""
+	Returns the coffee area index of a source, built once per process.
+
+	The index is rebuilt when the source files change.
+
+	:param path: Path of the coffee shapefile
+	:type path: str | Path
+	:return: Coffee area index
+	:rtype: CoffeeAreaIndex
+	"""
+	path = Path(path)
+	stat = source_stat(path)
+
+	with _lock:
+		entry = _indexes.get(path)
+		if entry is None or entry[0] != stat:
+			entry = (stat, CoffeeAreaIndex(geometry_store.get(path)))
+			_indexes[path] = entry
+
+	return entry[1]
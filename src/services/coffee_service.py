@@ -1,8 +1,32 @@
+import asyncio
+from os import getenv as env
+from typing import Any, List
+
+from celery.result import AsyncResult
+from pymongo import MongoClient
 from pymongo.asynchronous.database import AsyncDatabase
+from starlette.concurrency import run_in_threadpool
 
-from src.models.coffee import PointTimeSeriesFetch
+from src.models.coffee import (
+	AreaStatsFetch,
+	DateRange,
+	PointsTimeSeriesFetch,
+	PointTimeSeriesFetch,
+	TimeSeriesOptions,
+)
 from src.repos import coffee_repo
+from src.services.point_cache import (
+	point_cache,
+	point_cache_key,
+	snap_to_grid,
+	snap_point,
+)
 from src.utils.app_error import AppError
+from src.worker import app as celery_app
+
+POINT_BATCH_CONCURRENCY = int(env("POINT_BATCH_CONCURRENCY", "16"))
+AREA_MAX_PIXELS = int(env("COFFEE_AREA_MAX_PIXELS", "50000"))
+AREA_MAX_PIXELS_BACKGROUND = int(env("COFFEE_AREA_MAX_PIXELS_BACKGROUND", "2000000"))
 
 
 async def get_coffee_yield(db: AsyncDatabase):
@@ -15,6 +39,61 @@ async def get_coffee_yield(db: AsyncDatabase):
 	return await coffee_repo.get_all_coffee_yield(db)
 
 
+async def find_point(
+	db: AsyncDatabase,
+	lng: float,
+	lat: float,
+	options: TimeSeriesOptions,
+) -> dict[str, Any] | None:
+	"""
+	Finds the time series of the pixel nearest to a coordinate.
+
+	The coordinate is snapped to the centre of its 10 m pixel before the geo
+	query, so every coordinate of the pixel gets the same answer. Lookups go
+	through the point cache, keyed by that pixel and the query options, so
+	nearby requests skip the geo query. The optional date range and attribute
+	subset are applied by the database.
+
+	:param db: The database connection.
+	:param lng: Longitude for the geo query.
+	:param lat: Latitude for the geo query.
+	:param options: Max distance, date range and attributes of the query.
+	:return: A point time series document, or None if no pixel is near.
+	:rtype: dict[str, Any] | None
+	"""
+	attributes = sorted(set(options.attributes)) if options.attributes else None
+	lng, lat = snap_point(lng, lat)
+
+	key = point_cache_key(
+		lng,
+		lat,
+		options.max_distance,
+		options.start,
+		options.end,
+		",".join(attributes) if attributes else None,
+	)
+	found, point_data = await point_cache.get(key)
+
+	if not found:
+		try:
+			point_data = await coffee_repo.get_point_time_series(
+				db,
+				lng,
+				lat,
+				options.max_distance,
+				options.start,
+				options.end,
+				attributes,
+			)
+		except AppError as e:
+			if e.status_code != 404:
+				raise
+			point_data = None
+		await point_cache.set(key, point_data)
+
+	return point_data
+
+
 async def get_point_time_series(
 	db: AsyncDatabase, point_time_series_fetch: PointTimeSeriesFetch
 ):
@@ -22,17 +101,189 @@ async def get_point_time_series(
 	Service to get point time series data.
 
 	:param db: The database connection.
-	:param lng: Longitude for the geo query.
-	:param lat: Latitude for the geo query.
-	:param max_distance: Maximum distance for the geo query.
+	:param point_time_series_fetch: Coordinate, max distance, date range and
+									attributes of the query.
 	:return: A point time series document.
 	:raises AppError: If no data is found for the given parameters.
 	"""
-	lat, lng, max_distance = point_time_series_fetch.model_dump().values()
-
-	point_data = await coffee_repo.get_point_time_series(db, lng, lat, max_distance)
+	fetch = point_time_series_fetch
+	point_data = await find_point(db, fetch.lng, fetch.lat, fetch)
 
 	if not point_data:
 		raise AppError(404, "No data found for the given parameters")
 
 	return point_data
+
+
+async def get_points_time_series(
+	db: AsyncDatabase, points_time_series_fetch: PointsTimeSeriesFetch
+) -> dict[str, Any]:
+	"""
+	Service to get the time series of several points at once.
+
+	Points are resolved concurrently (at most ``POINT_BATCH_CONCURRENCY`` geo
+	queries in flight) through the point cache, with one lookup per 10 m
+	pixel: ``find_point`` queries from the pixel centre, so every point of a
+	pixel has the same answer. Points without data are reported in
+	``missing`` instead of failing the batch.
+
+	:param db: The database connection.
+	:param points_time_series_fetch: Points and the options shared by them.
+	:return: Documents by point key and the keys without data.
+	:rtype: dict[str, Any]
+	"""
+	fetch = points_time_series_fetch
+	semaphore = asyncio.Semaphore(POINT_BATCH_CONCURRENCY)
+
+	async def lookup(cell: tuple[int, int]) -> dict[str, Any] | None:
+		async with semaphore:
+			return await find_point(db, *unique[cell], fetch)
+
+	# Pontos no mesmo pixel compartilham a consulta (feita a partir do centro)
+	cells = [snap_to_grid(point.lng, point.lat) for point in fetch.points]
+	unique = {
+		cell: snap_point(point.lng, point.lat)
+		for cell, point in zip(cells, fetch.points)
+	}
+	found = await asyncio.gather(*(lookup(cell) for cell in unique))
+	docs_by_cell = dict(zip(unique, found))
+
+	results = {}
+	missing = []
+	for key, cell in zip(fetch.keys(), cells):
+		doc = docs_by_cell[cell]
+		if doc:
+			results[key] = doc
+		else:
+			missing.append(key)
+
+	return {"results": results, "missing": missing}
+
+
+def area_stats_result(
+	stats: dict[str, Any], attribute: str, max_pixels: int
+) -> dict[str, Any]:
+	"""
+	Checks the pixel cap of an area aggregate and shapes its result.
+
+	:param stats: Pixels scanned, truncation flag and statistics per timestamp.
+	:param attribute: The aggregated attribute.
+	:param max_pixels: The pixel cap of the aggregate.
+	:return: The area statistics.
+	:rtype: dict[str, Any]
+	:raises AppError: If the area has more pixels than the cap.
+	"""
+	# Truncado: o limite de documentos foi atingido antes de contar todos
+	if stats["pixels"] > max_pixels or stats.get("truncated"):
+		raise AppError(
+			413,
+			f"The area has more than {max_pixels} pixels; "
+			"reduce it or run the aggregate in the background",
+		)
+	return {"attribute": attribute, "pixels": stats["pixels"], "stats": stats["stats"]}
+
+
+async def get_area_stats(
+	db: AsyncDatabase, area_stats_fetch: AreaStatsFetch
+) -> dict[str, Any]:
+	"""
+	Service to aggregate an attribute per timestamp inside a polygon or bbox.
+
+	The aggregation runs in the database and scans at most
+	``COFFEE_AREA_MAX_PIXELS`` pixels. With ``background`` it is sent to a
+	Celery task instead, with the larger ``COFFEE_AREA_MAX_PIXELS_BACKGROUND``
+	cap, and its id is returned to be polled.
+
+	:param db: The database connection.
+	:param area_stats_fetch: Area, attribute and date range of the aggregate.
+	:return: The area statistics, or the background task state.
+	:rtype: dict[str, Any]
+	:raises AppError: If the area has more pixels than the cap.
+	"""
+	fetch = area_stats_fetch
+
+	if fetch.background:
+		task = await run_in_threadpool(
+			celery_app.send_task,
+			"src.tasks.aggregate_area",
+			args=[fetch.model_dump(mode="json")],
+		)
+		return {"task_id": task.id, "status": "PENDING"}
+
+	stats = await coffee_repo.get_area_stats(
+		db, fetch.area(), fetch.attribute, AREA_MAX_PIXELS, fetch.start, fetch.end
+	)
+	return area_stats_result(stats, fetch.attribute, AREA_MAX_PIXELS)
+
+
+async def get_area_stats_task(task_id: str) -> dict[str, Any]:
+	"""
+	Service to get the state of a background area aggregate.
+
+	Unknown task ids are reported as PENDING, as Celery does.
+
+	:param task_id: The id returned when the aggregate was requested.
+	:return: The task state and, when finished, its result or error.
+	:rtype: dict[str, Any]
+	"""
+
+	def fetch_state() -> dict[str, Any]:
+		result = AsyncResult(task_id, app=celery_app)
+		state = {"task_id": task_id, "status": result.state}
+		if result.successful():
+			state["result"] = result.result
+		elif result.failed():
+			state["error"] = str(result.result)
+		return state
+
+	return await run_in_threadpool(fetch_state)
+
+
+def run_area_stats(payload: dict[str, Any]) -> dict[str, Any]:
+	"""
+	Runs an area aggregate in a background task.
+
+	:param payload: A serialized ``AreaStatsFetch``.
+	:return: The area statistics.
+	:rtype: dict[str, Any]
+	:raises AppError: If the area has more pixels than the background cap.
+	"""
+	fetch = AreaStatsFetch(**payload)
+
+	client = MongoClient(env("DB_URL", "mongodb://mongo:27017/"))
+	try:
+		stats = coffee_repo.get_area(
+			client[env("DB_NAME", "campo_vertentes")],
+			fetch.area(),
+			fetch.attribute,
+			AREA_MAX_PIXELS_BACKGROUND,
+			fetch.start,
+			fetch.end,
+		)
+	finally:
+		client.close()
+
+	return area_stats_result(stats, fetch.attribute, AREA_MAX_PIXELS_BACKGROUND)
+
+
+async def get_municipality_rollups(
+	db: AsyncDatabase, geocodigo: str, date_range: DateRange
+) -> List[dict[str, Any]]:
+	"""
+	Service to get the materialized rollups of a municipality.
+
+	:param db: The database connection.
+	:param geocodigo: The municipality code.
+	:param date_range: Optional composite date range.
+	:return: The rollups sorted by timestamp.
+	:rtype: List[dict[str, Any]]
+	:raises AppError: If the municipality has no rollups in the range.
+	"""
+	rollups = await coffee_repo.get_rollups(
+		db, geocodigo, date_range.start, date_range.end
+	)
+
+	if not rollups:
+		raise AppError(404, "No rollups found for the given municipality")
+
+	return rollups
@@ -0,0 +1,299 @@
+"""Disk-backed block cache of remote COG byte ranges, used as a rasterio opener."""
+
+import hashlib
+import io
+import logging
+import re
+from collections import OrderedDict
+from os import getenv as env
+from pathlib import Path
+
+import requests
+
+from src.utils.disk_cache import DiskCache
+from src.utils.retry import call_with_retries
+
+logger = logging.getLogger(__name__)
+
+COG_CACHE_DIR = env("COG_CACHE_DIR", "")
+COG_CACHE_MAX_BYTES = int(env("COG_CACHE_MAX_BYTES", str(10 * 1024**3)))
+COG_BLOCK_SIZE = int(env("COG_CACHE_BLOCK_SIZE", str(256 * 1024)))
+
+# Blocos recentes mantidos em memória por arquivo aberto (cabeçalhos, IFDs)
+MEMORY_BLOCKS = 16
+REQUEST_TIMEOUT = 60
+
+
+class BlockCache(DiskCache):
+	"""
+	Size-bounded LRU store of byte ranges of remote files.
+
+	Each entry is one fixed-size block of a file, addressed by the file URL, its
+	version (ETag or Last-Modified) and its byte range, so blocks of a replaced
+	file are never served. Hits refresh the entry mtime, which drives the eviction of
+	the least recently used blocks once ``max_bytes`` is exceeded.
+	"""
+
+	name = "COG"
+
+	def __init__(self, directory: str | Path, max_bytes: int = COG_CACHE_MAX_BYTES):
+		"""
+		Initialize the cache on a directory.
+
+		:param directory: Directory where blocks are stored
+		:type directory: str | Path
+		:param max_bytes: Maximum total size of the blocks
+		:type max_bytes: int
+		"""
+		super().__init__(directory, max_bytes)
+
+	@classmethod
+	def from_env(cls) -> "BlockCache | None":
+		"""
+		Builds the cache configured by ``COG_CACHE_DIR``, if any.
+
+		:return: Cache instance, or None when caching is disabled
+		:rtype: BlockCache | None
+		"""
+		return cls(COG_CACHE_DIR) if COG_CACHE_DIR else None
+
+	@staticmethod
+	def _key(url: str, version: str, start: int, stop: int) -> str:
+		return hashlib.sha256(f"{url}|{version}|{start}-{stop}".encode()).hexdigest()
+
+	def get(self, url: str, version: str, start: int, stop: int) -> bytes | None:
+		"""
+		Returns a cached byte range, or None on a miss.
+
+		:param url: File URL
+		:type url: str
+		:param version: File version (ETag, Last-Modified or size)
+		:type version: str
+		:param start: First byte of the range
+		:type start: int
+		:param stop: Byte after the last one of the range
+		:type stop: int
+		:return: Cached bytes
+		:rtype: bytes | None
+		"""
+		path = self._path(self._key(url, version, start, stop))
+		try:
+			data = path.read_bytes()
+		except FileNotFoundError:
+			return None
+
+		self._touch(path)
+		return data
+
+	def put(self, url: str, version: str, start: int, stop: int, data: bytes):
+		"""
+		Stores a byte range and evicts the least recently used blocks if needed.
+
+		:param url: File URL
+		:type url: str
+		:param version: File version (ETag, Last-Modified or size)
+		:type version: str
+		:param start: First byte of the range
+		:type start: int
+		:param stop: Byte after the last one of the range
+		:type stop: int
+		:param data: Bytes of the range
+		:type data: bytes
+		"""
+		self._write(
+			self._path(self._key(url, version, start, stop)),
+			lambda file: file.write(data),
+		)
+
+
+class CachedHTTPFile(io.RawIOBase):
+	"""
+	Read-only, seekable view of a remote file fetched in cached blocks.
+
+	Reads are split into ``block_size`` blocks; missing consecutive blocks are
+	fetched with a single HTTP range request and stored in the block cache.
+	Only complete partial responses (206) are accepted, so blocks are never
+	cached from a server that ignores ``Range``. The size and version of the
+	file are checked with a HEAD request on every open, and range requests are
+	conditional on that version (``If-Range``): a file replaced upstream gets
+	new cache entries instead of stale blocks.
+	"""
+
+	def __init__(
+		self,
+		url: str,
+		cache: BlockCache,
+		session: requests.Session,
+		block_size: int = COG_BLOCK_SIZE,
+	):
+		"""
+		Initialize the file.
+
+		:param url: File URL
+		:type url: str
+		:param cache: Block cache
+		:type cache: BlockCache
+		:param session: HTTP session
+		:type session: requests.Session
+		:param block_size: Block size in bytes
+		:type block_size: int
+		"""
+		super().__init__()
+		self.url = url
+		self.cache = cache
+		self.session = session
+		self.block_size = block_size
+		self.position = 0
+		self._blocks: OrderedDict[int, bytes] = OrderedDict()
+		self.size, self.version, self._validator = self._stat()
+
+	def _stat(self) -> tuple[int, str, str | None]:
+		response = call_with_retries(
+			lambda: self._request("HEAD", allow_redirects=True)
+		)
+		size = int(response.headers["Content-Length"])
+		etag = response.headers.get("ETag")
+		last_modified = response.headers.get("Last-Modified")
+
+		# If-Range só aceita ETags fortes; sem validador, a versão é o tamanho
+		validator = etag if etag and not etag.startswith("W/") else last_modified
+		version = etag or last_modified or str(size)
+		return size, version, validator
+
+	def _request(self, method: str, **kwargs) -> requests.Response:
+		response = self.session.request(
+			method, self.url, timeout=REQUEST_TIMEOUT, **kwargs
+		)
+		response.raise_for_status()
+		return response
+
+	def readable(self) -> bool:
+		return True
+
+	def seekable(self) -> bool:
+		return True
+
+	def tell(self) -> int:
+		return self.position
+
+	def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+		if whence == io.SEEK_SET:
+			self.position = offset
+		elif whence == io.SEEK_CUR:
+			self.position += offset
+		else:
+			self.position = self.size + offset
+		return self.position
+
+	def read(self, size: int = -1) -> bytes:
+		stop = self.size if size < 0 else min(self.size, self.position + size)
+		if self.position >= stop:
+			return b""
+
+		first = self.position // self.block_size
+		last = (stop - 1) // self.block_size
+		blocks = self._get_blocks(first, last)
+
+		data = b"".join(blocks[index] for index in range(first, last + 1))
+		offset = self.position - first * self.block_size
+		result = data[offset : offset + stop - self.position]
+		self.position = stop
+		return result
+
+	def readinto(self, buffer) -> int:
+		data = self.read(len(buffer))
+		buffer[: len(data)] = data
+		return len(data)
+
+	def _block_range(self, index: int) -> tuple[int, int]:
+		start = index * self.block_size
+		return start, min(start + self.block_size, self.size)
+
+	def _get_blocks(self, first: int, last: int) -> dict[int, bytes]:
+		blocks = {}
+		missing = []
+		for index in range(first, last + 1):
+			data = self._blocks.get(index)
+			if data is None:
+				data = self.cache.get(self.url, self.version, *self._block_range(index))
+			if data is None:
+				missing.append(index)
+			else:
+				blocks[index] = data
+
+		# Blocos faltantes consecutivos viram uma única requisição
+		runs = []
+		for index in missing:
+			if runs and runs[-1][1] == index - 1:
+				runs[-1][1] = index
+			else:
+				runs.append([index, index])
+
+		for run_first, run_last in runs:
+			start = self._block_range(run_first)[0]
+			stop = self._block_range(run_last)[1]
+			headers = {"Range": f"bytes={start}-{stop - 1}"}
+			if self._validator:
+				headers["If-Range"] = self._validator
+			response = call_with_retries(lambda: self._request("GET", headers=headers))
+			content = response.content
+
+			# Um servidor que ignora o Range (ou um arquivo substituído desde a
+			# abertura, via If-Range) devolve 200 com o arquivo inteiro
+			if response.status_code != 206 or len(content) != stop - start:
+				raise OSError(
+					f"Invalid range response for {self.url} bytes {start}-{stop - 1}: "
+					f"status {response.status_code}, {len(content)} bytes"
+				)
+
+			for index in range(run_first, run_last + 1):
+				block_start, block_stop = self._block_range(index)
+				data = content[block_start - start : block_stop - start]
+				self.cache.put(self.url, self.version, block_start, block_stop, data)
+				blocks[index] = data
+
+		for index, data in blocks.items():
+			self._blocks[index] = data
+			self._blocks.move_to_end(index)
+		while len(self._blocks) > MEMORY_BLOCKS:
+			self._blocks.popitem(last=False)
+
+		return blocks
+
+
+class CachedOpener:
+	"""rasterio ``opener`` that serves remote assets through the block cache."""
+
+	def __init__(self, cache: BlockCache, block_size: int = COG_BLOCK_SIZE):
+		"""
+		Initialize the opener.
+
+		:param cache: Block cache
+		:type cache: BlockCache
+		:param block_size: Block size in bytes
+		:type block_size: int
+		"""
+		self.cache = cache
+		self.block_size = block_size
+		self.session = requests.Session()
+
+	def __call__(self, url: str, mode: str = "rb") -> CachedHTTPFile:
+		"""
+		Opens a remote file for reading.
+
+		:param url: File URL
+		:type url: str
+		:param mode: File mode (only reading is supported)
+		:type mode: str
+		:return: Seekable file object
+		:rtype: CachedHTTPFile
+		"""
+		if "r" not in mode or "+" in mode:
+			raise ValueError(f"Unsupported mode for cached COG reads: {mode}")
+
+		# O rasterio normaliza o caminho como Path, que reduz "//" a "/"
+		url = re.sub(r"^(https?):/+", r"\1://", url)
+		if not url.startswith(("http://", "https://")):
+			raise FileNotFoundError(url)
+
+		return CachedHTTPFile(url, self.cache, self.session, self.block_size)
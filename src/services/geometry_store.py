@@ -0,0 +1,215 @@
+"""Per-process store of the reference geometries, backed by an on-disk cache."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from os import getenv as env
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY_CACHE_DIR = env(
+	"GEOMETRY_CACHE_DIR", str(Path(tempfile.gettempdir()) / "geometry_cache")
+)
+
+
+def _source_files(path: Path) -> list[Path]:
+	"""Files of a vector source (a shapefile is the .shp plus its sidecars)."""
+	return sorted(path.parent.glob(f"{path.stem}.*")) or [path]
+
+
+def source_stat(path: Path) -> list[list]:
+	"""
+	Cheap fingerprint of a vector source: name, mtime and size of its files.
+
+	:param path: Path of the source file
+	:type path: Path
+	:return: [name, mtime_ns, size] of each file of the source
+	:rtype: list[list]
+	"""
+	return [
+		[file.name, file.stat().st_mtime_ns, file.stat().st_size]
+		for file in _source_files(path)
+	]
+
+
+def source_hash(path: Path) -> str:
+	"""
+	Content hash of a vector source, used when its mtime changed.
+
+	:param path: Path of the source file
+	:type path: Path
+	:return: SHA-256 hex digest of the files of the source
+	:rtype: str
+	"""
+	digest = hashlib.sha256()
+	for file in _source_files(path):
+		digest.update(file.name.encode())
+		with open(file, "rb") as f:
+			for block in iter(lambda: f.read(1024**2), b""):
+				digest.update(block)
+	return digest.hexdigest()
+
+
+class GeometryStore:
+	"""
+	Keeps the reference GeoDataFrames in memory, loading each source once.
+
+	Sources are converted once into an ``.npz`` cache (geometries as WKB plus
+	the attribute columns), so new worker processes skip the shapefile driver.
+	The cache is invalidated by the source mtime and, when only the mtime
+	changed, by its content hash. In memory, a frame is reused while the source
+	files keep the same mtime and size, so tasks only pay for a ``stat`` call.
+	"""
+
+	def __init__(self, cache_dir: str | Path = GEOMETRY_CACHE_DIR):
+		"""
+		Initialize the store.
+
+		:param cache_dir: Directory of the converted sources
+		:type cache_dir: str | Path
+		"""
+		self.cache_dir = Path(cache_dir)
+		self._frames: dict[Path, tuple[list[list], gpd.GeoDataFrame]] = {}
+		self._lock = threading.Lock()
+
+	def get(self, path: str | Path) -> gpd.GeoDataFrame:
+		"""
+		Returns the geometries of a source, loading them if needed.
+
+		:param path: Path of the source file (shapefile, GeoPackage...)
+		:type path: str | Path
+		:return: Copy of the source GeoDataFrame
+		:rtype: gpd.GeoDataFrame
+		"""
+		path = Path(path)
+		stat = source_stat(path)
+
+		with self._lock:
+			entry = self._frames.get(path)
+			if entry is None or entry[0] != stat:
+				entry = (stat, self._load(path, stat))
+				self._frames[path] = entry
+
+		return entry[1].copy()
+
+	def preload(self, *paths: str | Path):
+		"""
+		Loads sources ahead of the first task, logging the ones that fail.
+
+		:param paths: Paths of the source files
+		:type paths: str | Path
+		"""
+		for path in paths:
+			try:
+				self.get(path)
+			except Exception:
+				logger.exception(f"Could not preload geometries from {path}")
+
+	def _cache_path(self, path: Path) -> Path:
+		name = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:16]
+		return self.cache_dir / f"{path.stem}-{name}.npz"
+
+	def _load(self, path: Path, stat: list[list]) -> gpd.GeoDataFrame:
+		cache_path = self._cache_path(path)
+		cached = self._read_cache(cache_path)
+
+		if cached is not None:
+			cached_stat, cached_hash, gdf = cached
+			if cached_stat == stat:
+				return gdf
+
+			# mtime mudou (cópia, checkout): só reconverte se o conteúdo mudou
+			digest = source_hash(path)
+			if cached_hash == digest:
+				try:
+					self._write_cache(cache_path, gdf, stat, digest)
+				except OSError:
+					logger.warning(f"Could not refresh geometry cache {cache_path}")
+				return gdf
+		else:
+			digest = source_hash(path)
+
+		logger.info(f"Converting geometries from {path}")
+		gdf = gpd.read_file(path)
+		try:
+			self._write_cache(cache_path, gdf, stat, digest)
+		except OSError:
+			logger.warning(f"Could not write geometry cache {cache_path}")
+		return gdf
+
+	def _read_cache(
+		self, cache_path: Path
+	) -> tuple[list[list], str, gpd.GeoDataFrame] | None:
+		try:
+			with np.load(cache_path, allow_pickle=False) as data:
+				meta = json.loads(str(data["meta"]))
+				wkb = data["wkb"].tobytes()
+				offsets = data["offsets"]
+				geometry = shapely.from_wkb(
+					[wkb[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+				)
+				columns = {
+					name: data[f"column_{i}"] for i, name in enumerate(meta["columns"])
+				}
+		except FileNotFoundError:
+			return None
+		except Exception:
+			logger.warning(f"Discarding unreadable geometry cache {cache_path.name}")
+			cache_path.unlink(missing_ok=True)
+			return None
+
+		gdf = gpd.GeoDataFrame(
+			pd.DataFrame(columns), geometry=geometry, crs=meta["crs"] or None
+		)
+		return meta["stat"], meta["hash"], gdf
+
+	def _write_cache(
+		self, cache_path: Path, gdf: gpd.GeoDataFrame, stat: list[list], digest: str
+	):
+		wkbs = shapely.to_wkb(np.asarray(gdf.geometry))
+		offsets = np.cumsum([0] + [len(wkb) for wkb in wkbs], dtype=np.int64)
+
+		columns = [name for name in gdf.columns if name != gdf.geometry.name]
+		arrays = {}
+		for i, name in enumerate(columns):
+			series = gdf[name]
+			# Colunas de texto (ou mistas) viram strings; numéricas mantêm o dtype
+			arrays[f"column_{i}"] = (
+				series.to_numpy()
+				if pd.api.types.is_numeric_dtype(series)
+				else series.fillna("").astype(str).to_numpy(dtype=str)
+			)
+
+		meta = {
+			"stat": stat,
+			"hash": digest,
+			"crs": gdf.crs.to_wkt() if gdf.crs else None,
+			"columns": [str(name) for name in columns],
+		}
+
+		self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+		# Escrita atômica: outros workers nunca leem um arquivo pela metade
+		fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+		with os.fdopen(fd, "wb") as file:
+			np.savez(
+				file,
+				meta=np.array(json.dumps(meta)),
+				wkb=np.frombuffer(b"".join(wkbs), dtype=np.uint8),
+				offsets=offsets,
+				**arrays,
+			)
+		os.replace(tmp, cache_path)
+
+
+# Uma instância por processo do worker, preenchida no worker_process_init
+geometry_store = GeometryStore()
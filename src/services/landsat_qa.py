@@ -0,0 +1,169 @@
+"""Vectorized Landsat Collection 2 QA masking and surface temperature scaling."""
+
+from typing import Any
+
+import numpy as np
+
+# Bits do QA_PIXEL (Landsat Collection 2, Level 2)
+QA_FILL = 1 << 0
+QA_DILATED_CLOUD = 1 << 1
+QA_CIRRUS = 1 << 2
+QA_CLOUD = 1 << 3
+QA_CLOUD_SHADOW = 1 << 4
+QA_SNOW = 1 << 5
+QA_CLEAR = 1 << 6
+QA_WATER = 1 << 7
+
+# Campos de confiança de 2 bits: (nome, deslocamento)
+QA_CONFIDENCES = (
+	("cloud_confidence", 8),
+	("cloud_shadow_confidence", 10),
+	("snow_confidence", 12),
+	("cirrus_confidence", 14),
+)
+
+# Pixels descartados: preenchimento, nuvens, cirros e sombras
+QA_MASK = QA_FILL | QA_DILATED_CLOUD | QA_CIRRUS | QA_CLOUD | QA_CLOUD_SHADOW
+
+# QA_RADSAT: bit (n - 1) marca a banda n saturada (OLI/TIRS); bit 11, oclusão
+RADSAT_RED = 1 << 3
+RADSAT_NIR = 1 << 4
+RADSAT_LWIR11 = 1 << 9
+RADSAT_TERRAIN_OCCLUSION = 1 << 11
+NDVI_RADSAT_MASK = RADSAT_RED | RADSAT_NIR | RADSAT_TERRAIN_OCCLUSION
+LST_RADSAT_MASK = RADSAT_LWIR11 | RADSAT_TERRAIN_OCCLUSION
+
+# Temperatura de superfície (ST_B10): Kelvin = DN * escala + offset; DN 0 é nodata
+LST_SCALE = 0.00341802
+LST_OFFSET = 149.0
+LST_NODATA = 0
+KELVIN = 273.15
+
+
+def decode_qa_pixel(qa_pixel: np.ndarray) -> dict[str, np.ndarray]:
+	"""
+	Decodes the QA_PIXEL bitfields of a block into one array per flag.
+
+	:param qa_pixel: QA_PIXEL values
+	:type qa_pixel: np.ndarray
+	:return: Boolean arrays of the flags and uint8 arrays (0-3) of the
+			 confidence levels
+	:rtype: dict[str, np.ndarray]
+	"""
+	qa = qa_pixel.astype(np.uint16, copy=False)
+	flags = {
+		"fill": QA_FILL,
+		"dilated_cloud": QA_DILATED_CLOUD,
+		"cirrus": QA_CIRRUS,
+		"cloud": QA_CLOUD,
+		"cloud_shadow": QA_CLOUD_SHADOW,
+		"snow": QA_SNOW,
+		"clear": QA_CLEAR,
+		"water": QA_WATER,
+	}
+	decoded = {name: (qa & bit) != 0 for name, bit in flags.items()}
+	for name, shift in QA_CONFIDENCES:
+		decoded[name] = ((qa >> shift) & 0b11).astype(np.uint8)
+	return decoded
+
+
+def qa_mask(
+	qa_pixel: np.ndarray,
+	qa_radsat: np.ndarray | None = None,
+	mask_bits: int = QA_MASK,
+	radsat_bits: int = 0,
+) -> np.ndarray:
+	"""
+	Computes the valid pixels of a block from its QA bands.
+
+	:param qa_pixel: QA_PIXEL values
+	:type qa_pixel: np.ndarray
+	:param qa_radsat: QA_RADSAT values, if saturation should be checked
+	:type qa_radsat: np.ndarray | None
+	:param mask_bits: QA_PIXEL bits that invalidate a pixel
+	:type mask_bits: int
+	:param radsat_bits: QA_RADSAT bits that invalidate a pixel
+	:type radsat_bits: int
+	:return: True where the pixel is usable
+	:rtype: np.ndarray
+	"""
+	valid = (qa_pixel & mask_bits) == 0
+	if qa_radsat is not None and radsat_bits:
+		valid &= (qa_radsat & radsat_bits) == 0
+	return valid
+
+
+def surface_temperature(
+	lwir: np.ndarray, valid: np.ndarray | None = None, celsius: bool = True
+) -> np.ndarray:
+	"""
+	Scales surface temperature digital numbers.
+
+	:param lwir: ST_B10 (``lwir11``) digital numbers
+	:type lwir: np.ndarray
+	:param valid: Usable pixels; the others become NaN
+	:type valid: np.ndarray | None
+	:param celsius: Return degrees Celsius instead of Kelvin
+	:type celsius: bool
+	:return: Temperature as float32, NaN where masked or nodata
+	:rtype: np.ndarray
+	"""
+	offset = LST_OFFSET - KELVIN if celsius else LST_OFFSET
+	lst = lwir.astype(np.float32)
+	lst *= np.float32(LST_SCALE)
+	lst += np.float32(offset)
+
+	invalid = lwir == LST_NODATA
+	if valid is not None:
+		invalid |= ~valid
+	lst[invalid] = np.nan
+	return lst
+
+
+def mask_landsat_block(
+	qa_pixel: np.ndarray,
+	qa_radsat: np.ndarray,
+	lwir: np.ndarray,
+	ndvi: np.ndarray | None = None,
+	celsius: bool = True,
+) -> dict[str, Any]:
+	"""
+	Masks a Landsat block and computes its surface temperature in one pass.
+
+	The cloud mask is decoded once from QA_PIXEL and combined with the
+	saturation flags of each product: red/NIR for NDVI and the thermal band
+	for LST. Every step is a whole-array operation, so the cost is a few
+	passes over the block regardless of its size.
+
+	:param qa_pixel: QA_PIXEL values
+	:type qa_pixel: np.ndarray
+	:param qa_radsat: QA_RADSAT values
+	:type qa_radsat: np.ndarray
+	:param lwir: ST_B10 (``lwir11``) digital numbers
+	:type lwir: np.ndarray
+	:param ndvi: NDVI of the same block (already scaled), if any
+	:type ndvi: np.ndarray | None
+	:param celsius: Return LST in degrees Celsius instead of Kelvin
+	:type celsius: bool
+	:return: Masked ``lst`` (and ``ndvi``), the ``clear`` mask and its fraction
+	:rtype: dict[str, Any]
+	"""
+	qa_pixel = qa_pixel.astype(np.uint16, copy=False)
+	qa_radsat = qa_radsat.astype(np.uint16, copy=False)
+
+	clear = qa_mask(qa_pixel, mask_bits=QA_MASK)
+	lst_valid = clear & ((qa_radsat & LST_RADSAT_MASK) == 0)
+
+	result = {
+		"clear": clear,
+		"clear_fraction": float(clear.mean()) if clear.size else 0.0,
+		"lst": surface_temperature(lwir, lst_valid, celsius),
+	}
+
+	if ndvi is not None:
+		ndvi_valid = clear & ((qa_radsat & NDVI_RADSAT_MASK) == 0)
+		result["ndvi"] = np.where(ndvi_valid, ndvi, np.nan).astype(
+			np.float32, copy=False
+		)
+
+	return result
@@ -0,0 +1,149 @@
+import logging
+import time
+from os import getenv as env
+
+from pymongo import MongoClient
+
+import src.repos.coffee_repo as coffee_repo
+
+logger = logging.getLogger(__name__)
+
+
+def compact_coffee_time_series(batch_size: int = 500, pause_seconds: float = 0.0):
+	"""
+	Removes duplicated timestamps from the 'cafe' and 'cafe_buckets' time series.
+
+	Documents are scanned in '_id' order, batch by batch, and only the ones with
+	repeated timestamps are rewritten, keeping each series sorted and unique.
+	Every batch is a short, independent write, so the collections stay
+	available.
+
+	:param batch_size: Number of documents scanned per batch
+	:type batch_size: int
+	:param pause_seconds: Pause between batches to limit the load on Mongo
+	:type pause_seconds: float
+	:return: Scanned and modified document counts
+	:rtype: dict[str, int]
+	"""
+	client = MongoClient(env("DB_URL", "mongodb://mongo:27017/"))
+	db = client[env("DB_NAME", "campo_vertentes")]
+
+	scanned = 0
+	modified = 0
+
+	try:
+		for collection in (coffee_repo.COFFEE, coffee_repo.COFFEE_BUCKETS):
+			last_id = None
+			while True:
+				last_id, batch_scanned, batch_modified = (
+					coffee_repo.compact_points_time_series_batch(
+						db, last_id, batch_size, collection
+					)
+				)
+				if last_id is None:
+					break
+
+				scanned += batch_scanned
+				modified += batch_modified
+				logger.info(
+					f"Compaction batch of '{collection}' done "
+					f"(scanned={scanned}, modified={modified})"
+				)
+
+				if pause_seconds:
+					time.sleep(pause_seconds)
+	finally:
+		client.close()
+
+	info = {"scanned": scanned, "modified": modified}
+	logger.info(f"Compaction finished:\n{info}", extra=info)
+	return info
+
+
+def migrate_coffee_to_buckets(batch_size: int = 200, pause_seconds: float = 0.0):
+	"""
+	Copies the 'cafe' time series into the pixel x year 'cafe_buckets' layout.
+
+	Documents are read in '_id' batches and merged into their buckets by
+	timestamp, so the migration can be interrupted and re-run safely. The
+	source collection is left untouched; switch ``COFFEE_STORAGE=bucket`` once
+	it finishes. Existing buckets get their scalar pixel key before anything is
+	written (see ``coffee_repo.ensure_bucket_indexes``).
+
+	:param batch_size: Number of 'cafe' documents migrated per batch
+	:type batch_size: int
+	:param pause_seconds: Pause between batches to limit the load on Mongo
+	:type pause_seconds: float
+	:return: Migrated document and written bucket counts
+	:rtype: dict[str, int]
+	"""
+	client = MongoClient(env("DB_URL", "mongodb://mongo:27017/"))
+	db = client[env("DB_NAME", "campo_vertentes")]
+
+	last_id = None
+	migrated = 0
+	buckets = 0
+
+	try:
+		coffee_repo.ensure_bucket_indexes(db)
+
+		while docs := coffee_repo.get_points_time_series_batch(db, last_id, batch_size):
+			last_id = docs[-1]["_id"]
+			result = coffee_repo.save_buckets(db, docs)
+
+			migrated += len(docs)
+			if result:
+				buckets += result.upserted_count + result.modified_count
+			logger.info(
+				f"Migration batch done (migrated={migrated}, buckets={buckets})"
+			)
+
+			if pause_seconds:
+				time.sleep(pause_seconds)
+	finally:
+		client.close()
+
+	info = {"migrated": migrated, "buckets": buckets}
+	logger.info(f"Bucket migration finished:\n{info}", extra=info)
+	return info
+
+
+def rebuild_coffee_rollups(batch_size: int = 20, pause_seconds: float = 0.0):
+	"""
+	Recomputes every municipality rollup in 'cafe_rollups' from the time series.
+
+	Municipalities are recomputed in batches, each one an independent merge, so
+	the rebuild can be interrupted and re-run safely while the rollups stay
+	readable. ``run_wtss`` keeps them up to date afterwards.
+
+	:param batch_size: Number of municipalities recomputed per batch
+	:type batch_size: int
+	:param pause_seconds: Pause between batches to limit the load on Mongo
+	:type pause_seconds: float
+	:return: Rebuilt municipality count
+	:rtype: dict[str, int]
+	"""
+	client = MongoClient(env("DB_URL", "mongodb://mongo:27017/"))
+	db = client[env("DB_NAME", "campo_vertentes")]
+
+	rebuilt = 0
+
+	try:
+		coffee_repo.ensure_rollup_indexes(db)
+		geocodigos = coffee_repo.get_rollup_geocodigos(db)
+
+		for start in range(0, len(geocodigos), batch_size):
+			batch = geocodigos[start : start + batch_size]
+			coffee_repo.refresh_rollups(db, batch)
+
+			rebuilt += len(batch)
+			logger.info(f"Rollup batch done (rebuilt={rebuilt}/{len(geocodigos)})")
+
+			if pause_seconds:
+				time.sleep(pause_seconds)
+	finally:
+		client.close()
+
+	info = {"rebuilt": rebuilt}
+	logger.info(f"Rollup rebuild finished:\n{info}", extra=info)
+	return info
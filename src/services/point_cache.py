@@ -0,0 +1,224 @@
+"""Read-through cache of point time series lookups, keyed on the pixel grid."""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import cache
+from os import getenv as env
+from typing import Any, Hashable
+
+import bson
+from pyproj import Transformer
+
+from src.services.wtss_tiling import BDC_CRS, PIXEL_SIZE
+
+logger = logging.getLogger(__name__)
+
+POINT_CACHE_MAX_ENTRIES = int(env("POINT_CACHE_MAX_ENTRIES", "10000"))
+POINT_CACHE_MAX_BYTES = int(env("POINT_CACHE_MAX_BYTES", str(64 * 1024**2)))
+POINT_CACHE_TTL_SECONDS = int(env("POINT_CACHE_TTL_SECONDS", str(6 * 3600)))
+POINT_CACHE_REDIS_URL = env("POINT_CACHE_REDIS_URL", "")
+
+# Marca de "sem dados" no Redis (documentos BSON nunca são vazios)
+_MISS = b""
+
+
+@cache
+def _to_grid() -> Transformer:
+	return Transformer.from_crs("EPSG:4326", BDC_CRS, always_xy=True)
+
+
+def snap_to_grid(lng: float, lat: float) -> tuple[int, int]:
+	"""
+	Snaps a WGS 84 coordinate to its cell of the S2-16D-2 pixel grid.
+
+	:param lng: Longitude
+	:type lng: float
+	:param lat: Latitude
+	:type lat: float
+	:return: (column, row) of the pixel in the BDC Albers grid
+	:rtype: tuple[int, int]
+	"""
+	x, y = _to_grid().transform(lng, lat)
+	return math.floor(x / PIXEL_SIZE), math.floor(y / PIXEL_SIZE)
+
+
+@cache
+def _from_grid() -> Transformer:
+	return Transformer.from_crs(BDC_CRS, "EPSG:4326", always_xy=True)
+
+
+def snap_point(lng: float, lat: float) -> tuple[float, float]:
+	"""
+	Moves a WGS 84 coordinate to the centre of its pixel of the S2-16D-2 grid.
+
+	Geo queries made with the snapped coordinate depend only on the pixel, so
+	every coordinate of the pixel gets the same answer and can share the
+	cached lookup.
+
+	:param lng: Longitude
+	:type lng: float
+	:param lat: Latitude
+	:type lat: float
+	:return: (longitude, latitude) of the pixel centre
+	:rtype: tuple[float, float]
+	"""
+	col, row = snap_to_grid(lng, lat)
+	return _from_grid().transform((col + 0.5) * PIXEL_SIZE, (row + 0.5) * PIXEL_SIZE)
+
+
+def point_cache_key(lng: float, lat: float, *params: Hashable) -> tuple:
+	"""
+	Builds the cache key of a point lookup.
+
+	:param lng: Longitude
+	:type lng: float
+	:param lat: Latitude
+	:type lat: float
+	:param params: Other parameters of the lookup (e.g. max_distance)
+	:type params: Hashable
+	:return: Grid cell followed by the parameters
+	:rtype: tuple
+	"""
+	return (*snap_to_grid(lng, lat), *params)
+
+
+class PointCache:
+	"""
+	Two-tier TTL cache of point lookups: a per-process LRU and optionally Redis.
+
+	The local tier keeps the BSON-encoded documents, bounded by ``max_entries``
+	and by ``max_bytes`` of encoded data (64 MiB per worker process by default),
+	and evicts the least recently used lookups. Every hit decodes a new copy,
+	so callers may change the returned document freely. With ``redis_url`` results are also shared by every API
+	worker process. Misses (no pixel near the point) are cached as well, so
+	hovering over areas without coffee does not hit the database either.
+	Redis errors are logged and the lookup falls back to the database.
+	"""
+
+	def __init__(
+		self,
+		max_entries: int = POINT_CACHE_MAX_ENTRIES,
+		max_bytes: int = POINT_CACHE_MAX_BYTES,
+		ttl_seconds: int = POINT_CACHE_TTL_SECONDS,
+		redis_url: str | None = None,
+	):
+		"""
+		Initialize the cache.
+
+		:param max_entries: Maximum number of lookups kept in memory
+		:type max_entries: int
+		:param max_bytes: Maximum size of the encoded lookups kept in memory
+		:type max_bytes: int
+		:param ttl_seconds: Lifetime of the cached lookups
+		:type ttl_seconds: int
+		:param redis_url: Redis URL of the shared tier, or None for memory only
+		:type redis_url: str | None
+		"""
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.ttl_seconds = ttl_seconds
+		self._entries: OrderedDict[tuple, tuple[float, bytes]] = OrderedDict()
+		self._total_bytes = 0
+		self._lock = threading.Lock()
+		self._redis = None
+
+		if redis_url:
+			import redis.asyncio
+
+			self._redis = redis.asyncio.Redis.from_url(redis_url)
+
+	@classmethod
+	def from_env(cls) -> "PointCache":
+		"""
+		Builds the cache configured by the ``POINT_CACHE_*`` environment variables.
+
+		:return: Cache instance
+		:rtype: PointCache
+		"""
+		return cls(redis_url=POINT_CACHE_REDIS_URL or None)
+
+	@staticmethod
+	def _redis_key(key: tuple) -> str:
+		return "point:" + ":".join(str(part) for part in key)
+
+	async def get(self, key: tuple) -> tuple[bool, dict[str, Any] | None]:
+		"""
+		Looks up a cached result.
+
+		:param key: Key built by ``point_cache_key``
+		:type key: tuple
+		:return: Whether the key was found and the cached document (None for
+				 a cached miss)
+		:rtype: tuple[bool, dict[str, Any] | None]
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None:
+				expires, data = entry
+				if expires > time.monotonic():
+					self._entries.move_to_end(key)  # LRU
+					return True, self._decode(data)
+				del self._entries[key]
+				self._total_bytes -= len(data)
+
+		if self._redis is None:
+			return False, None
+
+		try:
+			data = await self._redis.get(self._redis_key(key))
+		except Exception:
+			logger.warning("Redis point cache unavailable, using the database")
+			return False, None
+
+		if data is None:
+			return False, None
+
+		self._store(key, data)
+		return True, self._decode(data)
+
+	async def set(self, key: tuple, value: dict[str, Any] | None):
+		"""
+		Caches the result of a lookup.
+
+		:param key: Key built by ``point_cache_key``
+		:type key: tuple
+		:param value: Document found, or None for a miss
+		:type value: dict[str, Any] | None
+		"""
+		data = bson.encode(value) if value is not None else _MISS
+		self._store(key, data)
+
+		if self._redis is None:
+			return
+
+		try:
+			await self._redis.set(self._redis_key(key), data, ex=self.ttl_seconds)
+		except Exception:
+			logger.warning("Redis point cache unavailable, caching locally only")
+
+	@staticmethod
+	def _decode(data: bytes) -> dict[str, Any] | None:
+		return bson.decode(data) if data != _MISS else None
+
+	def _store(self, key: tuple, data: bytes):
+		if len(data) > self.max_bytes:
+			return  # Maior que o cache inteiro: fica só no Redis
+
+		with self._lock:
+			replaced = self._entries.pop(key, None)
+			if replaced is not None:
+				self._total_bytes -= len(replaced[1])
+			self._entries[key] = (time.monotonic() + self.ttl_seconds, data)
+			self._total_bytes += len(data)
+			while (
+				len(self._entries) > self.max_entries
+				or self._total_bytes > self.max_bytes
+			):
+				_, (_, evicted) = self._entries.popitem(last=False)
+				self._total_bytes -= len(evicted)
+
+
+point_cache = PointCache.from_env()
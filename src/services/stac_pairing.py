@@ -0,0 +1,64 @@
+"""Temporal pairing of Sentinel composites with the preceding Landsat scenes."""
+
+from collections import deque
+from datetime import timedelta
+from typing import Any, Iterable, Iterator, List, NamedTuple
+
+# Cada composite do Sentinel usa as cenas Landsat dos 16 dias anteriores
+LANDSAT_WINDOW = timedelta(days=16)
+
+
+class ScenePair(NamedTuple):
+	"""A Sentinel composite and the Landsat scenes inside its window."""
+
+	sentinel: dict[str, Any]
+	landsat: List[dict[str, Any]]
+
+
+def pair_scenes(
+	sentinel_items: Iterable[dict[str, Any]],
+	landsat_items: Iterable[dict[str, Any]],
+	window: timedelta = LANDSAT_WINDOW,
+) -> Iterator[ScenePair]:
+	"""
+	Pairs each Sentinel composite with the Landsat scenes of the preceding window.
+
+	Both inputs must be sorted by ``datetime`` (as returned by the catalog
+	index). The join is a sliding window over the Landsat stream: each scene
+	enters and leaves the window once, so pairing costs O(n + m) and only the
+	scenes of the current window are kept in memory. Scenes with
+	``composite - window <= datetime <= composite`` are paired.
+
+	:param sentinel_items: Sentinel items sorted by datetime
+	:type sentinel_items: Iterable[dict[str, Any]]
+	:param landsat_items: Landsat items sorted by datetime
+	:type landsat_items: Iterable[dict[str, Any]]
+	:param window: Length of the window before each composite
+	:type window: timedelta
+	:return: One pair per Sentinel composite, in datetime order
+	:rtype: Iterator[ScenePair]
+	:raises ValueError: If an input is not sorted by datetime
+	"""
+	landsat = iter(landsat_items)
+	in_window: deque[dict[str, Any]] = deque()
+	upcoming = next(landsat, None)
+	last_composite = None
+
+	for item in sentinel_items:
+		composite = item["datetime"]
+		if last_composite is not None and composite < last_composite:
+			raise ValueError("Sentinel items must be sorted by datetime")
+		last_composite = composite
+
+		# Entram as cenas até a data do composite...
+		while upcoming is not None and upcoming["datetime"] <= composite:
+			if in_window and upcoming["datetime"] < in_window[-1]["datetime"]:
+				raise ValueError("Landsat items must be sorted by datetime")
+			in_window.append(upcoming)
+			upcoming = next(landsat, None)
+
+		# ...e saem as anteriores ao início da janela
+		while in_window and in_window[0]["datetime"] < composite - window:
+			in_window.popleft()
+
+		yield ScenePair(item, list(in_window))
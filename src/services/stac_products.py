@@ -0,0 +1,395 @@
+"""Derived NDVI/LST rasters written as Cloud-Optimized GeoTIFF mosaics."""
+
+import logging
+import math
+import os
+import tempfile
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+from rasterio.windows import bounds as window_bounds
+
+from src.services.landsat_qa import LST_NODATA, QA_FILL, mask_landsat_block
+from src.services.stac_raster import (
+	CHUNK_SIZE,
+	GDAL_OPTIONS,
+	NDVI_RANGE,
+	band_scaling,
+	check_range,
+	get_cog_opener,
+	iter_chunks,
+)
+from src.services.wtss_tiling import BDC_CRS
+
+logger = logging.getLogger(__name__)
+
+# Blocos internos dos COGs gerados (e das leituras/escritas em partes)
+BLOCK_SIZE = 512
+
+# Opções do driver COG: overviews por média, compressão sem perdas
+COG_OPTIONS = {
+	"COMPRESS": "DEFLATE",
+	"PREDICTOR": "YES",
+	"BLOCKSIZE": str(BLOCK_SIZE),
+	"OVERVIEWS": "AUTO",
+	"RESAMPLING": "AVERAGE",
+	"BIGTIFF": "IF_SAFER",
+	"NUM_THREADS": "ALL_CPUS",
+}
+
+# Configuração do ImageMosaic do GeoServer: a data vem do nome do arquivo
+MOSAIC_FILES = {
+	"timeregex.properties": "regex=[0-9]{8}\n",
+	"indexer.properties": (
+		"TimeAttribute=ingestion\n"
+		"Schema=*the_geom:Polygon,location:String,ingestion:java.util.Date\n"
+		"PropertyCollectors=TimestampFileNameExtractorSPI[timeregex](ingestion)\n"
+	),
+}
+
+
+class RasterProduct(NamedTuple):
+	"""Encoding of a derived raster product."""
+
+	name: str
+	resolution: float
+	dtype: str
+	nodata: float
+	scale: float = 1.0
+
+
+class ProductGrid(NamedTuple):
+	"""Output pixel grid shared by every composite of a product."""
+
+	crs: str
+	transform: Affine
+	width: int
+	height: int
+
+
+class LandsatScene(NamedTuple):
+	"""Asset hrefs of a Landsat scene used for LST."""
+
+	item_id: str
+	qa_pixel: str
+	qa_radsat: str
+	lwir: str
+
+
+NDVI_PRODUCT = RasterProduct("ndvi", 10.0, "int16", -9999, 0.0001)
+LST_PRODUCT = RasterProduct("lst", 30.0, "float32", -9999)
+
+
+def product_grid(
+	bbox: tuple[float, float, float, float], resolution: float, crs: str = BDC_CRS
+) -> ProductGrid:
+	"""
+	Computes the grid covering a WGS 84 bounding box, snapped to the resolution.
+
+	Snapping keeps the pixels of every composite aligned, so the files of a
+	product stack into a single mosaic.
+
+	:param bbox: (min lon, min lat, max lon, max lat)
+	:type bbox: tuple[float, float, float, float]
+	:param resolution: Pixel size in CRS units
+	:type resolution: float
+	:param crs: Output CRS
+	:type crs: str
+	:return: Grid of the product
+	:rtype: ProductGrid
+	"""
+	left, bottom, right, top = transform_bounds("EPSG:4326", crs, *bbox)
+	left = math.floor(left / resolution) * resolution
+	bottom = math.floor(bottom / resolution) * resolution
+	right = math.ceil(right / resolution) * resolution
+	top = math.ceil(top / resolution) * resolution
+
+	return ProductGrid(
+		crs,
+		Affine(resolution, 0, left, 0, -resolution, top),
+		round((right - left) / resolution),
+		round((top - bottom) / resolution),
+	)
+
+
+def product_path(
+	output_dir: str | Path, product: RasterProduct, date: datetime
+) -> Path:
+	"""
+	Path of the file of a product for a composite date.
+
+	:param output_dir: Root directory of the products
+	:type output_dir: str | Path
+	:param product: Raster product
+	:type product: RasterProduct
+	:param date: Composite date
+	:type date: datetime
+	:return: ``<output_dir>/<product>/<product>_<YYYYMMDD>.tif``
+	:rtype: Path
+	"""
+	return Path(output_dir) / product.name / f"{product.name}_{date:%Y%m%d}.tif"
+
+
+def _open(
+	stack: ExitStack,
+	href: str,
+	grid: ProductGrid,
+	resampling: Resampling,
+	raster_bands: List[dict[str, Any]] | None = None,
+):
+	"""Opens an asset warped onto the product grid, with its bounds and scaling."""
+	opener = get_cog_opener() if href.startswith(("http://", "https://")) else None
+	dataset = stack.enter_context(rasterio.open(href, opener=opener))
+	vrt = stack.enter_context(
+		WarpedVRT(
+			dataset,
+			crs=grid.crs,
+			transform=grid.transform,
+			width=grid.width,
+			height=grid.height,
+			resampling=resampling,
+		)
+	)
+	bounds = transform_bounds(dataset.crs, grid.crs, *dataset.bounds)
+	return vrt, bounds, *band_scaling(dataset, raster_bands)
+
+
+def _overlaps(a: tuple, b: tuple) -> bool:
+	return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _encode(values: np.ndarray, product: RasterProduct) -> np.ndarray:
+	"""Encodes float values (NaN as missing) into the product dtype."""
+	missing = ~np.isfinite(values)
+	if product.scale != 1.0:
+		values = np.round(values / product.scale)
+	values = np.where(missing, product.nodata, values)
+	return values.astype(product.dtype)
+
+
+def write_cog(
+	path: Path,
+	product: RasterProduct,
+	grid: ProductGrid,
+	compute_chunk: Callable[[Window], np.ndarray],
+	chunk_size: int = CHUNK_SIZE,
+):
+	"""
+	Writes a product as an internally tiled COG with overviews.
+
+	The grid is filled chunk by chunk into a temporary tiled GeoTIFF, then
+	copied with the COG driver, which builds the overviews. The file only
+	appears at ``path`` when complete.
+
+	:param path: Output file
+	:type path: Path
+	:param product: Raster product
+	:type product: RasterProduct
+	:param grid: Output grid
+	:type grid: ProductGrid
+	:param compute_chunk: Function returning the values of a grid window
+	:type compute_chunk: Callable[[Window], np.ndarray]
+	:param chunk_size: Approximate chunk side in pixels
+	:type chunk_size: int
+	"""
+	path.parent.mkdir(parents=True, exist_ok=True)
+	for name, content in MOSAIC_FILES.items():
+		config = path.parent / name
+		if not config.exists():
+			config.write_text(content)
+
+	profile = {
+		"driver": "GTiff",
+		"dtype": product.dtype,
+		"nodata": product.nodata,
+		"count": 1,
+		"crs": grid.crs,
+		"transform": grid.transform,
+		"width": grid.width,
+		"height": grid.height,
+		"tiled": True,
+		"blockxsize": BLOCK_SIZE,
+		"blockysize": BLOCK_SIZE,
+		"compress": "DEFLATE",
+		"zlevel": 1,
+		"bigtiff": "IF_SAFER",
+	}
+
+	# Temporários no mesmo diretório: o os.replace final é atômico
+	fd, staging = tempfile.mkstemp(dir=path.parent, suffix=".staging.tif")
+	os.close(fd)
+	fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+	os.close(fd)
+
+	try:
+		with rasterio.open(staging, "w", **profile) as dst:
+			dst.scales = (product.scale,)
+			full = Window(0, 0, grid.width, grid.height)
+			for chunk in iter_chunks(full, (BLOCK_SIZE, BLOCK_SIZE), chunk_size):
+				dst.write(_encode(compute_chunk(chunk), product), 1, window=chunk)
+
+		rasterio.shutil.copy(staging, tmp, driver="COG", **COG_OPTIONS)
+		os.replace(tmp, path)
+	finally:
+		for leftover in (staging, tmp):
+			Path(leftover).unlink(missing_ok=True)
+
+
+def write_ndvi(
+	path: Path,
+	assets: List[dict[str, Any]],
+	grid: ProductGrid,
+	product: RasterProduct = NDVI_PRODUCT,
+):
+	"""
+	Mosaics the NDVI assets of a composite date onto the product grid.
+
+	Each chunk only reads the assets whose footprint overlaps it; where
+	assets overlap, the first valid value is kept. Scaled values outside
+	[-1, 1] abort the write (see ``check_range``).
+
+	:param path: Output file
+	:type path: Path
+	:param assets: NDVI assets of the date (``href`` and ``raster_bands``)
+	:type assets: List[dict[str, Any]]
+	:param grid: Output grid
+	:type grid: ProductGrid
+	:param product: Raster product
+	:type product: RasterProduct
+	"""
+	with rasterio.Env(**GDAL_OPTIONS), ExitStack() as stack:
+		sources = [
+			(
+				asset["href"],
+				*_open(
+					stack,
+					asset["href"],
+					grid,
+					Resampling.nearest,
+					asset.get("raster_bands"),
+				),
+			)
+			for asset in assets
+		]
+
+		def compute_chunk(chunk: Window) -> np.ndarray:
+			values = np.full((int(chunk.height), int(chunk.width)), np.nan)
+			chunk_bounds = window_bounds(chunk, grid.transform)
+			for href, vrt, bounds, scale, offset in sources:
+				if not _overlaps(chunk_bounds, bounds):
+					continue
+				data = vrt.read(1, window=chunk, masked=True)
+				scaled = data.astype("float64").filled(np.nan) * scale + offset
+				check_range(scaled, NDVI_RANGE, href)
+				np.copyto(values, scaled, where=np.isnan(values))
+			return values
+
+		write_cog(path, product, grid, compute_chunk)
+
+
+def write_lst(
+	path: Path,
+	scenes: List[LandsatScene],
+	grid: ProductGrid,
+	product: RasterProduct = LST_PRODUCT,
+):
+	"""
+	Composites the surface temperature of the Landsat scenes of a date.
+
+	Each scene is cloud/saturation masked with its QA bands and the valid
+	temperatures (°C) are averaged per pixel.
+
+	:param path: Output file
+	:type path: Path
+	:param scenes: Landsat scenes paired with the composite
+	:type scenes: List[LandsatScene]
+	:param grid: Output grid
+	:type grid: ProductGrid
+	:param product: Raster product
+	:type product: RasterProduct
+	"""
+	with rasterio.Env(**GDAL_OPTIONS), ExitStack() as stack:
+		sources = [
+			(
+				_open(stack, scene.qa_pixel, grid, Resampling.nearest),
+				_open(stack, scene.qa_radsat, grid, Resampling.nearest),
+				_open(stack, scene.lwir, grid, Resampling.nearest),
+			)
+			for scene in scenes
+		]
+
+		def compute_chunk(chunk: Window) -> np.ndarray:
+			shape = (int(chunk.height), int(chunk.width))
+			sums = np.zeros(shape)
+			counts = np.zeros(shape, dtype=np.int32)
+			chunk_bounds = window_bounds(chunk, grid.transform)
+
+			for qa_pixel, qa_radsat, lwir in sources:
+				if not _overlaps(chunk_bounds, lwir[1]):
+					continue
+				# Fora da cena: QA de preenchimento e LST sem dado
+				lst = mask_landsat_block(
+					qa_pixel[0].read(1, window=chunk, masked=True).filled(QA_FILL),
+					qa_radsat[0].read(1, window=chunk, masked=True).filled(0),
+					lwir[0].read(1, window=chunk, masked=True).filled(LST_NODATA),
+				)["lst"]
+				valid = np.isfinite(lst)
+				sums[valid] += lst[valid]
+				counts += valid
+
+			with np.errstate(invalid="ignore", divide="ignore"):
+				return np.where(counts > 0, sums / counts, np.nan)
+
+		write_cog(path, product, grid, compute_chunk)
+
+
+def write_composite(
+	output_dir: str | Path,
+	date: datetime,
+	bbox: tuple[float, float, float, float],
+	ndvi_assets: List[dict[str, Any]],
+	scenes: List[LandsatScene],
+) -> List[Path]:
+	"""
+	Writes the missing products of a composite date.
+
+	Products already on disk are kept, so reruns only write new dates.
+
+	:param output_dir: Root directory of the products
+	:type output_dir: str | Path
+	:param date: Composite date
+	:type date: datetime
+	:param bbox: WGS 84 bounding box of the products
+	:type bbox: tuple[float, float, float, float]
+	:param ndvi_assets: NDVI assets of the date (``href`` and ``raster_bands``)
+	:type ndvi_assets: List[dict[str, Any]]
+	:param scenes: Landsat scenes paired with the date
+	:type scenes: List[LandsatScene]
+	:return: Files written
+	:rtype: List[Path]
+	"""
+	written = []
+
+	ndvi_path = product_path(output_dir, NDVI_PRODUCT, date)
+	if ndvi_assets and not ndvi_path.exists():
+		write_ndvi(ndvi_path, ndvi_assets, product_grid(bbox, NDVI_PRODUCT.resolution))
+		written.append(ndvi_path)
+
+	lst_path = product_path(output_dir, LST_PRODUCT, date)
+	if scenes and not lst_path.exists():
+		write_lst(lst_path, scenes, product_grid(bbox, LST_PRODUCT.resolution))
+		written.append(lst_path)
+
+	for path in written:
+		logger.info(f"Wrote {path}")
+	return written
@@ -0,0 +1,317 @@
+"""Windowed reads of Cloud-Optimized GeoTIFF assets and streaming zonal statistics."""
+
+import logging
+import math
+from functools import cache
+from os import getenv as env
+from typing import Any, Iterator, List
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.features import rasterize
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+from shapely.geometry import box
+
+from src.services.cog_cache import BlockCache, CachedOpener
+
+logger = logging.getLogger(__name__)
+
+# Leituras HTTP por faixa de bytes, sem listar diretórios no servidor
+GDAL_OPTIONS = {
+	"GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+	"CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.tiff",
+	"GDAL_HTTP_MULTIRANGE": "YES",
+	"GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+	"VSI_CACHE": "TRUE",
+}
+CHUNK_SIZE = int(env("STAC_CHUNK_SIZE", "2048"))
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Histogramas de NDVI: 0.001 de resolução em [-1, 1]
+NDVI_BINS = np.linspace(-1.0, 1.0, 2001)
+NDVI_RANGE = (-1.0, 1.0)
+
+
+@cache
+def get_cog_opener() -> CachedOpener | None:
+	"""
+	Builds the cached COG opener once per process.
+
+	:return: Opener backed by ``COG_CACHE_DIR``, or None when caching is disabled
+	:rtype: CachedOpener | None
+	"""
+	block_cache = BlockCache.from_env()
+	return CachedOpener(block_cache) if block_cache else None
+
+
+def band_scaling(
+	dataset: rasterio.DatasetReader, raster_bands: List[dict[str, Any]] | None = None
+) -> tuple[float, float]:
+	"""
+	Gets the scale and offset of the first band of an asset.
+
+	The GeoTIFF tags are used when set; untagged assets fall back to the STAC
+	``raster:bands`` metadata of the asset.
+
+	:param dataset: Open raster dataset
+	:type dataset: rasterio.DatasetReader
+	:param raster_bands: ``raster:bands`` of the STAC asset, if any
+	:type raster_bands: List[dict[str, Any]] | None
+	:return: (scale, offset)
+	:rtype: tuple[float, float]
+	"""
+	scale, offset = dataset.scales[0], dataset.offsets[0]
+	if (scale, offset) == (1.0, 0.0) and raster_bands:
+		band = raster_bands[0]
+		scale, offset = band.get("scale", 1.0), band.get("offset", 0.0)
+	return scale, offset
+
+
+def check_range(values: np.ndarray, valid_range: tuple[float, float] | None, href: str):
+	"""
+	Fails when scaled values fall outside the valid range of the band.
+
+	Catches assets whose scale is missing from both the GeoTIFF tags and the
+	STAC metadata, whose raw values would otherwise be aggregated as if scaled.
+
+	:param values: Scaled values (NaN where missing)
+	:type values: np.ndarray
+	:param valid_range: (min, max) of the band, or None to skip the check
+	:type valid_range: tuple[float, float] | None
+	:param href: URL or path of the asset, for the error message
+	:type href: str
+	:raises ValueError: If a value is outside the range (1% tolerance)
+	"""
+	if valid_range is None:
+		return
+
+	low, high = valid_range
+	tolerance = (high - low) * 0.01
+	finite = values[np.isfinite(values)]
+	if finite.size and (
+		finite.min() < low - tolerance or finite.max() > high + tolerance
+	):
+		raise ValueError(
+			f"Scaled values of {href} span [{finite.min():g}, {finite.max():g}], "
+			f"outside {valid_range}; the asset scale/offset is probably missing"
+		)
+
+
+def bbox_window(
+	dataset: rasterio.DatasetReader, bbox: tuple[float, float, float, float]
+) -> Window | None:
+	"""
+	Computes the pixel window of a WGS 84 bounding box inside a dataset.
+
+	:param dataset: Open raster dataset
+	:type dataset: rasterio.DatasetReader
+	:param bbox: (min lon, min lat, max lon, max lat)
+	:type bbox: tuple[float, float, float, float]
+	:return: Window clipped to the dataset, or None if they do not overlap
+	:rtype: Window | None
+	"""
+	bounds = transform_bounds("EPSG:4326", dataset.crs, *bbox)
+	window = from_bounds(*bounds, transform=dataset.transform)
+	col_start, row_start = math.floor(window.col_off), math.floor(window.row_off)
+	col_stop = math.ceil(window.col_off + window.width)
+	row_stop = math.ceil(window.row_off + window.height)
+	window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+	try:
+		return window.intersection(Window(0, 0, dataset.width, dataset.height))
+	except rasterio.errors.WindowError:
+		return None
+
+
+def iter_chunks(
+	window: Window, block_shape: tuple[int, int], chunk_size: int = CHUNK_SIZE
+) -> Iterator[Window]:
+	"""
+	Splits a window into chunks aligned to the internal tiles of the dataset.
+
+	Aligned chunks make each read touch whole COG tiles, i.e. a few byte ranges.
+
+	:param window: Window to be split
+	:type window: Window
+	:param block_shape: (rows, cols) of the internal tiles
+	:type block_shape: tuple[int, int]
+	:param chunk_size: Approximate chunk side in pixels
+	:type chunk_size: int
+	:return: Chunk windows covering ``window``
+	:rtype: Iterator[Window]
+	"""
+	block_rows, block_cols = block_shape
+	rows = max(1, chunk_size // block_rows) * block_rows
+	cols = max(1, chunk_size // block_cols) * block_cols
+
+	row_start, col_start = int(window.row_off), int(window.col_off)
+	row_stop, col_stop = row_start + int(window.height), col_start + int(window.width)
+
+	for row in range(row_start - row_start % rows, row_stop, rows):
+		for col in range(col_start - col_start % cols, col_stop, cols):
+			top, left = max(row, row_start), max(col, col_start)
+			bottom, right = min(row + rows, row_stop), min(col + cols, col_stop)
+			yield Window(left, top, right - left, bottom - top)
+
+
+class ZonalHistogram:
+	"""
+	Streaming zonal statistics accumulated as per-zone histograms.
+
+	Counts and sums are exact; medians and percentiles are read from the
+	histograms, with the resolution of ``bins``. Memory depends only on the
+	number of zones and bins, not on the raster size.
+	"""
+
+	def __init__(self, zones: List[str], bins: np.ndarray = NDVI_BINS):
+		"""
+		Initialize the accumulators.
+
+		:param zones: Zone names (e.g. geocodigos), indexed by zone label
+		:type zones: List[str]
+		:param bins: Histogram bin edges
+		:type bins: np.ndarray
+		"""
+		self.zones = zones
+		self.bins = bins
+		self.counts = np.zeros((len(zones), len(bins) - 1), dtype=np.int64)
+		self.sums = np.zeros(len(zones))
+
+	def add(self, labels: np.ndarray, values: np.ndarray):
+		"""
+		Accumulates a chunk.
+
+		:param labels: Zone label of each pixel (-1 outside every zone)
+		:type labels: np.ndarray
+		:param values: Pixel values (NaN for missing data)
+		:type values: np.ndarray
+		"""
+		valid = (labels >= 0) & np.isfinite(values)
+		labels, values = labels[valid], values[valid]
+		if not labels.size:
+			return
+
+		n_bins = len(self.bins) - 1
+		indexes = np.clip(
+			np.searchsorted(self.bins, values, "right") - 1, 0, n_bins - 1
+		)
+		self.counts += np.bincount(
+			labels * n_bins + indexes, minlength=self.counts.size
+		).reshape(self.counts.shape)
+		self.sums += np.bincount(labels, weights=values, minlength=len(self.zones))
+
+	def summary(self) -> dict[str, dict[str, float]]:
+		"""
+		Computes the statistics of each zone with data.
+
+		:return: Count, mean, median and percentiles by zone
+		:rtype: dict[str, dict[str, float]]
+		"""
+		centers = (self.bins[:-1] + self.bins[1:]) / 2
+		totals = self.counts.sum(axis=1)
+		cumulative = self.counts.cumsum(axis=1)
+
+		stats = {}
+		for i in np.flatnonzero(totals):
+			zone = {
+				"count": int(totals[i]),
+				"mean": float(self.sums[i] / totals[i]),
+			}
+			for q in PERCENTILES:
+				rank = np.searchsorted(cumulative[i], q / 100 * totals[i])
+				key = "median" if q == 50 else f"p{q}"
+				zone[key] = round(float(centers[min(rank, len(centers) - 1)]), 6)
+			stats[self.zones[i]] = zone
+		return stats
+
+
+def zonal_statistics(
+	href: str,
+	zones: gpd.GeoDataFrame,
+	bbox: tuple[float, float, float, float],
+	zone_column: str = "CD_MUN",
+	bins: np.ndarray = NDVI_BINS,
+	chunk_size: int = CHUNK_SIZE,
+	raster_bands: List[dict[str, Any]] | None = None,
+	valid_range: tuple[float, float] | None = NDVI_RANGE,
+) -> dict[str, Any]:
+	"""
+	Computes per-zone statistics of a single-band COG inside a bounding box.
+
+	Only the window of ``bbox`` is read, chunk by chunk and aligned to the COG
+	tiles, so remote assets are fetched through HTTP range requests and a
+	full scene is never held in memory. Values are scaled with the dataset
+	scale/offset (or the STAC ``raster:bands`` ones, see ``band_scaling``),
+	checked against ``valid_range`` and nodata pixels are ignored. With ``COG_CACHE_DIR`` set,
+	remote byte ranges go through the local block cache. ``href`` may also be a
+	local file path.
+
+	:param href: URL or path of the asset
+	:type href: str
+	:param zones: Zone polygons (e.g. municipalities)
+	:type zones: gpd.GeoDataFrame
+	:param bbox: WGS 84 bounding box to read
+	:type bbox: tuple[float, float, float, float]
+	:param zone_column: Column with the zone names
+	:type zone_column: str
+	:param bins: Histogram bin edges of the values
+	:type bins: np.ndarray
+	:param chunk_size: Approximate chunk side in pixels
+	:type chunk_size: int
+	:param raster_bands: ``raster:bands`` of the STAC asset, if any
+	:type raster_bands: List[dict[str, Any]] | None
+	:param valid_range: (min, max) of the scaled values, or None to skip the check
+	:type valid_range: tuple[float, float] | None
+	:return: Statistics by zone and the number of pixels read
+	:rtype: dict[str, Any]
+	:raises ValueError: If the scaled values fall outside ``valid_range``
+	"""
+	# Uma zona por nome, mesmo que venha em vários polígonos
+	zones = zones[[zone_column, zones.geometry.name]].dissolve(
+		by=zone_column, as_index=False
+	)
+
+	# Assets remotos passam pelo cache de blocos, se habilitado
+	opener = get_cog_opener() if href.startswith(("http://", "https://")) else None
+
+	with (
+		rasterio.Env(**GDAL_OPTIONS),
+		rasterio.open(href, opener=opener) as dataset,
+	):
+		names = zones[zone_column].astype(str).tolist()
+		histogram = ZonalHistogram(names, bins)
+
+		window = bbox_window(dataset, bbox)
+		if window is None:
+			return {"zones": {}, "pixels": 0}
+
+		zones = zones.to_crs(dataset.crs)
+		geometries = zones.geometry.to_numpy()
+		scale, offset = band_scaling(dataset, raster_bands)
+		pixels = 0
+
+		for chunk in iter_chunks(window, dataset.block_shapes[0], chunk_size):
+			transform = dataset.window_transform(chunk)
+			hits = zones.sindex.query(
+				box(*rasterio.windows.bounds(chunk, dataset.transform))
+			)
+			if not hits.size:
+				continue
+
+			labels = rasterize(
+				zip(geometries[hits], hits),
+				out_shape=(int(chunk.height), int(chunk.width)),
+				transform=transform,
+				fill=-1,
+				dtype="int32",
+			)
+			data = dataset.read(1, window=chunk, masked=True)
+			values = data.astype("float64").filled(np.nan) * scale + offset
+			check_range(values, valid_range, href)
+
+			histogram.add(labels, values)
+			pixels += data.size
+
+	return {"zones": histogram.summary(), "pixels": pixels}
@@ -1,38 +1,466 @@
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from itertools import groupby
+from os import getenv as env
+from typing import Any, Iterable, Iterator, List
+
 import geopandas as gpd
 import pystac_client
+from pymongo import MongoClient
+from pymongo.database import Database
+
+import src.repos.stac_repo as stac_repo
+from src.services.stac_pairing import LANDSAT_WINDOW, pair_scenes
+from src.services.stac_products import LandsatScene, write_composite
+from src.services.stac_raster import zonal_statistics
+from src.utils.executors import ordered_apply, start_process_pool
+
+logger = logging.getLogger(__name__)
+
+STAC_URL = env("STAC_URL", "https://data.inpe.br/bdc/stac/v1/")
+SENTINEL = "S2-16D-2"
+LANDSAT = "landsat-2"
+COLLECTIONS = (SENTINEL, LANDSAT)
+PAGE_SIZE = int(env("STAC_PAGE_SIZE", "100"))
+MAX_WORKERS = int(env("STAC_MAX_WORKERS", str(os.cpu_count() or 1)))
+MAX_TASKS_PER_CHILD = int(env("STAC_MAX_TASKS_PER_CHILD", "20"))
 
 BBOX = (-45.51276312, -21.43537497, -43.98822504, -20.47079601)
 BAND = "NDVI"
 LST = "lwir11"
 QA = "qa_pixel"
 QA_RADSAT = "qa_radsat"
-OUTPUT_DIR = ""
+OUTPUT_DIR = env("STAC_OUTPUT_DIR", "")
 
+# Parâmetros do job em cada processo do pool (ver _init_worker)
+_worker_zones: gpd.GeoDataFrame | None = None
+_worker_band: str = BAND
 
-def run_stac(gdf: gpd.GeoDataFrame, start_date: str, end_date: str):
+
+def parse_datetime(value: str) -> datetime:
 	"""
-	Função para processar imagens via STAC.
+	Parses an RFC 3339 datetime from a STAC item into a naive UTC datetime.
+
+	:param value: Datetime string, e.g. "2024-01-01T00:00:00Z"
+	:type value: str
+	:return: Naive datetime in UTC, as stored by Mongo
+	:rtype: datetime
+	"""
+	parsed = datetime.fromisoformat(value)
+	if parsed.tzinfo is not None:
+		parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+	return parsed
+
+
+def item_document(feature: dict[str, Any]) -> dict[str, Any]:
+	"""
+	Converts a STAC item (GeoJSON feature) into a catalog document.
+
+	:param feature: STAC item as returned by the API
+	:type feature: dict[str, Any]
+	:return: Document for 'stac_items'
+	:rtype: dict[str, Any]
+	"""
+	properties = feature.get("properties", {})
+	return {
+		"collection": feature["collection"],
+		"item_id": feature["id"],
+		"datetime": parse_datetime(properties["datetime"]),
+		"bbox": feature.get("bbox"),
+		"geometry": feature.get("geometry"),
+		"properties": properties,
+		"assets": {
+			key: {
+				"href": asset["href"],
+				"type": asset.get("type"),
+				"roles": asset.get("roles", []),
+				# Escala/offset/nodata das bandas (extensão raster do STAC)
+				"raster_bands": asset.get("raster:bands"),
+			}
+			for key, asset in feature.get("assets", {}).items()
+		},
+	}
+
+
+def search_start(
+	start: datetime, end: datetime, latest: datetime | None, incremental: bool = True
+) -> datetime | None:
+	"""
+	Picks the start of the STAC search of a collection.
+
+	The search resumes from the newest catalogued item only when it falls inside
+	the requested window; a backfill (window ending before it) or a window
+	starting after it searches from ``start``.
+
+	:param start: Start of the requested window
+	:type start: datetime
+	:param end: End of the requested window
+	:type end: datetime
+	:param latest: Datetime of the newest catalogued item, if any
+	:type latest: datetime | None
+	:param incremental: Resume from the newest catalogued item
+	:type incremental: bool
+	:return: Start of the search, or None if there is nothing to search
+	:rtype: datetime | None
+	"""
+	since = latest if incremental and latest and start <= latest <= end else start
+	return since if since <= end else None
+
+
+def sync_stac_catalog(
+	db: Database,
+	start_date: str,
+	end_date: str,
+	collections: List[str] = COLLECTIONS,
+	incremental: bool = True,
+) -> dict[str, int]:
+	"""
+	Pages through the STAC API and upserts the items into the local catalog.
+
+	Items are streamed page by page, so memory stays bounded regardless of the
+	window. In incremental mode each collection is only searched from its newest
+	catalogued item on, when it falls inside the window, making discovery
+	proportional to the new items (see ``search_start``).
+
+	:param db: The database connection
+	:type db: Database
+	:param start_date: Start date (YYYY-MM-DD)
+	:type start_date: str
+	:param end_date: End date (YYYY-MM-DD), inclusive
+	:type end_date: str
+	:param collections: STAC collection ids
+	:type collections: List[str]
+	:param incremental: Resume from the newest catalogued item of each collection
+	:type incremental: bool
+	:return: Number of items upserted per collection
+	:rtype: dict[str, int]
 	"""
-	service = pystac_client.Client.open("https://data.inpe.br/bdc/stac/v1/")
+	service = pystac_client.Client.open(STAC_URL)
+	start = datetime.fromisoformat(start_date)
+	end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+
+	stac_repo.ensure_stac_indexes(db)
+
+	counts = {}
+	for collection in collections:
+		latest = stac_repo.get_latest_item_datetime(db, collection)
+		since = search_start(start, end, latest, incremental)
+
+		counts[collection] = 0
+		if since is None:
+			continue
+
+		# O item mais recente é buscado de novo (upsert idempotente)
+		item_search = service.search(
+			collections=[collection],
+			bbox=BBOX,
+			datetime=f"{since:%Y-%m-%dT%H:%M:%S}Z/{end:%Y-%m-%dT%H:%M:%S}Z",
+			limit=PAGE_SIZE,
+		)
+
+		for page in item_search.pages_as_dicts():
+			docs = [item_document(feature) for feature in page.get("features", [])]
+			stac_repo.upsert_stac_items(db, docs)
+			counts[collection] += len(docs)
+
+		logger.info(
+			f"Catalogued {counts[collection]} '{collection}' items since {since:%Y-%m-%d}"
+		)
+
+	return counts
 
-	item_search = service.search(
-		collections=["S2-16D-2", "landsat-2"],
-		bbox=BBOX,
-		datetime=f"{start_date}/{end_date}",
+
+def item_zonal_stats(
+	item: dict[str, Any], zones: gpd.GeoDataFrame, band: str = BAND
+) -> List[dict[str, Any]]:
+	"""
+	Computes the per-municipality statistics of a band of a catalogued item.
+
+	The ids of the Landsat scenes paired with the composite are kept with the
+	statistics.
+
+	:param item: Item document from 'stac_items', with its ``landsat`` scenes
+	:type item: dict[str, Any]
+	:param zones: Municipality polygons with a ``CD_MUN`` column
+	:type zones: gpd.GeoDataFrame
+	:param band: Asset key of the band
+	:type band: str
+	:return: One statistics document per municipality
+	:rtype: List[dict[str, Any]]
+	"""
+	asset = item["assets"][band]
+	result = zonal_statistics(
+		asset["href"], zones, BBOX, raster_bands=asset.get("raster_bands")
 	)
+	landsat_ids = [scene["item_id"] for scene in item.get("landsat", [])]
+	return [
+		{
+			"collection": item["collection"],
+			"item_id": item["item_id"],
+			"datetime": item["datetime"],
+			"band": band,
+			"geocodigo": geocodigo,
+			"landsat_items": landsat_ids,
+			**stats,
+		}
+		for geocodigo, stats in result["zones"].items()
+	]
+
+
+def _init_worker(zones: gpd.GeoDataFrame, band: str):
+	"""Keeps the job parameters in the worker process (sent once, not per item)."""
+	global _worker_zones, _worker_band
+	_worker_zones, _worker_band = zones, band
+
+
+def process_item(item: dict[str, Any]) -> dict[str, Any]:
+	"""
+	Processes a catalogued item, measuring its wall and CPU time.
 
-	# For now, just log the number and IDs: properties of the items found
-	items = list(item_search.items())
-	items.sort(key=lambda x: x.properties["datetime"])
+	Runs in the pool workers, with the zones set by ``_init_worker``.
 
-	# TODO: Ajustar busca de imagens (landsat deve pegar de 16 dias anteriores ao datetime do Sentinel)
-	if items:
-		last_date = items[-1].properties["datetime"]
-		print(f"Last date available: {last_date}")
-		print(f"Found {len(items)} items between {start_date} and {end_date}.")
+	:param item: Item document from 'stac_items'
+	:type item: dict[str, Any]
+	:return: Statistics documents (or the error) and timings of the item
+	:rtype: dict[str, Any]
+	"""
+	wall_start, cpu_start = time.perf_counter(), time.process_time()
+	result = {"item_id": item["item_id"], "datetime": item["datetime"]}
+
+	try:
+		result["docs"] = item_zonal_stats(item, _worker_zones, _worker_band)
+	except Exception as e:
+		logger.exception(f"Error processing item {item['item_id']}")
+		result["error"] = str(e)
+
+	result["wall_seconds"] = round(time.perf_counter() - wall_start, 3)
+	result["cpu_seconds"] = round(time.process_time() - cpu_start, 3)
+	return result
+
+
+def process_items(
+	items: Iterable[dict[str, Any]],
+	zones: gpd.GeoDataFrame,
+	band: str = BAND,
+	max_workers: int = MAX_WORKERS,
+) -> Iterator[dict[str, Any]]:
+	"""
+	Processes items in a process pool, yielding results in input order.
+
+	The pool comes from ``start_process_pool``, so it also runs inside Celery
+	workers. At most two items per worker are in flight and workers are
+	recycled after ``STAC_MAX_TASKS_PER_CHILD`` items, which bounds the memory
+	of each one. Falls back to processing in-process when ``max_workers`` is 1
+	or the pool cannot be started.
+
+	:param items: Item documents, in the order results are wanted
+	:type items: Iterable[dict[str, Any]]
+	:param zones: Municipality polygons with a ``CD_MUN`` column
+	:type zones: gpd.GeoDataFrame
+	:param band: Asset key of the band
+	:type band: str
+	:param max_workers: Number of worker processes
+	:type max_workers: int
+	:return: Results of ``process_item``
+	:rtype: Iterator[dict[str, Any]]
+	"""
+	pool = start_process_pool(
+		max_workers,
+		initializer=_init_worker,
+		initargs=(zones, band),
+		maxtasksperchild=MAX_TASKS_PER_CHILD,
+	)
+
+	if pool is None:
+		_init_worker(zones, band)
 		for item in items:
-			print(f"Item ID: {item.id}")
-			for p in item.properties:
-				print(f"  {p}: {item.properties[p]}")
+			yield process_item(item)
+		return
+
+	# Ao sair (inclusive no meio), o pool é encerrado e a fila descartada
+	with pool:
+		yield from ordered_apply(pool, process_item, items, 2 * max_workers)
+
+
+def write_products(
+	db: Database,
+	start: datetime,
+	end: datetime,
+	output_dir: str = OUTPUT_DIR,
+) -> tuple[int, List[dict[str, Any]]]:
+	"""
+	Writes the NDVI/LST COGs of every composite date missing from ``output_dir``.
+
+	The NDVI tiles of a date are mosaicked over ``BBOX`` and the LST is
+	composited from the Landsat scenes paired with it. Dates already on disk
+	are skipped, so each run only writes the new composites.
+
+	:param db: The database connection
+	:type db: Database
+	:param start: Start of the datetime range
+	:type start: datetime
+	:param end: End of the datetime range
+	:type end: datetime
+	:param output_dir: Root directory of the products (e.g. the GeoServer data dir)
+	:type output_dir: str
+	:return: Number of files written and the errors by composite date
+	:rtype: tuple[int, List[dict[str, Any]]]
+	"""
+	sentinel_items = stac_repo.find_stac_items(db, [SENTINEL], start, end)
+	landsat_items = stac_repo.find_stac_items(
+		db, [LANDSAT], start - LANDSAT_WINDOW, end
+	)
+
+	written = 0
+	errors = []
+	# Os tiles de um mesmo composite compartilham o datetime
+	for date, pairs in groupby(
+		pair_scenes(sentinel_items, landsat_items),
+		key=lambda pair: pair.sentinel["datetime"],
+	):
+		pairs = list(pairs)
+		ndvi_assets = [
+			pair.sentinel["assets"][BAND]
+			for pair in pairs
+			if BAND in pair.sentinel["assets"]
+		]
+		scenes = [
+			LandsatScene(
+				scene["item_id"],
+				scene["assets"][QA]["href"],
+				scene["assets"][QA_RADSAT]["href"],
+				scene["assets"][LST]["href"],
+			)
+			for scene in pairs[0].landsat
+			if all(key in scene["assets"] for key in (QA, QA_RADSAT, LST))
+		]
+
+		try:
+			written += len(write_composite(output_dir, date, BBOX, ndvi_assets, scenes))
+		except Exception as e:
+			logger.exception(f"Error writing products of {date:%Y-%m-%d}")
+			errors.append({"composite": date, "error": str(e)})
+
+	return written, errors
+
+
+def run_stac(gdf: gpd.GeoDataFrame, start_date: str, end_date: str):
+	"""
+	Função para processar imagens via STAC.
+
+	Sincroniza o catálogo local ('stac_items') e calcula as estatísticas zonais
+	de NDVI por município de cada composite do Sentinel ainda não processado,
+	lendo só a janela de Campo Vertentes de cada COG. Cada composite é pareado
+	com as cenas Landsat dos 16 dias anteriores. Os itens são processados
+	em paralelo (``STAC_MAX_WORKERS`` processos) e agregados em ordem de data;
+	o tempo de parede e de CPU de cada item vai para o relatório do job.
+	Com ``STAC_OUTPUT_DIR`` definido, os COGs de NDVI/LST de cada nova data
+	são gravados para o GeoServer.
+	"""
+	start_time = time.time()
+
+	client = MongoClient(env("DB_URL", "mongodb://mongo:27017/"))
+	db = client[env("DB_NAME", "campo_vertentes")]
+
+	try:
+		counts = sync_stac_catalog(db, start_date, end_date)
+
+		start = datetime.fromisoformat(start_date)
+		end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+		processed = stac_repo.get_processed_items(db, SENTINEL, BAND)
+
+		skipped = 0
+
+		def pending_items():
+			nonlocal skipped
+			for item in stac_repo.find_stac_items(db, [SENTINEL], start, end):
+				if item["item_id"] in processed:
+					skipped += 1
+				elif BAND not in item["assets"]:
+					logger.warning(f"Item {item['item_id']} has no '{BAND}' asset")
+					skipped += 1
+				else:
+					yield item
+
+		# Cenas Landsat dos 16 dias anteriores a cada composite do Sentinel
+		landsat_items = stac_repo.find_stac_items(
+			db, [LANDSAT], start - LANDSAT_WINDOW, end
+		)
+		paired_items = (
+			{**pair.sentinel, "landsat": pair.landsat}
+			for pair in pair_scenes(pending_items(), landsat_items)
+		)
+
+		success = 0
+		failed = 0
+		errors = []
+		timings = []
+		for result in process_items(paired_items, gdf):
+			timing = {
+				"item_id": result["item_id"],
+				"datetime": result["datetime"],
+				"wall_seconds": result["wall_seconds"],
+				"cpu_seconds": result["cpu_seconds"],
+			}
+			timings.append(timing)
+
+			if "error" in result:
+				failed += 1
+				errors.append({"item_id": result["item_id"], "error": result["error"]})
+				continue
+
+			try:
+				stac_repo.save_zonal_stats(db, result["docs"])
+				success += 1
+				logger.info(
+					f"Processed {result['item_id']} "
+					f"({len(result['docs'])} municipalities, "
+					f"wall={timing['wall_seconds']}s, cpu={timing['cpu_seconds']}s)"
+				)
+			except Exception as e:
+				failed += 1
+				errors.append({"item_id": result["item_id"], "error": str(e)})
+				logger.exception(f"Error saving statistics of {result['item_id']}")
+
+		products = 0
+		if OUTPUT_DIR:
+			products, product_errors = write_products(db, start, end)
+			errors.extend(product_errors)
+
+		status = (
+			"success" if not errors else "partial" if success or products else "failed"
+		)
+		total_time = time.time() - start_time
+
+		info = {
+			"status": status,
+			"new_items": counts,
+			"success": success,
+			"failed": failed,
+			"skipped": skipped,
+			"products": products,
+			"total_time_seconds": round(total_time, 2),
+			"items_wall_seconds": round(sum(t["wall_seconds"] for t in timings), 2),
+			"items_cpu_seconds": round(sum(t["cpu_seconds"] for t in timings), 2),
+		}
+		logger.info(f"STAC job finished:\n{info}", extra=info)
 
-	# TODO: Processar as imagens conforme necessário
+		stac_repo.update_stac_report(
+			db,
+			{
+				"job": "stac",
+				"collection": SENTINEL,
+				"band": BAND,
+				"start_date": start_date,
+				"end_date": end_date,
+			},
+			status=status,
+			summary={"success": success, "failed": failed, "skipped": skipped},
+			items=timings,
+			errors=errors,
+		)
+		return {**info, "errors": errors}
+	finally:
+		client.close()
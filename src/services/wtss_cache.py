@@ -0,0 +1,172 @@
+"""Content-addressed on-disk cache of WTSS time series responses."""
+
+import hashlib
+import json
+import logging
+import time
+from os import getenv as env
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry.base import BaseGeometry
+
+from src.utils.disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = env("WTSS_CACHE_DIR", "")
+CACHE_MAX_BYTES = int(env("WTSS_CACHE_MAX_BYTES", str(2 * 1024**3)))
+CACHE_TTL_SECONDS = int(env("WTSS_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+CACHE_OFFLINE = env("WTSS_CACHE_OFFLINE", "false").lower() == "true"
+
+
+def cache_key(
+	coverage: str,
+	attributes: Iterable[str],
+	geom: BaseGeometry,
+	start_date: str,
+	end_date: str,
+) -> str:
+	"""
+	Builds the content address of a WTSS request.
+
+	:param coverage: Coverage name
+	:type coverage: str
+	:param attributes: Requested attributes
+	:type attributes: Iterable[str]
+	:param geom: Requested geometry
+	:type geom: BaseGeometry
+	:param start_date: Start date of the request
+	:type start_date: str
+	:param end_date: End date of the request
+	:type end_date: str
+	:return: Hex digest identifying the request
+	:rtype: str
+	"""
+	request = {
+		"coverage": coverage,
+		"attributes": sorted(attributes),
+		"geometry": hashlib.sha256(shapely.normalize(geom).wkb).hexdigest(),
+		"start_date": start_date,
+		"end_date": end_date,
+	}
+	return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+class WTSSCache(DiskCache):
+	"""
+	Size-bounded LRU cache of WTSS time series stored as compressed ``.npz`` files.
+
+	Each entry keeps the long-format frame as columns (pixel x/y, datetime,
+	attribute code, value). Hits refresh the file mtime, which drives the LRU
+	eviction, and entries older than ``ttl_seconds`` are treated as misses.
+	"""
+
+	suffix = ".npz"
+	name = "WTSS"
+
+	def __init__(
+		self,
+		directory: str | Path,
+		max_bytes: int = CACHE_MAX_BYTES,
+		ttl_seconds: int = CACHE_TTL_SECONDS,
+	):
+		"""
+		Initialize the cache on a directory.
+
+		:param directory: Directory where entries are stored
+		:type directory: str | Path
+		:param max_bytes: Maximum total size of the entries
+		:type max_bytes: int
+		:param ttl_seconds: Entry lifetime in seconds (0 disables expiration)
+		:type ttl_seconds: int
+		"""
+		super().__init__(directory, max_bytes)
+		self.ttl_seconds = ttl_seconds
+
+	@classmethod
+	def from_env(cls) -> "WTSSCache | None":
+		"""
+		Builds the cache configured by ``WTSS_CACHE_DIR``, if any.
+
+		:return: Cache instance, or None when caching is disabled
+		:rtype: WTSSCache | None
+		"""
+		return cls(CACHE_DIR) if CACHE_DIR else None
+
+	def get(self, key: str) -> pd.DataFrame | None:
+		"""
+		Returns a cached time series, or None on a miss or expired entry.
+
+		:param key: Content address of the request
+		:type key: str
+		:return: Time series in long format (geometry, datetime, attribute, value)
+		:rtype: pd.DataFrame | None
+		"""
+		path = self._path(key)
+
+		try:
+			with np.load(path, allow_pickle=False) as data:
+				age = time.time() - float(data["created"])
+				if self.ttl_seconds and age > self.ttl_seconds:
+					df = None
+				else:
+					df = pd.DataFrame(
+						{
+							"attribute": data["attributes"][data["attribute"]],
+							"geometry": shapely.points(data["x"], data["y"]),
+							"value": data["value"],
+							"datetime": pd.to_datetime(data["datetime"]),
+						}
+					)
+		except FileNotFoundError:
+			return None
+		except Exception:
+			logger.warning(f"Discarding unreadable WTSS cache entry {path.name}")
+			self._remove(path)
+			return None
+
+		if df is None:
+			self._remove(path)  # Expirado
+			return None
+
+		self._touch(path)
+		return df
+
+	def put(self, key: str, df: pd.DataFrame):
+		"""
+		Stores a time series and evicts the least recently used entries if needed.
+
+		:param key: Content address of the request
+		:type key: str
+		:param df: Time series in long format (geometry, datetime, attribute, value)
+		:type df: pd.DataFrame
+		"""
+		if df.empty:
+			coords = np.empty((0, 2))
+			attr_codes, attrs = np.empty(0, dtype=np.int16), np.empty(0, dtype=str)
+			datetimes, values = np.empty(0, dtype=np.int64), np.empty(0)
+		else:
+			coords = shapely.get_coordinates(np.asarray(df["geometry"]))
+			attr_codes, attrs = pd.factorize(df["attribute"])
+			attr_codes = attr_codes.astype(np.int16)
+			attrs = np.asarray(attrs, dtype=str)
+			datetimes = df["datetime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+			values = df["value"].to_numpy(dtype=float)
+
+		self._write(
+			self._path(key),
+			lambda file: np.savez_compressed(
+				file,
+				x=coords[:, 0],
+				y=coords[:, 1],
+				datetime=datetimes,
+				attribute=attr_codes,
+				attributes=attrs,
+				value=values,
+				created=np.array(time.time()),
+			),
+		)
@@ -0,0 +1,87 @@
+"""Columnar builder of 'cafe' documents from WTSS time series."""
+
+from typing import Any, List
+
+import numpy as np
+import pandas as pd
+import shapely
+
+ATTRIBUTE_FIELDS = {
+	"NDVI": "ndvi",
+	"EVI": "evi",
+	"B03": "green",
+	"B04": "red",
+	"B08": "nir",
+}
+
+
+def build_point_docs(df: pd.DataFrame, geocodigo: str) -> List[dict[str, Any]]:
+	"""
+	Builds one 'cafe' update document per pixel from a WTSS time series.
+
+	Pixel coordinates, dates and attributes are factorized once and the values
+	are scattered into a (pixel x datetime, attribute) table sorted by pixel and
+	datetime, so no per-pixel DataFrame is created. For repeated
+	(pixel, datetime, attribute) rows the first non-null value wins, as with
+	``pivot_table(aggfunc="first")``; missing attributes are emitted as None.
+
+	:param df: Time series in long format (geometry, datetime, attribute, value)
+	:type df: pd.DataFrame
+	:param geocodigo: Municipality code of the polygon
+	:type geocodigo: str
+	:return: Documents with 'geocodigo', 'metadata' and 'timeseries'
+	:rtype: List[dict[str, Any]]
+	"""
+	values = df["value"].to_numpy(dtype=float)
+	valid = ~np.isnan(values)
+	if not valid.any():
+		return []
+
+	values = values[valid]
+	coords = shapely.get_coordinates(np.asarray(df["geometry"])[valid])
+	x_codes, _ = pd.factorize(coords[:, 0])
+	y_codes, _ = pd.factorize(coords[:, 1])
+	_, first_seen, pixel_codes = np.unique(
+		x_codes.astype(np.int64) * (y_codes.max() + 1) + y_codes,
+		return_index=True,
+		return_inverse=True,
+	)
+	pixels = coords[first_seen]
+	date_codes, dates = pd.factorize(df["datetime"][valid], sort=True)
+	attr_codes, attrs = pd.factorize(df["attribute"][valid], sort=True)
+
+	# Linhas ordenadas por (pixel, datetime)
+	keys = pixel_codes * len(dates) + date_codes
+	row_keys, rows = np.unique(keys, return_inverse=True)
+
+	# aggfunc="first": mantém a primeira ocorrência de cada célula
+	cells = rows * len(attrs) + attr_codes
+	cells, first = np.unique(cells, return_index=True)
+	table = np.full(len(row_keys) * len(attrs), np.nan)
+	table[cells] = values[first]
+	table = table.reshape(len(row_keys), len(attrs))
+
+	cells = table.astype(object)
+	cells[np.isnan(table)] = None
+
+	row_pixels = row_keys // len(dates)
+	timestamps = dates.take(row_keys % len(dates)).tolist()
+	fields = ("timestamp", *(ATTRIBUTE_FIELDS.get(a, str(a).lower()) for a in attrs))
+	records = [
+		dict(zip(fields, (timestamp, *row)))
+		for timestamp, row in zip(timestamps, cells.tolist())
+	]
+
+	starts = np.flatnonzero(np.diff(row_pixels, prepend=-1))
+	ends = np.append(starts[1:], len(row_keys))
+
+	return [
+		{
+			"geocodigo": geocodigo,
+			"metadata": {"type": "Point", "coordinates": xy},
+			"timeseries": records[start:end],
+		}
+		for xy, start, end in zip(
+			pixels[row_pixels[starts]].tolist(), starts.tolist(), ends.tolist()
+		)
+	]
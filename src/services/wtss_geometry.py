@@ -0,0 +1,209 @@
+"""Geometry preparation stage of the WTSS pipeline (repair, simplify, reproject)."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from os import getenv as env
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from shapely.geometry import MultiPolygon, Polygon
+
+from src.services.geometry_store import GEOMETRY_CACHE_DIR
+from src.services.wtss_tiling import (
+	BDC_CRS,
+	PIXEL_SIZE,
+	polygonal_part,
+	transform_geometry,
+)
+from src.utils.executors import start_process_pool
+
+logger = logging.getLogger(__name__)
+
+# WTSS recebe coordenadas geográficas
+TARGET_CRS = "EPSG:4326"
+SIMPLIFY_TOLERANCE = float(env("WTSS_SIMPLIFY_TOLERANCE", str(PIXEL_SIZE / 4)))
+PREPARE_WORKERS = int(env("WTSS_PREPARE_WORKERS", str(os.cpu_count() or 1)))
+PREPARE_CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+# Abaixo disso, subir processos custa mais do que preparar as geometrias
+MIN_PARALLEL_GEOMETRIES = 64
+
+
+def _prepare_chunk(
+	wkbs: List[bytes], crs: str, tolerance: float
+) -> List[tuple[bytes, int, int, bool]]:
+	"""
+	Prepares a chunk of geometries (runs in the worker processes).
+
+	:param wkbs: Geometries as WKB
+	:type wkbs: List[bytes]
+	:param crs: CRS of the geometries
+	:type crs: str
+	:param tolerance: Simplification tolerance in meters
+	:type tolerance: float
+	:return: Prepared WKB, vertices before and after, and whether it was repaired
+	:rtype: List[tuple[bytes, int, int, bool]]
+	"""
+	to_grid = Transformer.from_crs(crs, BDC_CRS, always_xy=True)
+	to_target = Transformer.from_crs(BDC_CRS, TARGET_CRS, always_xy=True)
+	source_to_target = Transformer.from_crs(crs, TARGET_CRS, always_xy=True)
+
+	results = []
+	for geom in shapely.from_wkb(wkbs):
+		vertices = int(shapely.get_num_coordinates(geom))
+		repaired = not geom.is_valid
+
+		prepared = polygonal_part(shapely.make_valid(geom)) if repaired else geom
+		if prepared is not None:
+			# Simplifica em metros, na projeção da grade, abaixo do tamanho do pixel
+			projected = transform_geometry(prepared, to_grid)
+			simplified = polygonal_part(
+				shapely.simplify(projected, tolerance, preserve_topology=True)
+			)
+			prepared = transform_geometry(simplified or projected, to_target)
+		else:
+			# Nada poligonal sobrou do reparo: envia como veio
+			prepared = transform_geometry(geom, source_to_target)
+
+		results.append(
+			(
+				shapely.to_wkb(prepared),
+				vertices,
+				int(shapely.get_num_coordinates(prepared)),
+				repaired,
+			)
+		)
+
+	return results
+
+
+def _cache_path(wkbs: List[bytes], crs: str, tolerance: float) -> Path:
+	digest = hashlib.sha256(json.dumps([crs, TARGET_CRS, tolerance]).encode())
+	for wkb in wkbs:
+		digest.update(hashlib.sha1(wkb).digest())
+	return Path(GEOMETRY_CACHE_DIR) / f"prepared-{digest.hexdigest()[:32]}.npz"
+
+
+def _read_cache(path: Path) -> tuple[List[bytes], dict[str, Any]] | None:
+	try:
+		with np.load(path, allow_pickle=False) as data:
+			wkb = data["wkb"].tobytes()
+			offsets = data["offsets"]
+			metrics = json.loads(str(data["metrics"]))
+	except FileNotFoundError:
+		return None
+	except Exception:
+		logger.warning(f"Discarding unreadable geometry cache {path.name}")
+		path.unlink(missing_ok=True)
+		return None
+
+	os.utime(path)
+	return [wkb[a:b] for a, b in zip(offsets[:-1], offsets[1:])], metrics
+
+
+def _write_cache(path: Path, wkbs: List[bytes], metrics: dict[str, Any]):
+	path.parent.mkdir(parents=True, exist_ok=True)
+
+	# Remove preparações que não são usadas há muito tempo (geometrias ad hoc)
+	now = time.time()
+	for old in path.parent.glob("prepared-*.npz"):
+		try:
+			if now - old.stat().st_mtime > PREPARE_CACHE_TTL_SECONDS:
+				old.unlink()
+		except FileNotFoundError:
+			pass
+
+	fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+	with os.fdopen(fd, "wb") as file:
+		np.savez(
+			file,
+			wkb=np.frombuffer(b"".join(wkbs), dtype=np.uint8),
+			offsets=np.cumsum([0] + [len(wkb) for wkb in wkbs], dtype=np.int64),
+			metrics=np.array(json.dumps(metrics)),
+		)
+	os.replace(tmp, path)
+
+
+def prepare_geometries(
+	geoms: List[Polygon | MultiPolygon],
+	crs: str = TARGET_CRS,
+	tolerance: float = SIMPLIFY_TOLERANCE,
+	max_workers: int = PREPARE_WORKERS,
+) -> tuple[List[Polygon | MultiPolygon], dict[str, Any]]:
+	"""
+	Prepares geometries to be sent to WTSS.
+
+	Invalid geometries are repaired with ``make_valid``, every geometry is
+	simplified preserving topology with a tolerance below the pixel size and
+	reprojected to WGS 84. Work is spread over a process pool and the result is
+	cached under ``GEOMETRY_CACHE_DIR`` by the hash of the input geometries, so
+	scheduled runs over the same shapefile prepare it only once.
+
+	:param geoms: Geometries to be prepared, in ``crs`` coordinates
+	:type geoms: List[Polygon | MultiPolygon]
+	:param crs: CRS of the geometries
+	:type crs: str
+	:param tolerance: Simplification tolerance in meters
+	:type tolerance: float
+	:param max_workers: Number of worker processes
+	:type max_workers: int
+	:return: Prepared geometries (same order) and vertex reduction metrics
+	:rtype: tuple[List[Polygon | MultiPolygon], dict[str, Any]]
+	"""
+	start_time = time.time()
+	wkbs = [shapely.to_wkb(geom) for geom in geoms]
+	cache_path = _cache_path(wkbs, crs, tolerance)
+
+	cached = _read_cache(cache_path)
+	if cached is not None:
+		prepared, metrics = cached
+		logger.info(f"Loaded {len(prepared)} prepared geometries from cache")
+		return list(shapely.from_wkb(prepared)), {**metrics, "cached": True}
+
+	workers = min(max_workers, max(1, len(wkbs) // MIN_PARALLEL_GEOMETRIES))
+	pool = start_process_pool(workers)
+
+	if pool is not None:
+		size = -(-len(wkbs) // workers)
+		chunks = [
+			(wkbs[i : i + size], crs, tolerance) for i in range(0, len(wkbs), size)
+		]
+		with pool:
+			results = [
+				result
+				for chunk in pool.starmap(_prepare_chunk, chunks)
+				for result in chunk
+			]
+	else:
+		workers = 1
+		results = _prepare_chunk(wkbs, crs, tolerance)
+
+	vertices_before = sum(result[1] for result in results)
+	vertices_after = sum(result[2] for result in results)
+	metrics = {
+		"geometries": len(results),
+		"repaired": sum(bool(result[3]) for result in results),
+		"vertices_before": vertices_before,
+		"vertices_after": vertices_after,
+		"vertex_reduction": round(1 - vertices_after / vertices_before, 4)
+		if vertices_before
+		else 0.0,
+		"workers": workers,
+		"prepare_seconds": round(time.time() - start_time, 2),
+	}
+	logger.info(f"Prepared geometries: {metrics}", extra=metrics)
+
+	prepared = [result[0] for result in results]
+	try:
+		_write_cache(cache_path, prepared, metrics)
+	except OSError:
+		logger.warning(f"Could not write geometry cache {cache_path}")
+
+	return list(shapely.from_wkb(prepared)), {**metrics, "cached": False}
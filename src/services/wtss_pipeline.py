@@ -0,0 +1,320 @@
+"""Stages of the streaming WTSS ingestion pipeline (fetch -> transform -> write)."""
+
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from os import getenv as env
+from typing import Any, List, Literal, NamedTuple
+
+from pymongo.database import Database
+
+import src.repos.coffee_repo as coffee_repo
+from src.utils.date_now import get_utc_now
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_DOCS = int(env("WTSS_WRITE_BATCH_DOCS", "5000"))
+WRITE_BATCH_BYTES = int(env("WTSS_WRITE_BATCH_BYTES", str(16 * 1024**2)))
+WRITE_QUEUE_SIZE = int(env("WTSS_WRITE_QUEUE_SIZE", "8"))
+FLUSH_INTERVAL_SECONDS = 5.0
+
+# Estimativa do tamanho BSON de um ponto (timestamp + 5 bandas com as chaves)
+POINT_BYTES = 110
+
+
+class PolygonResult(NamedTuple):
+	"""Outcome of a polygon, handed from the transformer to the writer."""
+
+	index: int
+	geocodigo: str
+	docs: List[dict[str, Any]] = []
+	polygon_key: str | None = None
+	last_timestamp: datetime | None = None
+	error: dict[str, Any] | None = None
+
+
+class StageStats:
+	"""Thread-safe counters of items handled and busy time of a pipeline stage."""
+
+	def __init__(self, name: str):
+		"""
+		Initialize the stage counters.
+
+		:param name: Stage name used in logs
+		:type name: str
+		"""
+		self.name = name
+		self.items = 0
+		self.busy_seconds = 0.0
+		self.started_at = time.time()
+		self._lock = threading.Lock()
+
+	def add(self, items: int, seconds: float):
+		"""
+		Records work done by the stage.
+
+		:param items: Number of items handled
+		:type items: int
+		:param seconds: Time spent handling them
+		:type seconds: float
+		"""
+		with self._lock:
+			self.items += items
+			self.busy_seconds += seconds
+
+	def summary(self) -> dict[str, float]:
+		"""
+		Summarizes the stage throughput.
+
+		``utilization`` is busy time over wall time; values close to (or above,
+		for parallel stages) 1 point at the bottleneck.
+
+		:return: Items, busy seconds, items per busy second and utilization
+		:rtype: dict[str, float]
+		"""
+		with self._lock:
+			wall = max(time.time() - self.started_at, 1e-9)
+			return {
+				"items": self.items,
+				"busy_seconds": round(self.busy_seconds, 2),
+				"items_per_second": round(self.items / self.busy_seconds, 2)
+				if self.busy_seconds
+				else 0.0,
+				"utilization": round(self.busy_seconds / wall, 2),
+			}
+
+
+def format_stats(stages: dict[str, dict[str, float]]) -> str:
+	"""
+	Formats stage summaries as a compact log fragment.
+
+	:param stages: Summaries by stage name
+	:type stages: dict[str, dict[str, float]]
+	:return: Text like ``fetch=3.1/s (1.95) write=...``
+	:rtype: str
+	"""
+	return " ".join(
+		f"{name}={stage['items_per_second']}/s ({stage['utilization']})"
+		for name, stage in stages.items()
+	)
+
+
+class BatchedWriter(threading.Thread):
+	"""
+	Writer stage: batches polygon results and writes them to Mongo.
+
+	Results arrive in polygon index order through a bounded queue (so a slow
+	database applies backpressure to the transformer). A batch is flushed with
+	an unordered bulk write when it reaches ``max_docs`` documents or about
+	``max_bytes`` bytes, or when no result arrived for a few seconds. After each
+	flush the watermarks and the ``pipeline_reports`` checkpoint are updated for
+	the polygons of the batch, in order, so ``resume`` never skips unwritten data.
+	"""
+
+	def __init__(
+		self,
+		db: Database,
+		job_key: dict[str, Any],
+		mode: Literal["full", "resume", "retry_failed"],
+		coverage: str,
+		stats: dict[str, StageStats],
+		max_docs: int = WRITE_BATCH_DOCS,
+		max_bytes: int = WRITE_BATCH_BYTES,
+		queue_size: int = WRITE_QUEUE_SIZE,
+		checkpoint_field: str = "summary.last_processed_index",
+	):
+		"""
+		Initialize the writer stage.
+
+		:param db: The database connection
+		:type db: Database
+		:param job_key: Identifiers of the job report
+		:type job_key: dict[str, Any]
+		:param mode: Operation mode of the job
+		:type mode: Literal["full", "resume", "retry_failed"]
+		:param coverage: Coverage name, used for the watermarks
+		:type coverage: str
+		:param stats: Stage counters, logged on every flush
+		:type stats: dict[str, StageStats]
+		:param max_docs: Flush threshold in documents
+		:type max_docs: int
+		:param max_bytes: Flush threshold in estimated bytes
+		:type max_bytes: int
+		:param queue_size: Maximum number of pending polygon results
+		:type queue_size: int
+		:param checkpoint_field: Report field holding the last processed index
+		:type checkpoint_field: str
+		"""
+		super().__init__(name="wtss-writer", daemon=True)
+		self.db = db
+		self.job_key = job_key
+		self.mode = mode
+		self.coverage = coverage
+		self.stats = stats
+		self.max_docs = max_docs
+		self.max_bytes = max_bytes
+		self.checkpoint_field = checkpoint_field
+		self.queue: queue.Queue[PolygonResult | None] = queue.Queue(queue_size)
+
+		self.success = 0
+		self.failed = 0
+		self.total_docs = 0
+		self.errors: List[dict[str, Any]] = []
+		# Composites gravados por município, para atualizar os rollups
+		self.written_timestamps: defaultdict[str, set[datetime]] = defaultdict(set)
+
+	def put(self, result: PolygonResult):
+		"""
+		Hands a polygon result to the writer, blocking while the queue is full.
+
+		:param result: Polygon result
+		:type result: PolygonResult
+		"""
+		self.queue.put(result)
+
+	def close(self):
+		"""Flushes the pending results and waits for the writer to finish."""
+		self.queue.put(None)
+		self.join()
+
+	def run(self):
+		batch: List[PolygonResult] = []
+		docs = 0
+		size = 0
+
+		while True:
+			try:
+				result = self.queue.get(timeout=FLUSH_INTERVAL_SECONDS)
+			except queue.Empty:
+				if batch:
+					self._flush(batch)
+					batch, docs, size = [], 0, 0
+				continue
+
+			if result is None:
+				break
+
+			batch.append(result)
+			docs += len(result.docs)
+			size += sum(len(doc["timeseries"]) for doc in result.docs) * POINT_BYTES
+
+			if docs >= self.max_docs or size >= self.max_bytes:
+				self._flush(batch)
+				batch, docs, size = [], 0, 0
+
+		if batch:
+			self._flush(batch)
+
+	def _flush(self, batch: List[PolygonResult]):
+		"""
+		Writes a batch and checkpoints its polygons.
+
+		:param batch: Polygon results in index order
+		:type batch: List[PolygonResult]
+		"""
+		flush_start_time = time.time()
+		docs = [doc for result in batch for doc in result.docs]
+		write_error = None
+
+		try:
+			result = coffee_repo.update_points_time_series(self.db, docs, ordered=False)
+			if result:
+				self.total_docs += result.modified_count + result.upserted_count
+		except Exception as e:
+			write_error = str(e)
+			logger.exception(f"Error writing batch of {len(docs)} documents")
+
+		written = []
+		errors = []
+		for item in batch:
+			if item.error is not None:
+				errors.append(item.error)
+			elif write_error is not None and item.docs:
+				errors.append(
+					{
+						"polygon_index": item.index,
+						"geocodigo": item.geocodigo,
+						"error": write_error,
+					}
+				)
+			elif item.docs:
+				written.append(item)
+
+		self.success += len(written)
+		self.failed += len(errors)
+		self.errors.extend(errors)
+		for item in written:
+			self.written_timestamps[item.geocodigo].update(
+				point["timestamp"] for doc in item.docs for point in doc["timeseries"]
+			)
+
+		try:
+			coffee_repo.update_wtss_watermarks(
+				self.db,
+				self.coverage,
+				[
+					(item.polygon_key, item.geocodigo, item.last_timestamp)
+					for item in written
+					if item.polygon_key is not None
+				],
+			)
+			self._checkpoint(batch, written, errors)
+		except Exception:
+			logger.exception("Error checkpointing WTSS batch")
+
+		self.stats["write"].add(len(docs), time.time() - flush_start_time)
+		stages = {name: stage.summary() for name, stage in self.stats.items()}
+		logger.info(
+			f"Flushed {len(batch)} polygons ({len(docs)} docs) "
+			f"in {time.time() - flush_start_time:.2f}s "
+			f"(write_queue={self.queue.qsize()}, {format_stats(stages)})",
+			extra=stages,
+		)
+
+	def _checkpoint(
+		self,
+		batch: List[PolygonResult],
+		written: List[PolygonResult],
+		errors: List[dict[str, Any]],
+	):
+		"""
+		Updates the job report with the outcome of a flushed batch.
+
+		:param batch: Polygon results of the batch, in index order
+		:type batch: List[PolygonResult]
+		:param written: Results whose documents were written
+		:type written: List[PolygonResult]
+		:param errors: Error entries of the failed polygons
+		:type errors: List[dict[str, Any]]
+		"""
+		inc = {"summary.success": len(written), "summary.failed": len(errors)}
+
+		# Em retry_failed, os polígonos reprocessados saem da lista de erros
+		# (os que falharam de novo são registrados outra vez abaixo)
+		if self.mode == "retry_failed":
+			inc["summary.failed"] -= len(batch)
+			coffee_repo.update_wtss_report(
+				self.db,
+				self.job_key,
+				{
+					"$pull": {
+						"errors": {
+							"polygon_index": {"$in": [item.index for item in batch]}
+						}
+					}
+				},
+			)
+
+		update = {
+			"$inc": inc,
+			# last_processed_index só avança, mesmo em retry_failed
+			"$max": {self.checkpoint_field: batch[-1].index},
+			"$set": {"updated_at": get_utc_now()},
+		}
+		if errors:
+			update["$push"] = {"errors": {"$each": errors}}
+
+		coffee_repo.update_wtss_report(self.db, self.job_key, update)
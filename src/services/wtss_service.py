@@ -1,26 +1,57 @@
+import hashlib
 import logging
 import time
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import cache
 from os import getenv as env
-from typing import List, Literal
+from typing import List, Literal, NamedTuple
 
 import geopandas as gpd
+import pandas as pd
 from pymongo import MongoClient
-from requests.exceptions import HTTPError
+from pymongo.database import Database
+from requests.exceptions import RequestException
 from shapely.geometry import MultiPolygon, Polygon
 from wtss import WTSS
 
 import src.repos.coffee_repo as coffee_repo
 from src.models.bdc import WTSSReport
+from src.services.wtss_cache import CACHE_OFFLINE, WTSSCache, cache_key
+from src.services.wtss_docs import build_point_docs
+from src.services.wtss_geometry import TARGET_CRS, prepare_geometries
+from src.services.wtss_pipeline import BatchedWriter, PolygonResult, StageStats
+from src.services.wtss_tiling import merge_tiles, tile_geometry
 from src.utils.date_now import get_utc_now
+from src.utils.executors import ordered_submit
+from src.utils.rate_limit import AdaptiveRateLimiter, get_rate_limiter
+from src.utils.retry import call_with_retries
 
 logger = logging.getLogger(__name__)
 
+WTSS_URL = env("WTSS_URL", "https://data.inpe.br/bdc/wtss/v4/")
+COVERAGE_NAME = "S2-16D-2"
+ATTRIBUTES = ("NDVI", "EVI", "B04", "B08", "B03")
+MAX_WORKERS = int(env("WTSS_MAX_WORKERS", "4"))
+MAX_EMPTY_SERIES = 5
+MAX_CONSECUTIVE_HTTP_ERRORS = 5
+
+
+class WorkUnit(NamedTuple):
+	"""A single WTSS request: one tile of one polygon over a date range."""
+
+	index: int
+	tile: int
+	n_tiles: int
+	geom: Polygon | MultiPolygon
+	start_date: str
+
 
 def indedexes_to_process(
 	mode: Literal["full", "resume", "retry_failed"],
 	existing_report: WTSSReport | None,
 	total_polygons: int,
+	index_range: tuple[int, int] | None = None,
 ) -> List[int] | range:
 	"""
 	Determines which polygon indexes to process based on the specified mode and existing report.
@@ -31,20 +62,262 @@ def indedexes_to_process(
 	:type existing_report: WTSSReport | None
 	:param total_polygons: Total number of polygons to process
 	:type total_polygons: int
+	:param index_range: Half-open range of indexes of a chunk, or None for all
+	:type index_range: tuple[int, int] | None
 	:return: Set or range of polygon indexes to process
 	:rtype: set[int] | range
 	"""
+	start, stop = index_range or (0, total_polygons)
+
 	if mode == "resume" and existing_report:
-		start_index = (
-			existing_report.get("summary", {}).get("last_processed_index", -1) + 1
-		)
-		return range(start_index, total_polygons)
+		if index_range:
+			checkpoint = existing_report.get("chunks", {}).get(
+				chunk_id(index_range), {}
+			)
+		else:
+			checkpoint = existing_report.get("summary", {})
+		start_index = max(start, checkpoint.get("last_processed_index", -1) + 1)
+		return range(start_index, stop)
 
 	elif mode == "retry_failed" and existing_report:
-		return sorted({err["index"] for err in existing_report["errors"]})
+		return sorted(
+			{
+				err["polygon_index"]
+				for err in existing_report["errors"]
+				if start <= err["polygon_index"] < stop
+			}
+		)
 
 	else:  # full
-		return range(total_polygons)
+		return range(start, stop)
+
+
+def chunk_ranges(total_polygons: int, chunk_size: int) -> List[tuple[int, int]]:
+	"""
+	Splits the polygon indexes of a job into contiguous chunks.
+
+	:param total_polygons: Total number of polygons of the job
+	:type total_polygons: int
+	:param chunk_size: Maximum number of polygons per chunk
+	:type chunk_size: int
+	:return: Half-open index ranges
+	:rtype: List[tuple[int, int]]
+	"""
+	return [
+		(start, min(start + chunk_size, total_polygons))
+		for start in range(0, total_polygons, chunk_size)
+	]
+
+
+def chunk_id(index_range: tuple[int, int]) -> str:
+	"""
+	Names a chunk in the ``chunks`` field of the job report.
+
+	:param index_range: Half-open range of indexes of the chunk
+	:type index_range: tuple[int, int]
+	:return: Chunk name, e.g. "0-200"
+	:rtype: str
+	"""
+	return f"{index_range[0]}-{index_range[1]}"
+
+
+def extract_polygons(gdf: gpd.GeoDataFrame) -> List[tuple[str, Polygon | MultiPolygon]]:
+	"""
+	Lists the polygons of a GeoDataFrame with their municipality codes.
+
+	The position in this list is the polygon index used by reports and chunks.
+
+	:param gdf: Geopandas DataFrame containing geometries
+	:type gdf: gpd.GeoDataFrame
+	:return: (geocodigo, geometry) pairs of the polygonal geometries
+	:rtype: List[tuple[str, Polygon | MultiPolygon]]
+	"""
+	geocodigos = gdf["CD_MUN"] if "CD_MUN" in gdf.columns else ["unknown"] * len(gdf)
+	return [
+		(str(geocodigo), geom)
+		for geocodigo, geom in zip(geocodigos, gdf["geometry"])
+		if isinstance(geom, (Polygon, MultiPolygon))
+	]
+
+
+def wtss_job_key(start_date: str, end_date: str) -> dict[str, str]:
+	"""
+	Identifies the report of a WTSS job in 'pipeline_reports'.
+
+	:param start_date: Start date of the job
+	:type start_date: str
+	:param end_date: End date of the job
+	:type end_date: str
+	:return: Report identifiers
+	:rtype: dict[str, str]
+	"""
+	return {
+		"job": "wtss",
+		"coverage": COVERAGE_NAME,
+		"start_date": start_date,
+		"end_date": end_date,
+	}
+
+
+def start_wtss_report(db: Database, job_key: dict[str, str], total_polygons: int):
+	"""
+	Creates the report of a WTSS job if it does not exist yet.
+
+	:param db: The database connection
+	:type db: Database
+	:param job_key: Report identifiers
+	:type job_key: dict[str, str]
+	:param total_polygons: Total number of polygons of the job
+	:type total_polygons: int
+	"""
+	report = WTSSReport(
+		# TODO: Ajustar modelo para diferenciar geometrias (admin vs cron)
+		**job_key,
+		status="partial",
+		summary={
+			"total_polygons": total_polygons,
+			"success": 0,
+			"failed": 0,
+		},
+		errors=[],
+		created_at=get_utc_now(),
+		updated_at=get_utc_now(),
+	)
+	coffee_repo.save_wtss_report(db, job_key, report.model_dump())
+
+
+def polygon_key(geocodigo: str, geom: Polygon | MultiPolygon) -> str:
+	"""
+	Identifies a polygon across runs by its geocodigo and geometry hash.
+
+	:param geocodigo: Municipality code of the polygon
+	:type geocodigo: str
+	:param geom: Polygon geometry
+	:type geom: Polygon | MultiPolygon
+	:return: Polygon key
+	:rtype: str
+	"""
+	return f"{geocodigo}:{hashlib.sha1(geom.wkb).hexdigest()[:16]}"
+
+
+def incremental_start_date(start_date: str, watermark: datetime | None) -> str:
+	"""
+	Moves the start of the requested window past the latest stored composite.
+
+	:param start_date: Requested start date (YYYY-MM-DD)
+	:type start_date: str
+	:param watermark: Latest composite datetime already stored, if any
+	:type watermark: datetime | None
+	:return: Start date (YYYY-MM-DD) of the missing range
+	:rtype: str
+	"""
+	if watermark is None:
+		return start_date
+
+	return max(start_date, (watermark + timedelta(days=1)).date().isoformat())
+
+
+def fetch_time_series(
+	coverage,
+	geom: Polygon | MultiPolygon,
+	start_date: str,
+	end_date: str,
+) -> pd.DataFrame:
+	"""
+	Requests the time series of every pixel inside a geometry from WTSS.
+
+	:param coverage: WTSS coverage object
+	:param geom: Geometry to be requested
+	:type geom: Polygon | MultiPolygon
+	:param start_date: Start date for data retrieval
+	:type start_date: str
+	:param end_date: End date for data retrieval
+	:type end_date: str
+	:return: Time series in long format (geometry, datetime, attribute, value)
+	:rtype: pd.DataFrame
+	"""
+	ts = coverage.ts(
+		attributes=ATTRIBUTES,
+		geom=geom,
+		start_datetime=start_date,
+		end_datetime=end_date,
+	)
+	return ts.df()
+
+
+@cache
+def get_coverage(url: str = WTSS_URL, name: str = COVERAGE_NAME):
+	"""
+	Connects to a WTSS coverage once per process.
+
+	:param url: WTSS service URL
+	:type url: str
+	:param name: Coverage name
+	:type name: str
+	:return: WTSS coverage object
+	"""
+	return WTSS(url)[name]
+
+
+@cache
+def get_limiter() -> AdaptiveRateLimiter:
+	"""
+	Builds the WTSS rate limiter once per process.
+
+	:return: Limiter shared by every WTSS request of the worker pool
+	:rtype: AdaptiveRateLimiter
+	"""
+	return get_rate_limiter("wtss")
+
+
+def cached_fetch_time_series(
+	cache: WTSSCache | None,
+	geom: Polygon | MultiPolygon,
+	start_date: str,
+	end_date: str,
+) -> pd.DataFrame:
+	"""
+	Requests a time series from WTSS, going through the response cache if enabled.
+
+	Network requests are rate limited and transient failures are retried with
+	jittered exponential backoff.
+
+	With ``WTSS_CACHE_OFFLINE=true`` a cache miss raises instead of reaching the
+	network, which allows replaying whole jobs offline.
+
+	:param cache: Response cache, or None when caching is disabled
+	:type cache: WTSSCache | None
+	:param geom: Geometry to be requested
+	:type geom: Polygon | MultiPolygon
+	:param start_date: Start date for data retrieval
+	:type start_date: str
+	:param end_date: End date for data retrieval
+	:type end_date: str
+	:return: Time series in long format (geometry, datetime, attribute, value)
+	:rtype: pd.DataFrame
+	:raises LookupError: On a cache miss in offline mode
+	"""
+
+	def request() -> pd.DataFrame:
+		return call_with_retries(
+			lambda: fetch_time_series(get_coverage(), geom, start_date, end_date),
+			limiter=get_limiter(),
+		)
+
+	if cache is None:
+		return request()
+
+	key = cache_key(COVERAGE_NAME, ATTRIBUTES, geom, start_date, end_date)
+	df = cache.get(key)
+
+	if df is None:
+		if CACHE_OFFLINE:
+			raise LookupError(f"WTSS cache miss in offline mode ({key})")
+
+		df = request()
+		cache.put(key, df)
+
+	return df
 
 
 def run_wtss(
@@ -52,10 +325,31 @@ def run_wtss(
 	start_date: str,
 	end_date: str,
 	mode: Literal["full", "resume", "retry_failed"] = "full",
-):
+	max_workers: int | None = None,
+	incremental: bool = True,
+	index_range: tuple[int, int] | None = None,
+) -> dict:
 	"""
 	Runs the WTSS data retrieval and storage process.
 
+	Polygons are first repaired, simplified below the pixel size and reprojected
+	to WGS 84 (see ``prepare_geometries``). Polygons larger than
+	``WTSS_MAX_TILE_PIXELS`` pixels are split into
+	grid-aligned tiles that are fetched independently and merged back per polygon.
+	Fetching, transforming and writing run as overlapped stages: up to
+	``max_workers`` requests are kept in flight while this thread builds the
+	documents and a writer thread flushes them in batches, checkpointing in index
+	order so that ``resume`` keeps working.
+	In incremental mode each polygon only requests dates after its watermark
+	(the latest composite already stored).
+	Once the writer finishes, the rollups of the municipalities it wrote are
+	recomputed for the composites it wrote (see ``refresh_rollups``).
+
+	With ``index_range`` only that chunk of the polygons is processed. Chunks of
+	the same job share its report: counters and errors are accumulated, while the
+	checkpoint and status of each chunk are kept under ``chunks.<start>-<stop>``,
+	so chunks can run (and be resumed) independently on different workers.
+
 	:param gdf: Geopandas DataFrame containing geometries
 	:type gdf: gpd.GeoDataFrame
 	:param start_date: Start date for data retrieval
@@ -64,230 +358,321 @@ def run_wtss(
 	:type end_date: str
 	:param mode: Operation mode
 	:type mode: Literal["full", "resume", "retry_failed"]
+	:param max_workers: Number of concurrent WTSS requests (defaults to
+						``WTSS_MAX_WORKERS``)
+	:type max_workers: int | None
+	:param incremental: Request only composites newer than each polygon's
+						watermark, skipping polygons that are up to date
+	:type incremental: bool
+	:param index_range: Half-open range of polygon indexes of a chunk, or None
+						to process the whole job
+	:type index_range: tuple[int, int] | None
+	:return: Summary of the run
+	:rtype: dict
 	"""
 	# Counters and stats
 	total_docs = 0
 	success = 0
 	failed = 0
 	empty_series = 0
-	errors = []
+	up_to_date = 0
+	max_workers = max_workers or MAX_WORKERS
 
 	# Mongo DB connection
 	client = MongoClient(env("DB_URL", "mongodb://mongo:27017/"))
 	db = client[env("DB_NAME", "campo_vertentes")]
 
-	# WTSS service connection
-	service = WTSS(env("WTSS_URL", "https://data.inpe.br/bdc/wtss/v4/"))
-	coverage_name = "S2-16D-2"
-	coverage = service[coverage_name]
+	# Cache local das respostas do WTSS (desativado se WTSS_CACHE_DIR vazio)
+	wtss_cache = WTSSCache.from_env()
 
-	geometries = [
-		geom for geom in gdf["geometry"] if isinstance(geom, (Polygon, MultiPolygon))
-	]
-	total_polygons = len(geometries)
+	polygons = extract_polygons(gdf)
+	total_polygons = len(polygons)
+	crs = gdf.crs.to_string() if gdf.crs else "EPSG:4326"
 
 	# Retrieve previous WTSS report if exists
-	job_key = {
-		"job": "wtss",
-		"coverage": coverage_name,
-		"start_date": start_date,
-		"end_date": end_date,
-	}
+	job_key = wtss_job_key(start_date, end_date)
 
 	existing_report = coffee_repo.get_wtss_report(db, **job_key)
 
 	if mode == "full" and not existing_report:
-		report = WTSSReport(
-			# TODO: Ajustar modelo para diferenciar geometrias (admin vs cron)
-			**job_key,
-			status="partial",
-			summary={
-				"total_polygons": total_polygons,
-				"success": success,
-				"failed": failed,
-			},
-			errors=errors,
-			created_at=get_utc_now(),
-			updated_at=get_utc_now(),
-		)
-		coffee_repo.save_wtss_report(db, job_key, report.model_dump())
+		start_wtss_report(db, job_key, total_polygons)
+
+	# Chunks guardam o próprio checkpoint no relatório compartilhado
+	chunk = chunk_id(index_range) if index_range else None
+	checkpoint_field = (
+		f"chunks.{chunk}.last_processed_index"
+		if chunk
+		else "summary.last_processed_index"
+	)
 
-	indexes = indedexes_to_process(mode, existing_report, total_polygons)
+	indexes = indedexes_to_process(mode, existing_report, total_polygons, index_range)
+
+	# Janela incremental por polígono, a partir do último composite salvo
+	watermarks = (
+		coffee_repo.get_wtss_watermarks(db, COVERAGE_NAME) if incremental else {}
+	)
+	keys = {i: polygon_key(*polygons[i]) for i in indexes}
+	start_dates = {
+		i: incremental_start_date(start_date, watermarks.get(keys[i])) for i in indexes
+	}
+	pending_indexes = [i for i in indexes if start_dates[i] <= end_date]
+	up_to_date = len(indexes) - len(pending_indexes)
 
 	start_time = time.time()
 
+	# Reparo, simplificação e reprojeção; as chaves seguem a geometria original
+	prepared, geometry_stats = prepare_geometries(
+		[polygons[i][1] for i in pending_indexes], crs=crs
+	)
+	geometries = dict(zip(pending_indexes, prepared))
+
 	logger.info(
 		"WTSS job started",
 		extra={
 			**job_key,
 			"mode": mode,
+			"chunk": chunk,
 			"total_polygons": total_polygons,
-			"indexes_to_process": len(indexes),
+			"indexes_to_process": len(pending_indexes),
+			"up_to_date": up_to_date,
+			"max_workers": max_workers,
+			"vertex_reduction": geometry_stats["vertex_reduction"],
 		},
 	)
 
-	for i in indexes:
-		geom = geometries[i]
-		geocodigo = str(gdf.iloc[i].get("CD_MUN", "unknown"))
-		polygon_start_time = time.time()
-
-		logger.info(
-			f"Processing polygon {i + 1}/{total_polygons} (geocodigo={geocodigo})"
-		)
-
+	def work_units():
+		# Polígonos grandes viram vários tiles, buscados de forma independente
+		for i in pending_indexes:
+			try:
+				tiles = tile_geometry(geometries[i], crs=TARGET_CRS)
+			except Exception:
+				logger.exception(f"Could not tile polygon {i + 1}, sending it whole")
+				tiles = [geometries[i]]
+			for t, tile in enumerate(tiles):
+				yield WorkUnit(i, t, len(tiles), tile, start_dates[i])
+
+	# Estágios: fetchers (pool) -> transformador (esta thread) -> escritor
+	stats = {name: StageStats(name) for name in ("fetch", "transform", "write")}
+	writer = BatchedWriter(
+		db, job_key, mode, COVERAGE_NAME, stats, checkpoint_field=checkpoint_field
+	)
+	writer.start()
+
+	def fetch(unit: WorkUnit) -> pd.DataFrame:
+		fetch_start_time = time.time()
+		df = cached_fetch_time_series(wtss_cache, unit.geom, unit.start_date, end_date)
+		stats["fetch"].add(1, time.time() - fetch_start_time)
+		return df
+
+	def error_result(i: int, e: Exception) -> PolygonResult:
+		geocodigo = polygons[i][0]
+		error_entry = {"polygon_index": i, "geocodigo": geocodigo, "error": str(e)}
+		return PolygonResult(i, geocodigo, error=error_entry)
+
+	try:
+		with ThreadPoolExecutor(
+			max_workers=max_workers, thread_name_prefix="wtss"
+		) as executor:
+			frames = []
+			failed_index = None
+			http_errors = 0
+
+			for (i, t, n_tiles, *_), future in ordered_submit(
+				executor, fetch, work_units(), max_workers
+			):
+				if i == failed_index:
+					future.cancel()
+					continue  # Demais tiles de um polígono que já falhou
+
+				geocodigo = polygons[i][0]
+
+				try:
+					frames.append(future.result())
+					http_errors = 0
+
+					if t < n_tiles - 1:
+						continue
+
+					logger.info(
+						f"Processing polygon {i + 1}/{total_polygons} "
+						f"(geocodigo={geocodigo}, tiles={n_tiles}, "
+						f"write_queue={writer.queue.qsize()})"
+					)
+
+					transform_start_time = time.time()
+					df = merge_tiles(frames)
+					frames = []
+
+					if df.empty:
+						logger.info("Série temporal vazia para este polígono.")
+						writer.put(PolygonResult(i, geocodigo))
+
+						# Janela incremental vazia só indica que não há composite novo
+						if start_dates[i] == start_date:
+							empty_series += 1
+						if empty_series > MAX_EMPTY_SERIES:
+							logger.info(
+								"Muitas séries vazias. Interrompendo o processamento."
+							)
+							break
+
+						continue
+
+					# Um documento por pixel, com a série temporal ordenada
+					docs = build_point_docs(df, geocodigo)
+					stats["transform"].add(1, time.time() - transform_start_time)
+
+					if not docs:
+						logger.warning(
+							f"No documents generated for polygon {i + 1} "
+							f"(geocodigo={geocodigo})"
+						)
+
+					writer.put(
+						PolygonResult(
+							i,
+							geocodigo,
+							docs,
+							polygon_key=keys[i] if incremental else None,
+							last_timestamp=df["datetime"].max().to_pydatetime(),
+						)
+					)
+
+				except RequestException as e:
+					frames, failed_index = [], i
+					logger.exception(
+						f"Error processing polygon {i + 1} (geocodigo={geocodigo})"
+					)
+					writer.put(error_result(i, e))
+
+					# Retentativas esgotadas em sequência: servidor indisponível
+					http_errors += 1
+					if http_errors >= MAX_CONSECUTIVE_HTTP_ERRORS:
+						logger.error("Too many consecutive HTTP errors, stopping job")
+						break
+
+				except Exception as e:
+					frames, failed_index = [], i
+					logger.exception(
+						f"Error processing polygon {i + 1} (geocodigo={geocodigo})"
+					)
+					writer.put(error_result(i, e))
+	finally:
+		# Grava o que falta e faz o último checkpoint
+		writer.close()
+
+	success, failed, total_docs = writer.success, writer.failed, writer.total_docs
+
+	# Rollups só dos municípios e composites que acabaram de ser gravados
+	written = writer.written_timestamps
+	rollups_refreshed = 0
+	if written:
 		try:
-			ts = coverage.ts(
-				attributes=(
-					"NDVI",
-					"EVI",
-					"B04",
-					"B08",
-					"B03",
-				),
-				geom=geom,
-				start_datetime=start_date,
-				end_datetime=end_date,
-			)
-
-			df = ts.df()
-
-			if df.empty:
-				empty_series += 1
-				logger.info("Série temporal vazia para este polígono.")
-				if empty_series > 5:
-					logger.info("Muitas séries vazias. Interrompendo o processamento.")
-					break
-
-				continue
-
-			pivoted = (
-				df.pivot_table(
-					index=["geometry", "datetime"],
-					columns="attribute",
-					values="value",
-					aggfunc="first",
-				)
-				.reset_index()
-				.rename(
-					columns={
-						"NDVI": "ndvi",
-						"EVI": "evi",
-						"B03": "green",
-						"B04": "red",
-						"B08": "nir",
-						"datetime": "timestamp",
-					},
-					inplace=True,
-				)
-			)
-
-			# Agrupar dados por pixel (ponto)
-			docs = []
-
-			for pixel, group in pivoted.groupby("geometry"):
-				docs.append(
-					{
-						"geocodigo": geocodigo,
-						"metadata": {
-							"type": "Point",
-							"coordinates": list(pixel.coords[0]),
-						},
-						"timeseries": group.drop(columns=["geometry"]).to_dict(
-							orient="records"
-						),
-					}
-				)
-
-			if docs:
-				result = coffee_repo.update_points_time_series(db, docs)
-				success += 1
-				total_docs += result.modified_count
-
-				logger.info(
-					f"Polygon {i + 1} processed successfully "
-					f"(docs={len(docs)}, modified={result.modified_count}, "
-					f"time={time.time() - polygon_start_time:.2f}s)"
-				)
-			else:
-				logger.warning(
-					f"No documents generated for polygon {i + 1} (geocodigo={geocodigo})"
-				)
-
-		except HTTPError as e:
-			failed += 1
-			error_entry = {
-				"polygon_index": i,
-				"geocodigo": geocodigo,
-				"error": str(e),
-			}
-			errors.append(error_entry)
-			logger.exception(
-				f"Error processing polygon {i + 1} (geocodigo={geocodigo})"
-			)
-
-			# Checkpoint
-			coffee_repo.update_wtss_report(
-				db,
-				job_key,
-				{
-					"$push": {"errors": error_entry},
-					"$set": {
-						"summary.last_processed_index": i,
-						"updated_at": get_utc_now(),
-					},
-					"$inc": {"summary.failed": 1},
-				},
-			)
-			break  # Stop processing on HTTP errors
-
-		except Exception as e:
-			failed += 1
-			error_entry = {
-				"polygon_index": i,
-				"geocodigo": geocodigo,
-				"error": str(e),
-			}
-			errors.append(error_entry)
-			logger.exception(
-				f"Error processing polygon {i + 1} (geocodigo={geocodigo})"
-			)
-
-			# Checkpoint
-			coffee_repo.update_wtss_report(
-				db,
-				job_key,
-				{
-					"$push": {"errors": error_entry},
-					"$set": {
-						"updated_at": get_utc_now(),
-					},
-					"$inc": {"summary.failed": 1},
-				},
-			)
+			coffee_repo.refresh_rollups(db, written, set().union(*written.values()))
+			rollups_refreshed = len(written)
+		except Exception:
+			logger.exception("Error refreshing municipality rollups")
 
 	total_time = time.time() - start_time
 
 	status = "success" if failed == 0 else "partial" if success > 0 else "failed"
 
 	info = {
+		"chunk": chunk,
 		"status": status,
 		"success": success,
 		"failed": failed,
 		"total_time_seconds": round(total_time, 2),
 		"total_time_formatted": str(timedelta(seconds=total_time)).split(".")[0],
+		"up_to_date": up_to_date,
 		"total_docs_updated": total_docs,
+		"rollups_refreshed": rollups_refreshed,
+		"stages": {name: stage.summary() for name, stage in stats.items()},
+		"geometry": geometry_stats,
 	}
 	logger.info(f"WTSS job finished:\n{info}", extra=info)
 
-	# Final report update
+	# Final report update (o status de um job em chunks é definido no fan-in)
+	if chunk:
+		update = {
+			f"chunks.{chunk}.status": status,
+			f"chunks.{chunk}.up_to_date": up_to_date,
+		}
+	else:
+		update = {"status": status, "summary.up_to_date": up_to_date}
+
 	coffee_repo.update_wtss_report(
-		db,
-		job_key,
-		{
-			"$set": {
-				"status": status,
-				"summary.success": success,
-				"updated_at": get_utc_now(),
-			}
-		},
+		db, job_key, {"$set": {**update, "updated_at": get_utc_now()}}
 	)
+
+	return info
+
+
+def finish_wtss_chunks(start_date: str, end_date: str, chunks: List[dict]) -> dict:
+	"""
+	Aggregates the summaries of the chunks of a WTSS job into its report.
+
+	Fan-in step of a sharded job: counters and errors were already accumulated
+	in the report by each chunk, so this sets the final status of the job and of
+	the chunks that failed before reporting.
+
+	:param start_date: Start date of the job
+	:type start_date: str
+	:param end_date: End date of the job
+	:type end_date: str
+	:param chunks: Summaries returned by the chunk runs
+	:type chunks: List[dict]
+	:return: Summary of the job
+	:rtype: dict
+	"""
+	client = MongoClient(env("DB_URL", "mongodb://mongo:27017/"))
+	db = client[env("DB_NAME", "campo_vertentes")]
+
+	success = sum(chunk.get("success", 0) for chunk in chunks)
+	failed = sum(chunk.get("failed", 0) for chunk in chunks)
+	up_to_date = sum(chunk.get("up_to_date", 0) for chunk in chunks)
+	failed_chunks = [chunk["chunk"] for chunk in chunks if "error" in chunk]
+
+	if failed == 0 and not failed_chunks:
+		status = "success"
+	else:
+		status = "partial" if success > 0 else "failed"
+
+	info = {
+		"status": status,
+		"chunks": len(chunks),
+		"failed_chunks": failed_chunks,
+		"success": success,
+		"failed": failed,
+		"up_to_date": up_to_date,
+		"total_docs_updated": sum(
+			chunk.get("total_docs_updated", 0) for chunk in chunks
+		),
+		# Chunks rodam em paralelo: o tempo do job é o do chunk mais lento
+		"max_chunk_time_seconds": max(
+			(chunk.get("total_time_seconds", 0) for chunk in chunks), default=0
+		),
+	}
+	logger.info(f"WTSS sharded job finished:\n{info}", extra=info)
+
+	try:
+		coffee_repo.update_wtss_report(
+			db,
+			wtss_job_key(start_date, end_date),
+			{
+				"$set": {
+					"status": status,
+					"summary.up_to_date": up_to_date,
+					**{
+						f"chunks.{chunk['chunk']}.status": "failed"
+						for chunk in chunks
+						if "error" in chunk
+					},
+					"updated_at": get_utc_now(),
+				}
+			},
+		)
+	finally:
+		client.close()
+
+	return info
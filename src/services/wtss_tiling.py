@@ -0,0 +1,135 @@
+"""Spatial tiling of large geometries on the S2-16D-2 pixel grid."""
+
+import math
+from os import getenv as env
+from typing import List
+
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+from shapely.geometry import GeometryCollection, MultiPolygon, Polygon
+from shapely.geometry.base import BaseGeometry
+
+# Projeção Albers equivalente do BDC (grade BDC_SM_V2 usada pelo S2-16D-2)
+BDC_CRS = (
+	"+proj=aea +lat_0=-12 +lon_0=-54 +lat_1=-2 +lat_2=-22 "
+	"+x_0=5000000 +y_0=10000000 +ellps=GRS80 +units=m +no_defs"
+)
+PIXEL_SIZE = 10.0
+MAX_TILE_PIXELS = int(env("WTSS_MAX_TILE_PIXELS", "250000"))
+
+
+def transform_geometry(geom: BaseGeometry, transformer: Transformer) -> BaseGeometry:
+	"""
+	Reprojects a geometry with a pyproj transformer (vectorized over coordinates).
+
+	:param geom: Geometry to be reprojected
+	:type geom: BaseGeometry
+	:param transformer: Transformer between source and target CRS
+	:type transformer: Transformer
+	:return: Reprojected geometry
+	:rtype: BaseGeometry
+	"""
+	return shapely.transform(
+		geom,
+		lambda coords: np.column_stack(
+			transformer.transform(coords[:, 0], coords[:, 1])
+		),
+	)
+
+
+def polygonal_part(geom: BaseGeometry) -> Polygon | MultiPolygon | None:
+	"""
+	Keeps only the polygonal part of an intersection result.
+
+	:param geom: Intersection result
+	:type geom: BaseGeometry
+	:return: Polygon or MultiPolygon, or None if nothing polygonal is left
+	:rtype: Polygon | MultiPolygon | None
+	"""
+	if isinstance(geom, (Polygon, MultiPolygon)):
+		return None if geom.is_empty else geom
+
+	if isinstance(geom, GeometryCollection):
+		parts = [
+			part
+			for part in geom.geoms
+			if isinstance(part, (Polygon, MultiPolygon)) and not part.is_empty
+		]
+		if parts:
+			return shapely.union_all(parts)
+
+	return None
+
+
+def tile_geometry(
+	geom: Polygon | MultiPolygon,
+	crs: str = "EPSG:4326",
+	max_pixels: int = MAX_TILE_PIXELS,
+) -> List[Polygon | MultiPolygon]:
+	"""
+	Splits a geometry into tiles aligned to the S2-16D-2 10 m grid.
+
+	Geometries covering up to ``max_pixels`` pixels are returned untouched.
+	Larger ones are intersected with square tiles whose edges fall on pixel
+	edges, so each pixel center belongs to a single tile.
+
+	:param geom: Geometry in ``crs`` coordinates
+	:type geom: Polygon | MultiPolygon
+	:param crs: CRS of the geometry
+	:type crs: str
+	:param max_pixels: Maximum number of pixels per tile
+	:type max_pixels: int
+	:return: List of tiles in ``crs`` coordinates
+	:rtype: List[Polygon | MultiPolygon]
+	"""
+	to_grid = Transformer.from_crs(crs, BDC_CRS, always_xy=True)
+	projected = transform_geometry(geom, to_grid)
+
+	if projected.area / PIXEL_SIZE**2 <= max_pixels:
+		return [geom]
+
+	side = max(1, math.isqrt(max_pixels)) * PIXEL_SIZE
+	minx, miny, maxx, maxy = projected.bounds
+
+	xs = np.arange(math.floor(minx / side) * side, maxx, side)
+	ys = np.arange(math.floor(miny / side) * side, maxy, side)
+	x0, y0 = (a.ravel() for a in np.meshgrid(xs, ys))
+	boxes = shapely.box(x0, y0, x0 + side, y0 + side)
+
+	shapely.prepare(projected)
+	boxes = boxes[shapely.intersects(projected, boxes)]
+
+	to_source = Transformer.from_crs(BDC_CRS, crs, always_xy=True)
+	tiles = []
+	for part in shapely.intersection(boxes, projected):
+		part = polygonal_part(part)
+		if part is not None:
+			tiles.append(transform_geometry(part, to_source))
+
+	return tiles or [geom]
+
+
+def merge_tiles(frames: List[pd.DataFrame]) -> pd.DataFrame:
+	"""
+	Merges the WTSS time series of the tiles of a single geometry.
+
+	Pixels on tile edges may be returned by more than one request, so repeated
+	(pixel, datetime, attribute) rows are dropped.
+
+	:param frames: Time series of each tile in long format
+	:type frames: List[pd.DataFrame]
+	:return: Merged time series
+	:rtype: pd.DataFrame
+	"""
+	frames = [df for df in frames if not df.empty]
+
+	if not frames:
+		return pd.DataFrame()
+	if len(frames) == 1:
+		return frames[0]
+
+	return pd.concat(frames, ignore_index=True).drop_duplicates(
+		subset=["geometry", "datetime", "attribute"], ignore_index=True
+	)
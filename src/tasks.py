@@ -2,7 +2,11 @@ from os import getenv as env
 from pathlib import Path
 
 import geopandas as gpd
+from celery import chord
+from celery.signals import worker_process_init
 from celery.utils.log import get_task_logger
+from pymongo import MongoClient
+from shapely.geometry import shape
 
 from src.models.bdc import (
 	BDCBasePayload,
@@ -10,14 +14,45 @@ from src.models.bdc import (
 	parse_stac_payload,
 	parse_wtss_payload,
 )
+from src.services.coffee_areas import get_coffee_index
+from src.services.coffee_service import run_area_stats
+from src.services.geometry_store import geometry_store
+from src.services.maintenance_service import (
+	compact_coffee_time_series,
+	migrate_coffee_to_buckets,
+	rebuild_coffee_rollups,
+)
 from src.services.stac_service import run_stac
-from src.services.wtss_service import run_wtss
+from src.services.wtss_service import (
+	chunk_id,
+	chunk_ranges,
+	extract_polygons,
+	finish_wtss_chunks,
+	run_wtss,
+	start_wtss_report,
+	wtss_job_key,
+)
 from src.worker import app
 
 logger = get_task_logger(__name__)
 
 CAMPO_VERTENTES_SHP = Path(env("CAMPO_VERTENTES_SHAPEFILE_PATH"))
 COFFEE_SHP = Path(env("COFFEE_SHAPEFILE_PATH"))
+WTSS_CHUNK_SIZE = int(env("WTSS_CHUNK_SIZE", "200"))
+WTSS_CHUNK_MAX_RETRIES = int(env("WTSS_CHUNK_MAX_RETRIES", "3"))
+
+
+@worker_process_init.connect
+def preload_geometries(**kwargs):
+	"""
+	Loads the reference shapefiles once per worker process, before any task.
+	"""
+	geometry_store.preload(COFFEE_SHP, CAMPO_VERTENTES_SHP)
+
+	try:
+		get_coffee_index(COFFEE_SHP)
+	except Exception:
+		logger.exception("Could not build the coffee area index")
 
 
 @app.task
@@ -55,11 +90,45 @@ def bdc_cron():
 	return "BDC cron tasks enqueued."
 
 
+def load_wtss_gdf(parsed_payload: WTSSPayload) -> gpd.GeoDataFrame:
+	"""
+	Loads the geometries of a WTSS job.
+
+	Geometries sent by the API or the admin are clipped to the coffee areas.
+
+	:param parsed_payload: The validated WTSS payload
+	:type parsed_payload: WTSSPayload
+	:return: Geometries to be processed
+	:rtype: gpd.GeoDataFrame
+	"""
+	if (
+		parsed_payload.source == "cron"
+		or parsed_payload.source == "admin"
+		and parsed_payload.geometry is None
+	):
+		logger.info(f"Loading GeoDataFrame from {COFFEE_SHP}")
+		return geometry_store.get(COFFEE_SHP)
+
+	logger.info("Loading GeoDataFrame from payload geometry")
+	geometry = parsed_payload.geometry
+	if geometry.get("type") in ("Feature", "FeatureCollection"):
+		gdf = gpd.GeoDataFrame.from_features(geometry)
+	else:
+		gdf = gpd.GeoDataFrame(geometry=[shape(geometry)])
+
+	# Só as áreas de café dentro da geometria são buscadas, com o geocodigo certo
+	return get_coffee_index(COFFEE_SHP).clip(gdf)
+
+
 @app.task
 def handle_wtss(payload: dict):
 	"""
 	Processing task for WTSS queue messages.
 
+	Jobs with more than ``WTSS_CHUNK_SIZE`` polygons are split into chunk tasks
+	(fan-out) that run on any worker of the queue; ``finish_wtss`` aggregates
+	their summaries into the job report once all of them finished (fan-in).
+
 	:param payload: The payload containing WTSS task details
 	:type payload: dict
 	:return: Confirmation message
@@ -72,27 +141,101 @@ def handle_wtss(payload: dict):
 			f"Received WTSS task with payload: {parsed_payload.model_dump_json()}"
 		)
 
-		if (
-			parsed_payload.source == "cron"
-			or parsed_payload.source == "admin"
-			and parsed_payload.geometry is None
-		):
-			logger.info(f"Loading GeoDataFrame from {COFFEE_SHP}")
-			gdf = gpd.read_file(COFFEE_SHP)
-		else:
-			logger.info("Loading GeoDataFrame from payload geometry")
-			gdf = gpd.GeoDataFrame.from_features(parsed_payload.geometry)
+		gdf = load_wtss_gdf(parsed_payload)
+		total_polygons = len(extract_polygons(gdf))
 
-		return f"Received WTSS task with payload: {parsed_payload.model_dump_json()}"
+		if total_polygons <= WTSS_CHUNK_SIZE:
+			run_wtss(
+				gdf=gdf,
+				start_date=parsed_payload.start_date,
+				end_date=parsed_payload.end_date,
+				mode=parsed_payload.mode,
+			)
+			return "WTSS task finished successfully."
 
-		run_wtss(
-			gdf=gdf,
+		# O relatório é criado antes do fan-out para os chunks não disputarem o insert
+		if parsed_payload.mode == "full":
+			client = MongoClient(env("DB_URL", "mongodb://mongo:27017/"))
+			try:
+				start_wtss_report(
+					client[env("DB_NAME", "campo_vertentes")],
+					wtss_job_key(parsed_payload.start_date, parsed_payload.end_date),
+					total_polygons,
+				)
+			finally:
+				client.close()
+
+		ranges = chunk_ranges(total_polygons, WTSS_CHUNK_SIZE)
+		chord(handle_wtss_chunk.s(payload, start, stop) for start, stop in ranges)(
+			finish_wtss.s(parsed_payload.start_date, parsed_payload.end_date)
+		)
+		return f"WTSS task split into {len(ranges)} chunks."
+	except Exception as e:
+		logger.error(f"Error processing WTSS task: {e}", exc_info=True)
+		raise  # FAILURE
+
+
+@app.task(bind=True, max_retries=WTSS_CHUNK_MAX_RETRIES)
+def handle_wtss_chunk(self, payload: dict, start: int, stop: int):
+	"""
+	Processes the polygons ``[start, stop)`` of a WTSS job.
+
+	A chunk that fails is retried on its own, resuming from its checkpoint. Once
+	the retries run out, the failure is returned instead of raised so that the
+	remaining chunks still reach ``finish_wtss``; it can later be re-run alone
+	with ``mode="resume"``.
+
+	:param payload: The payload of the WTSS job
+	:type payload: dict
+	:param start: First polygon index of the chunk
+	:type start: int
+	:param stop: Polygon index after the last one of the chunk
+	:type stop: int
+	:return: Summary of the chunk
+	:rtype: dict
+	"""
+	try:
+		parsed_payload: WTSSPayload = parse_wtss_payload(payload)
+
+		# Numa retentativa, continua de onde o chunk parou
+		mode = parsed_payload.mode
+		if self.request.retries and mode == "full":
+			mode = "resume"
+
+		return run_wtss(
+			gdf=load_wtss_gdf(parsed_payload),
 			start_date=parsed_payload.start_date,
 			end_date=parsed_payload.end_date,
+			mode=mode,
+			index_range=(start, stop),
 		)
-		return "WTSS task finished successfully."
 	except Exception as e:
-		logger.error(f"Error processing WTSS task: {e}", exc_info=True)
+		if self.request.retries < self.max_retries:
+			logger.warning(f"Error processing WTSS chunk {start}-{stop}, retrying: {e}")
+			raise self.retry(exc=e, countdown=60 * 2**self.request.retries)
+
+		logger.error(f"Error processing WTSS chunk {start}-{stop}: {e}", exc_info=True)
+		return {"chunk": chunk_id((start, stop)), "status": "failed", "error": str(e)}
+
+
+@app.task
+def finish_wtss(chunks: list[dict], start_date: str, end_date: str):
+	"""
+	Fan-in task that aggregates the chunk summaries of a sharded WTSS job.
+
+	:param chunks: Summaries returned by the chunk tasks
+	:type chunks: list[dict]
+	:param start_date: Start date of the job
+	:type start_date: str
+	:param end_date: End date of the job
+	:type end_date: str
+	:return: Summary of the job
+	:rtype: dict
+	"""
+	try:
+		return finish_wtss_chunks(start_date, end_date, chunks)
+	except Exception as e:
+		logger.error(f"Error finishing WTSS job: {e}", exc_info=True)
 		raise  # FAILURE
 
 
@@ -113,7 +256,7 @@ def handle_stac(payload: dict):
 			f"Received STAC task with payload: {parsed_payload.model_dump_json()}"
 		)
 
-		gdf = gpd.read_file(CAMPO_VERTENTES_SHP)
+		gdf = geometry_store.get(CAMPO_VERTENTES_SHP)
 
 		run_stac(
 			gdf=gdf,
@@ -124,3 +267,77 @@ def handle_stac(payload: dict):
 	except Exception as e:
 		logger.error(f"Error processing STAC task: {e}", exc_info=True)
 		raise  # FAILURE
+
+
+@app.task
+def compact_cafe(batch_size: int = 500, pause_seconds: float = 0.0):
+	"""
+	One-off task that deduplicates the time series of 'cafe' and 'cafe_buckets'.
+
+	:param batch_size: Number of documents scanned per batch
+	:type batch_size: int
+	:param pause_seconds: Pause between batches
+	:type pause_seconds: float
+	:return: Scanned and modified document counts
+	:rtype: dict
+	"""
+	try:
+		return compact_coffee_time_series(batch_size, pause_seconds)
+	except Exception as e:
+		logger.error(f"Error compacting 'cafe' time series: {e}", exc_info=True)
+		raise  # FAILURE
+
+
+@app.task
+def migrate_cafe_buckets(batch_size: int = 200, pause_seconds: float = 0.0):
+	"""
+	One-off task that copies the 'cafe' time series into yearly buckets.
+
+	:param batch_size: Number of documents migrated per batch
+	:type batch_size: int
+	:param pause_seconds: Pause between batches
+	:type pause_seconds: float
+	:return: Migrated document and written bucket counts
+	:rtype: dict
+	"""
+	try:
+		return migrate_coffee_to_buckets(batch_size, pause_seconds)
+	except Exception as e:
+		logger.error(f"Error migrating 'cafe' to buckets: {e}", exc_info=True)
+		raise  # FAILURE
+
+
+@app.task
+def rebuild_rollups(batch_size: int = 20, pause_seconds: float = 0.0):
+	"""
+	One-off task that recomputes every municipality rollup in 'cafe_rollups'.
+
+	:param batch_size: Number of municipalities recomputed per batch
+	:type batch_size: int
+	:param pause_seconds: Pause between batches
+	:type pause_seconds: float
+	:return: Rebuilt municipality count
+	:rtype: dict
+	"""
+	try:
+		return rebuild_coffee_rollups(batch_size, pause_seconds)
+	except Exception as e:
+		logger.error(f"Error rebuilding rollups: {e}", exc_info=True)
+		raise  # FAILURE
+
+
+@app.task
+def aggregate_area(payload: dict):
+	"""
+	Background task that aggregates an attribute per timestamp inside an area.
+
+	:param payload: A serialized area aggregate request
+	:type payload: dict
+	:return: The area statistics
+	:rtype: dict
+	"""
+	try:
+		return run_area_stats(payload)
+	except Exception as e:
+		logger.error(f"Error aggregating area statistics: {e}", exc_info=True)
+		raise  # FAILURE
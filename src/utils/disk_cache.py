@@ -0,0 +1,115 @@
+"""Base of the size-bounded LRU caches stored as files on a directory."""
+
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import BinaryIO
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+	"""
+	Size-bounded LRU store of files addressed by hex keys.
+
+	Entries live under a two-character fan-out directory. Writes are atomic,
+	hits refresh the file mtime and, once ``max_bytes`` is exceeded, the least
+	recently used entries are deleted down to 90% of the cap. Subclasses set
+	the entry ``suffix`` and the ``name`` used in the logs.
+	"""
+
+	suffix = ".bin"
+	name = "Disk"
+
+	def __init__(self, directory: str | Path, max_bytes: int):
+		"""
+		Initialize the cache on a directory.
+
+		:param directory: Directory where entries are stored
+		:type directory: str | Path
+		:param max_bytes: Maximum total size of the entries
+		:type max_bytes: int
+		"""
+		self.directory = Path(directory)
+		self.directory.mkdir(parents=True, exist_ok=True)
+		self.max_bytes = max_bytes
+		self._lock = threading.Lock()
+		self._total_bytes = sum(path.stat().st_size for path in self._entries())
+
+	def _entries(self) -> list[Path]:
+		return list(self.directory.glob(f"*/*{self.suffix}"))
+
+	def _path(self, key: str) -> Path:
+		return self.directory / key[:2] / f"{key}{self.suffix}"
+
+	def _touch(self, path: Path):
+		try:
+			os.utime(path)  # LRU
+		except FileNotFoundError:
+			pass  # Removido por outro processo depois da leitura: ainda é um acerto
+
+	def _write(self, path: Path, write: Callable[[BinaryIO], None]):
+		"""
+		Writes an entry atomically and evicts the least recently used ones if needed.
+
+		:param path: Entry path
+		:type path: Path
+		:param write: Callable writing the entry contents to an open file
+		:type write: Callable[[BinaryIO], None]
+		"""
+		path.parent.mkdir(exist_ok=True)
+
+		# Escrita atômica: outros workers nunca leem uma entrada pela metade
+		fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+		try:
+			with os.fdopen(fd, "wb") as file:
+				write(file)
+			size = os.stat(tmp).st_size
+			try:
+				replaced = path.stat().st_size  # Sobrescrita: não conta duas vezes
+			except FileNotFoundError:
+				replaced = 0
+			os.replace(tmp, path)
+		except BaseException:
+			Path(tmp).unlink(missing_ok=True)
+			raise
+
+		with self._lock:
+			self._total_bytes += size - replaced
+			if self._total_bytes > self.max_bytes:
+				self._evict()
+
+	def _remove(self, path: Path):
+		try:
+			size = path.stat().st_size
+			path.unlink()
+		except FileNotFoundError:
+			return
+		with self._lock:
+			self._total_bytes -= size
+
+	def _evict(self):
+		"""Deletes least recently used entries until the cache is at 90% of its cap."""
+		entries = []
+		for path in self._entries():
+			try:
+				stat = path.stat()
+			except FileNotFoundError:
+				continue
+			entries.append((stat.st_mtime, stat.st_size, path))
+
+		entries.sort()
+		total = sum(size for _, size, _ in entries)
+		target = int(self.max_bytes * 0.9)
+
+		for _, size, path in entries:
+			if total <= target:
+				break
+			path.unlink(missing_ok=True)
+			total -= size
+
+		self._total_bytes = total
+		logger.info(f"{self.name} cache evicted down to {total / 1024**2:.1f} MiB")
@@ -0,0 +1,133 @@
+"""Executor helpers for bounded, ordered concurrent processing."""
+
+import logging
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future
+from typing import Any, TypeVar
+
+import billiard
+from billiard.pool import Pool
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def ordered_submit(
+	executor: Executor,
+	fn: Callable[[T], R],
+	items: Iterable[T],
+	max_in_flight: int,
+) -> Iterator[tuple[T, Future[R]]]:
+	"""
+	Submits ``fn(item)`` for every item while keeping at most ``max_in_flight``
+	calls pending, and yields ``(item, future)`` pairs in submission order.
+
+	Consumers can therefore process results (and checkpoint progress) in the same
+	order as ``items`` while the executor keeps the next requests running.
+	Futures still queued when the consumer stops iterating are cancelled.
+
+	:param executor: Thread or process pool executor
+	:type executor: Executor
+	:param fn: Callable applied to each item
+	:type fn: Callable[[T], R]
+	:param items: Items to process
+	:type items: Iterable[T]
+	:param max_in_flight: Maximum number of pending futures
+	:type max_in_flight: int
+	:return: Iterator of ``(item, future)`` pairs in submission order
+	:rtype: Iterator[tuple[T, Future[R]]]
+	"""
+	max_in_flight = max(1, max_in_flight)
+	pending: deque[tuple[T, Future[R]]] = deque()
+
+	try:
+		for item in items:
+			pending.append((item, executor.submit(fn, item)))
+
+			if len(pending) >= max_in_flight:
+				yield pending.popleft()
+
+		while pending:
+			yield pending.popleft()
+	finally:
+		for _, future in pending:
+			future.cancel()
+
+
+def start_process_pool(
+	processes: int,
+	initializer: Callable[..., Any] | None = None,
+	initargs: tuple = (),
+	maxtasksperchild: int | None = None,
+) -> Pool | None:
+	"""
+	Starts a process pool that also works inside Celery workers.
+
+	The pool comes from ``billiard``, Celery's fork of multiprocessing, which can
+	be started inside the daemonic prefork children that run the tasks (a
+	``ProcessPoolExecutor`` cannot). Callers fall back to in-process work when
+	None is returned.
+
+	:param processes: Number of worker processes
+	:type processes: int
+	:param initializer: Called once in each worker process
+	:type initializer: Callable[..., Any] | None
+	:param initargs: Arguments of ``initializer``
+	:type initargs: tuple
+	:param maxtasksperchild: Tasks after which a worker is replaced, if bounded
+	:type maxtasksperchild: int | None
+	:return: The pool, or None when ``processes`` is 1 or it cannot be started
+	:rtype: Pool | None
+	"""
+	if processes <= 1:
+		return None
+
+	try:
+		return billiard.Pool(
+			processes,
+			initializer=initializer,
+			initargs=initargs,
+			maxtasksperchild=maxtasksperchild,
+		)
+	except OSError as e:
+		logger.warning(f"Process pool unavailable, running in-process: {e}")
+		return None
+
+
+def ordered_apply(
+	pool: Pool,
+	fn: Callable[[T], R],
+	items: Iterable[T],
+	max_in_flight: int,
+) -> Iterator[R]:
+	"""
+	Applies ``fn`` to every item in a process pool, yielding results in order.
+
+	Like ``ordered_submit``, at most ``max_in_flight`` calls are pending, so
+	items are read lazily and results are consumed in submission order.
+
+	:param pool: Pool from ``start_process_pool``
+	:type pool: Pool
+	:param fn: Picklable callable applied to each item
+	:type fn: Callable[[T], R]
+	:param items: Items to process
+	:type items: Iterable[T]
+	:param max_in_flight: Maximum number of pending calls
+	:type max_in_flight: int
+	:return: Iterator of the results, in input order
+	:rtype: Iterator[R]
+	"""
+	max_in_flight = max(1, max_in_flight)
+	pending = deque()
+
+	for item in items:
+		pending.append(pool.apply_async(fn, (item,)))
+
+		if len(pending) >= max_in_flight:
+			yield pending.popleft().get()
+
+	while pending:
+		yield pending.popleft().get()
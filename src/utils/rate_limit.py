@@ -0,0 +1,175 @@
+"""Adaptive token-bucket rate limiting shared across worker processes."""
+
+import logging
+import threading
+import time
+from os import getenv as env
+
+logger = logging.getLogger(__name__)
+
+# Atomically refills the bucket at the current rate and takes one token.
+# Returns 0 when a token was taken, otherwise the seconds to wait for one.
+_ACQUIRE = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or burst)
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or now)
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+	tokens = tokens - 1
+else
+	wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'rate', rate, 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Multiplies the shared rate by ARGV[1], bounded to [ARGV[2], ARGV[3]]
+_SCALE = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate') or ARGV[4])
+rate = math.max(tonumber(ARGV[2]), math.min(tonumber(ARGV[3]), rate * tonumber(ARGV[1])))
+redis.call('HSET', KEYS[1], 'rate', rate)
+return tostring(rate)
+"""
+
+
+class AdaptiveRateLimiter:
+	"""
+	Token bucket whose rate adapts to the remote server (AIMD).
+
+	Every request takes a token. Throttling responses (429/503) halve the rate
+	and each success raises it by a small factor, so throughput converges to the
+	server's real limit. With ``redis_url`` the bucket lives in Redis and is
+	shared by all Celery worker processes; without it a local, thread-safe
+	bucket is used as a stand-in.
+	"""
+
+	def __init__(
+		self,
+		name: str,
+		rate: float,
+		min_rate: float,
+		max_rate: float,
+		burst: int,
+		redis_url: str | None = None,
+		increase: float = 1.05,
+		decrease: float = 0.5,
+	):
+		"""
+		Initialize the limiter.
+
+		:param name: Bucket name (Redis key suffix)
+		:type name: str
+		:param rate: Initial rate in requests per second
+		:type rate: float
+		:param min_rate: Lower bound of the rate
+		:type min_rate: float
+		:param max_rate: Upper bound of the rate
+		:type max_rate: float
+		:param burst: Bucket capacity
+		:type burst: int
+		:param redis_url: Redis URL of the shared bucket, or None for a local one
+		:type redis_url: str | None
+		:param increase: Rate factor applied on success
+		:type increase: float
+		:param decrease: Rate factor applied on throttling
+		:type decrease: float
+		"""
+		self.key = f"rate_limit:{name}"
+		self.rate = rate
+		self.min_rate = min_rate
+		self.max_rate = max_rate
+		self.burst = burst
+		self.increase = increase
+		self.decrease = decrease
+
+		self._lock = threading.Lock()
+		self._tokens = float(burst)
+		self._updated = time.monotonic()
+		self._redis = None
+
+		if redis_url:
+			import redis
+
+			client = redis.Redis.from_url(redis_url)
+			self._redis = client
+			self._acquire_script = client.register_script(_ACQUIRE)
+			self._scale_script = client.register_script(_SCALE)
+
+	def acquire(self):
+		"""Blocks until a token is available."""
+		while (wait := self._try_acquire()) > 0:
+			time.sleep(wait)
+
+	def _try_acquire(self) -> float:
+		if self._redis is not None:
+			try:
+				return float(
+					self._acquire_script(
+						keys=[self.key], args=[self.rate, self.burst, time.time()]
+					)
+				)
+			except Exception:
+				logger.warning("Redis rate limiter unavailable, using local bucket")
+
+		with self._lock:
+			now = time.monotonic()
+			self._tokens = min(
+				self.burst, self._tokens + (now - self._updated) * self.rate
+			)
+			self._updated = now
+
+			if self._tokens >= 1:
+				self._tokens -= 1
+				return 0.0
+			return (1 - self._tokens) / self.rate
+
+	def _scale(self, factor: float):
+		if self._redis is not None:
+			try:
+				self.rate = float(
+					self._scale_script(
+						keys=[self.key],
+						args=[factor, self.min_rate, self.max_rate, self.rate],
+					)
+				)
+				return
+			except Exception:
+				logger.warning("Redis rate limiter unavailable, using local bucket")
+
+		with self._lock:
+			self.rate = max(self.min_rate, min(self.max_rate, self.rate * factor))
+
+	def reward(self):
+		"""Raises the rate after a successful request."""
+		self._scale(self.increase)
+
+	def penalize(self):
+		"""Cuts the rate after a throttling response."""
+		self._scale(self.decrease)
+		logger.info(f"Rate limit '{self.key}' lowered to {self.rate:.2f} req/s")
+
+
+def get_rate_limiter(name: str) -> AdaptiveRateLimiter:
+	"""
+	Builds a limiter configured by the ``<NAME>_RATE_*`` environment variables.
+
+	The bucket is shared through ``RATE_LIMIT_REDIS_URL`` when it is set.
+
+	:param name: Limiter name, e.g. "wtss"
+	:type name: str
+	:return: Configured limiter
+	:rtype: AdaptiveRateLimiter
+	"""
+	prefix = name.upper()
+	return AdaptiveRateLimiter(
+		name=name,
+		rate=float(env(f"{prefix}_RATE_LIMIT", "5")),
+		min_rate=float(env(f"{prefix}_RATE_LIMIT_MIN", "0.2")),
+		max_rate=float(env(f"{prefix}_RATE_LIMIT_MAX", "50")),
+		burst=int(env(f"{prefix}_RATE_LIMIT_BURST", "10")),
+		redis_url=env("RATE_LIMIT_REDIS_URL") or None,
+	)
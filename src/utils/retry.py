@@ -0,0 +1,110 @@
+"""Retry helpers with jittered exponential backoff for HTTP calls."""
+
+import logging
+import random
+import time
+from collections.abc import Callable
+from os import getenv as env
+from typing import TypeVar
+
+from requests.exceptions import HTTPError, RequestException
+
+from src.utils.rate_limit import AdaptiveRateLimiter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAX_RETRIES = int(env("HTTP_MAX_RETRIES", "5"))
+BASE_DELAY_SECONDS = float(env("HTTP_RETRY_BASE_DELAY", "1"))
+MAX_DELAY_SECONDS = float(env("HTTP_RETRY_MAX_DELAY", "60"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+THROTTLING_STATUS = {429, 503}
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+	"""
+	Computes an exponential backoff delay with full jitter.
+
+	:param attempt: Zero-based attempt number
+	:type attempt: int
+	:param base: Delay of the first retry
+	:type base: float
+	:param cap: Maximum delay
+	:type cap: float
+	:return: Delay in seconds
+	:rtype: float
+	"""
+	return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def _status_code(error: RequestException) -> int | None:
+	response = getattr(error, "response", None)
+	return response.status_code if response is not None else None
+
+
+def _retry_after(error: RequestException) -> float | None:
+	response = getattr(error, "response", None)
+	value = response.headers.get("Retry-After") if response is not None else None
+	try:
+		return float(value) if value is not None else None
+	except ValueError:
+		return None  # Formato de data HTTP não é suportado
+
+
+def call_with_retries(
+	fn: Callable[[], T],
+	limiter: AdaptiveRateLimiter | None = None,
+	retries: int = MAX_RETRIES,
+	base_delay: float = BASE_DELAY_SECONDS,
+	max_delay: float = MAX_DELAY_SECONDS,
+) -> T:
+	"""
+	Calls ``fn`` retrying transient HTTP failures with jittered backoff.
+
+	Connection errors, timeouts and retryable status codes (429, 5xx) are
+	retried, honouring ``Retry-After`` when present. Other HTTP errors are
+	raised immediately. When a limiter is given, each attempt takes a token,
+	throttling responses lower its rate and successes raise it.
+
+	:param fn: Callable performing the request
+	:type fn: Callable[[], T]
+	:param limiter: Shared rate limiter
+	:type limiter: AdaptiveRateLimiter | None
+	:param retries: Maximum number of retries
+	:type retries: int
+	:param base_delay: Delay of the first retry in seconds
+	:type base_delay: float
+	:param max_delay: Maximum delay between attempts in seconds
+	:type max_delay: float
+	:return: Result of ``fn``
+	:rtype: T
+	:raises RequestException: When the error is not retryable or retries ran out
+	"""
+	for attempt in range(retries + 1):
+		if limiter is not None:
+			limiter.acquire()
+
+		try:
+			result = fn()
+		except RequestException as e:
+			status = _status_code(e)
+
+			if isinstance(e, HTTPError) and status not in RETRYABLE_STATUS:
+				raise
+			if limiter is not None and status in THROTTLING_STATUS:
+				limiter.penalize()
+			if attempt == retries:
+				raise
+
+			delay = _retry_after(e) or backoff_delay(attempt, base_delay, max_delay)
+			logger.warning(
+				f"Request failed (status={status}, attempt={attempt + 1}/{retries + 1})"
+				f", retrying in {delay:.1f}s: {e}"
+			)
+			time.sleep(delay)
+		else:
+			if limiter is not None:
+				limiter.reward()
+			return result
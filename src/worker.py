@@ -14,8 +14,14 @@ app = Celery(
 
 app.conf.task_routes = {
 	"src.tasks.handle_wtss": {"queue": "bdc.wtss"},
+	"src.tasks.handle_wtss_chunk": {"queue": "bdc.wtss"},
+	"src.tasks.finish_wtss": {"queue": "bdc.wtss"},
 	"src.tasks.handle_stac": {"queue": "bdc.stac"},
 	"src.tasks.wtss_cron": {"queue": "bdc.wtss"},
+	"src.tasks.compact_cafe": {"queue": "bdc.wtss"},
+	"src.tasks.migrate_cafe_buckets": {"queue": "bdc.wtss"},
+	"src.tasks.rebuild_rollups": {"queue": "bdc.wtss"},
+	"src.tasks.aggregate_area": {"queue": "coffee.aggregate"},
 }
 
 app.conf.beat_schedule = {
@@ -0,0 +1,50 @@
+import geopandas as gpd
+from shapely.geometry import box
+
+from src.services.coffee_areas import CoffeeAreaIndex
+from src.services.wtss_service import extract_polygons, polygon_key
+
+# Coordenadas SIRGAS 2000 / UTM 23S, como no shapefile de café
+SOURCE_CRS = "EPSG:31983"
+
+
+def coffee_areas() -> gpd.GeoDataFrame:
+	return gpd.GeoDataFrame(
+		{"CD_MUN": ["3100104", "3100104", "3100203"]},
+		geometry=[
+			box(500_000, 7_650_000, 500_300, 7_650_200),
+			box(500_500, 7_650_000, 500_700, 7_650_400),
+			box(502_000, 7_651_000, 502_900, 7_651_900),
+		],
+		crs=SOURCE_CRS,
+	)
+
+
+def request(*bounds: float) -> gpd.GeoDataFrame:
+	"""Requested area in WGS 84, as sent by the API."""
+	return gpd.GeoDataFrame(geometry=[box(*bounds)], crs=SOURCE_CRS).to_crs("EPSG:4326")
+
+
+def keys(gdf: gpd.GeoDataFrame) -> set[str]:
+	return {polygon_key(*polygon) for polygon in extract_polygons(gdf)}
+
+
+def test_covered_polygons_share_keys_with_scheduled_runs():
+	source = coffee_areas()
+	index = CoffeeAreaIndex(source)
+
+	clipped = index.clip(request(499_900, 7_649_900, 500_800, 7_650_500))
+
+	assert clipped.crs == source.crs
+	assert keys(clipped) == keys(source.iloc[:2])
+
+
+def test_partially_covered_polygon_is_clipped():
+	source = coffee_areas()
+	index = CoffeeAreaIndex(source)
+
+	clipped = index.clip(request(502_000, 7_651_000, 502_450, 7_651_900))
+
+	assert list(clipped["CD_MUN"]) == ["3100203"]
+	assert clipped.geometry.iloc[0].area < source.geometry.iloc[2].area
+	assert not keys(clipped) & keys(source)
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from src.services.landsat_qa import (
+	LST_NODATA,
+	QA_CIRRUS,
+	QA_CLEAR,
+	QA_CLOUD,
+	QA_CLOUD_SHADOW,
+	QA_DILATED_CLOUD,
+	QA_FILL,
+	QA_WATER,
+	RADSAT_LWIR11,
+	RADSAT_NIR,
+	decode_qa_pixel,
+	mask_landsat_block,
+	qa_mask,
+	surface_temperature,
+)
+
+# Valores típicos do QA_PIXEL (Landsat 8/9 Collection 2)
+CLEAR_LAND = 21824  # limpo, confiança baixa de nuvem/sombra/neve/cirros
+CLEAR_WATER = 21952
+HIGH_CLOUD = 22280  # nuvem, confiança alta
+CLOUD_SHADOW = QA_CLOUD_SHADOW | (1 << 8) | (3 << 10) | (1 << 12) | (1 << 14)
+FILL = 1
+
+
+def test_decode_qa_pixel_known_values():
+	decoded = decode_qa_pixel(
+		np.array([CLEAR_LAND, CLEAR_WATER, HIGH_CLOUD, CLOUD_SHADOW, FILL])
+	)
+
+	np.testing.assert_array_equal(decoded["clear"], [True, True, False, False, False])
+	np.testing.assert_array_equal(decoded["water"], [False, True, False, False, False])
+	np.testing.assert_array_equal(decoded["cloud"], [False, False, True, False, False])
+	np.testing.assert_array_equal(
+		decoded["cloud_shadow"], [False, False, False, True, False]
+	)
+	np.testing.assert_array_equal(decoded["fill"], [False, False, False, False, True])
+	np.testing.assert_array_equal(decoded["cloud_confidence"], [1, 1, 3, 1, 0])
+
+
+def test_qa_mask_bits():
+	qa_pixel = np.array(
+		[
+			QA_CLEAR,
+			QA_CLEAR | QA_WATER,
+			QA_FILL,
+			QA_DILATED_CLOUD,
+			QA_CIRRUS,
+			QA_CLOUD,
+			QA_CLOUD_SHADOW,
+		],
+		dtype=np.uint16,
+	)
+	qa_radsat = np.array([0, RADSAT_NIR, 0, 0, 0, 0, 0], dtype=np.uint16)
+
+	np.testing.assert_array_equal(
+		qa_mask(qa_pixel), [True, True, False, False, False, False, False]
+	)
+	np.testing.assert_array_equal(
+		qa_mask(qa_pixel, qa_radsat, radsat_bits=RADSAT_NIR),
+		[True, False, False, False, False, False, False],
+	)
+
+
+def test_surface_temperature_scale_and_offset():
+	lwir = np.array([LST_NODATA, 1, 44000, 65535], dtype=np.uint16)
+
+	kelvin = surface_temperature(lwir, celsius=False)
+	assert np.isnan(kelvin[0])
+	np.testing.assert_allclose(
+		kelvin[1:],
+		[149.00341802, 44000 * 0.00341802 + 149, 65535 * 0.00341802 + 149],
+		rtol=1e-6,
+	)
+	assert kelvin[2] == pytest.approx(299.39288, rel=1e-6)
+
+	celsius = surface_temperature(lwir, valid=np.array([True, True, True, False]))
+	assert celsius[2] == pytest.approx(299.39288 - 273.15, rel=1e-5)
+	assert np.isnan(celsius[3])
+
+
+def test_mask_landsat_block():
+	qa_pixel = np.array([[CLEAR_LAND, HIGH_CLOUD], [CLEAR_LAND, CLEAR_LAND]])
+	qa_radsat = np.array([[0, 0], [RADSAT_LWIR11, RADSAT_NIR]], dtype=np.uint16)
+	lwir = np.full((2, 2), 44000, dtype=np.uint16)
+	ndvi = np.full((2, 2), 0.5, dtype=np.float32)
+
+	result = mask_landsat_block(qa_pixel, qa_radsat, lwir, ndvi, celsius=False)
+
+	np.testing.assert_array_equal(result["clear"], [[True, False], [True, True]])
+	assert result["clear_fraction"] == 0.75
+	# Saturação térmica descarta só a LST; do NIR, só o NDVI
+	np.testing.assert_array_equal(
+		np.isfinite(result["lst"]), [[True, False], [False, True]]
+	)
+	np.testing.assert_array_equal(
+		np.isfinite(result["ndvi"]), [[True, False], [True, False]]
+	)
+	assert result["lst"][0, 0] == pytest.approx(299.39288, rel=1e-6)
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.services.stac_pairing import LANDSAT_WINDOW, pair_scenes
+
+
+def scene(item_id: str, day: datetime) -> dict:
+	return {"item_id": item_id, "datetime": day}
+
+
+def ids(items: list[dict]) -> list[str]:
+	return [item["item_id"] for item in items]
+
+
+def test_composite_without_earlier_landsat():
+	sentinel = [scene("s1", datetime(2024, 1, 1))]
+	landsat = [scene("l1", datetime(2024, 1, 5))]
+
+	pairs = list(pair_scenes(sentinel, landsat))
+
+	assert [pair.sentinel["item_id"] for pair in pairs] == ["s1"]
+	assert pairs[0].landsat == []
+
+
+def test_several_landsat_scenes_in_one_window():
+	sentinel = [scene("s1", datetime(2024, 1, 17)), scene("s2", datetime(2024, 2, 2))]
+	landsat = [
+		scene("l0", datetime(2023, 12, 20)),
+		scene("l1", datetime(2024, 1, 3)),
+		scene("l2", datetime(2024, 1, 10)),
+		scene("l3", datetime(2024, 1, 26)),
+	]
+
+	pairs = list(pair_scenes(sentinel, landsat))
+
+	assert ids(pairs[0].landsat) == ["l1", "l2"]
+	assert ids(pairs[1].landsat) == ["l3"]
+
+
+def test_window_boundaries_are_inclusive():
+	composite = datetime(2024, 1, 17)
+	sentinel = [scene("s1", composite)]
+	landsat = [
+		scene("before", composite - LANDSAT_WINDOW - timedelta(seconds=1)),
+		scene("start", composite - LANDSAT_WINDOW),
+		scene("same", composite),
+		scene("after", composite + timedelta(seconds=1)),
+	]
+
+	pairs = list(pair_scenes(sentinel, landsat))
+
+	assert ids(pairs[0].landsat) == ["start", "same"]
+
+
+def test_scene_shared_by_composites_with_equal_timestamps():
+	day = datetime(2024, 1, 17)
+	sentinel = [scene("tile_a", day), scene("tile_b", day)]
+	landsat = [scene("l1", day - timedelta(days=2))]
+
+	pairs = list(pair_scenes(sentinel, landsat))
+
+	assert [ids(pair.landsat) for pair in pairs] == [["l1"], ["l1"]]
+
+
+def test_unsorted_sentinel_is_rejected():
+	sentinel = [scene("s2", datetime(2024, 2, 2)), scene("s1", datetime(2024, 1, 17))]
+
+	with pytest.raises(ValueError, match="Sentinel"):
+		list(pair_scenes(sentinel, []))
+
+
+def test_unsorted_landsat_is_rejected():
+	sentinel = [scene("s1", datetime(2024, 1, 17))]
+	landsat = [scene("l2", datetime(2024, 1, 10)), scene("l1", datetime(2024, 1, 3))]
+
+	with pytest.raises(ValueError, match="Landsat"):
+		list(pair_scenes(sentinel, landsat))
@@ -0,0 +1,174 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+import rasterio.shutil
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from shapely.geometry import box
+
+from src.services.stac_raster import (
+	NDVI_RANGE,
+	ZonalHistogram,
+	band_scaling,
+	check_range,
+	iter_chunks,
+	zonal_statistics,
+)
+
+SIZE = 64
+RES = 0.001
+WEST, NORTH = -44.5, -21.0
+BBOX = (WEST, NORTH - SIZE * RES, WEST + SIZE * RES, NORTH)
+NODATA = -9999
+
+
+def ndvi_values() -> np.ndarray:
+	rng = np.random.default_rng(0)
+	data = rng.integers(-2000, 9000, (SIZE, SIZE)).astype("int16")
+	data[:4, :4] = NODATA
+	return data
+
+
+def write_cog(path, data: np.ndarray, scale: float | None = None) -> str:
+	"""Writes a tiny tiled COG in WGS 84, optionally with a scale tag."""
+	profile = {
+		"driver": "GTiff",
+		"width": SIZE,
+		"height": SIZE,
+		"count": 1,
+		"dtype": "int16",
+		"crs": "EPSG:4326",
+		"transform": from_origin(WEST, NORTH, RES, RES),
+		"nodata": NODATA,
+	}
+	with rasterio.MemoryFile() as memfile:
+		with memfile.open(**profile) as dataset:
+			dataset.write(data, 1)
+			if scale is not None:
+				dataset.scales = (scale,)
+		with memfile.open() as source:
+			rasterio.shutil.copy(source, str(path), driver="COG", blocksize=16)
+	return str(path)
+
+
+@pytest.fixture
+def zones() -> gpd.GeoDataFrame:
+	# Metades oeste e leste, alinhadas às bordas dos pixels
+	middle = WEST + SIZE // 2 * RES
+	return gpd.GeoDataFrame(
+		{"CD_MUN": ["west", "east"]},
+		geometry=[
+			box(WEST, BBOX[1], middle, NORTH),
+			box(middle, BBOX[1], BBOX[2], NORTH),
+		],
+		crs="EPSG:4326",
+	)
+
+
+def expected_stats(data: np.ndarray, scale: float) -> dict[str, dict[str, float]]:
+	stats = {}
+	for name, half in (("west", data[:, : SIZE // 2]), ("east", data[:, SIZE // 2 :])):
+		values = half[half != NODATA] * scale
+		stats[name] = {
+			"count": values.size,
+			"mean": values.mean(),
+			"median": np.median(values),
+		}
+	return stats
+
+
+def test_iter_chunks_covers_window_once():
+	window = Window(5, 3, 50, 40)
+	chunks = list(iter_chunks(window, (16, 16), chunk_size=32))
+
+	covered = np.zeros((SIZE, SIZE), dtype=int)
+	for chunk in chunks:
+		rows, cols = chunk.toslices()
+		covered[rows, cols] += 1
+		# Cada parte fica dentro de uma célula de 32 pixels (blocos inteiros)
+		assert chunk.row_off // 32 == (chunk.row_off + chunk.height - 1) // 32
+		assert chunk.col_off // 32 == (chunk.col_off + chunk.width - 1) // 32
+
+	expected = np.zeros_like(covered)
+	expected[window.toslices()] = 1
+	np.testing.assert_array_equal(covered, expected)
+
+
+def test_zonal_histogram_matches_numpy():
+	rng = np.random.default_rng(1)
+	labels = rng.integers(-1, 3, 1000)
+	values = rng.uniform(-1, 1, 1000)
+	values[::7] = np.nan
+
+	histogram = ZonalHistogram(["a", "b", "c"])
+	histogram.add(labels[:500], values[:500])
+	histogram.add(labels[500:], values[500:])
+	summary = histogram.summary()
+
+	for i, name in enumerate(["a", "b", "c"]):
+		zone = values[(labels == i) & np.isfinite(values)]
+		assert summary[name]["count"] == zone.size
+		assert summary[name]["mean"] == pytest.approx(zone.mean())
+		assert summary[name]["median"] == pytest.approx(np.median(zone), abs=0.002)
+
+
+def test_zonal_statistics_matches_numpy(tmp_path, zones):
+	data = ndvi_values()
+	href = write_cog(tmp_path / "ndvi.tif", data, scale=0.0001)
+
+	result = zonal_statistics(href, zones, BBOX, chunk_size=16)
+
+	assert result["pixels"] == SIZE * SIZE
+	for name, expected in expected_stats(data, 0.0001).items():
+		zone = result["zones"][name]
+		assert zone["count"] == expected["count"]
+		assert zone["mean"] == pytest.approx(expected["mean"])
+		assert zone["median"] == pytest.approx(expected["median"], abs=0.002)
+
+
+def test_zonal_statistics_scales_from_raster_bands(tmp_path, zones):
+	data = ndvi_values()
+	href = write_cog(tmp_path / "ndvi.tif", data)
+
+	raster_bands = [{"scale": 0.0001, "offset": 0.0, "nodata": NODATA}]
+	result = zonal_statistics(href, zones, BBOX, raster_bands=raster_bands)
+
+	expected = expected_stats(data, 0.0001)
+	assert result["zones"]["west"]["mean"] == pytest.approx(expected["west"]["mean"])
+
+
+def test_zonal_statistics_rejects_unscaled_ndvi(tmp_path, zones):
+	href = write_cog(tmp_path / "ndvi.tif", ndvi_values())
+
+	with pytest.raises(ValueError, match="scale/offset"):
+		zonal_statistics(href, zones, BBOX)
+
+
+def test_write_cog_fixture_is_tiled(tmp_path):
+	with rasterio.open(write_cog(tmp_path / "ndvi.tif", ndvi_values())) as dataset:
+		assert dataset.block_shapes[0] == (16, 16)
+		assert dataset.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+
+
+def test_band_scaling(tmp_path):
+	raster_bands = [{"scale": 0.0001, "offset": 0.5}]
+
+	with rasterio.open(write_cog(tmp_path / "raw.tif", ndvi_values())) as dataset:
+		assert band_scaling(dataset) == (1.0, 0.0)
+		assert band_scaling(dataset, raster_bands) == (0.0001, 0.5)
+		assert band_scaling(dataset, [{"nodata": NODATA}]) == (1.0, 0.0)
+
+	tagged = write_cog(tmp_path / "tagged.tif", ndvi_values(), scale=0.001)
+	with rasterio.open(tagged) as dataset:
+		# As tags do GeoTIFF prevalecem sobre o STAC
+		assert band_scaling(dataset, raster_bands) == (0.001, 0.0)
+
+
+def test_check_range():
+	values = np.array([-0.2, 0.5, 1.0, np.nan])
+	check_range(values, NDVI_RANGE, "ok.tif")
+	check_range(values * 10000, None, "unchecked.tif")
+
+	with pytest.raises(ValueError, match="raw.tif"):
+		check_range(values * 10000, NDVI_RANGE, "raw.tif")
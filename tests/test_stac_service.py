@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from src.services.stac_service import search_start
+
+START = datetime(2024, 1, 1)
+END = datetime(2024, 6, 30, 23, 59, 59)
+
+
+def test_search_start_resumes_inside_window():
+	latest = datetime(2024, 3, 15)
+	assert search_start(START, END, latest) == latest
+
+
+def test_search_start_backfill_searches_whole_window():
+	# Janela inteiramente anterior ao item mais recente do catálogo
+	latest = datetime(2025, 2, 1)
+	assert search_start(START, END, latest) == START
+
+
+def test_search_start_window_after_latest():
+	latest = datetime(2023, 12, 1)
+	assert search_start(START, END, latest) == START
+
+
+def test_search_start_empty_catalog_or_full_sync():
+	assert search_start(START, END, None) == START
+	assert search_start(START, END, datetime(2024, 3, 15), incremental=False) == START
+
+
+def test_search_start_skips_inverted_window():
+	assert search_start(END, START, datetime(2024, 3, 15)) is None